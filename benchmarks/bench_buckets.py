@@ -0,0 +1,103 @@
+# benchmarks/bench_buckets.py
+"""
+Compara o layout de jobs do scheduler: um job por lembrete x um job por minuto.
+
+    python benchmarks/bench_buckets.py --consultas 50000
+    python benchmarks/bench_buckets.py --consultas 20000 --sqlite
+
+Mede, para cada modo, o tempo para montar a agenda, o pico de memória
+(tracemalloc), a quantidade de jobs, quantos jobs disparam no minuto mais
+cheio e quanto custa cada acordada do APScheduler (buscar vencidos + próximo
+horário no job store).
+"""
+import os, sys, time, random, argparse, tempfile, tracemalloc
+from pathlib import Path
+from datetime import datetime, timedelta
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+os.environ.setdefault("SCHEDULER_CATCHUP", "ultimo")
+
+import logging
+import scheduler as sch
+from collections import Counter
+from apscheduler.schedulers.background import BackgroundScheduler
+
+def gerar_consultas(n, dias=30, seed=42):
+    """consultas sintéticas em horários cheios e meias horas, como nas clínicas."""
+    rnd = random.Random(seed)
+    inicio = (datetime.now() + timedelta(days=3)).replace(hour=0, minute=0, second=0, microsecond=0)
+    consultas = []
+    for i in range(n):
+        dt = inicio + timedelta(days=rnd.randrange(dias), hours=rnd.randrange(7, 19), minutes=rnd.choice((0, 30)))
+        consultas.append({
+            "nome": f"Paciente {i}",
+            "telefone": f"55119{i:08d}",
+            "responsavel": f"55139{i:08d}" if i % 3 == 0 else None,
+            "data": dt.strftime("%d/%m/%Y"),
+            "hora": dt.strftime("%H:%M"),
+            "link": "https://hcclinicas.org/teleconsulta/demo",
+        })
+    return consultas
+
+def criar(sqlite_dir):
+    if sqlite_dir is None:
+        return BackgroundScheduler()
+    from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+    url = f"sqlite:///{Path(sqlite_dir) / f'jobs_{time.monotonic_ns()}.db'}"
+    return BackgroundScheduler(jobstores={"default": SQLAlchemyJobStore(url=url)})
+
+def medir(modo, consultas, sqlite_dir):
+    scheduler = criar(sqlite_dir)
+    scheduler.start(paused=True)
+    if modo == "bucket":
+        agenda = sch.AgendaPorBucket(scheduler)
+    else:
+        agenda = sch.AgendaPorJob(scheduler, "scheduler:enfileirar_envio")
+
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    lembretes = [l for p in consultas for l in sch.planejar_consulta(p)]
+    agenda.agendar(lembretes, datetime.now())
+    montar = time.perf_counter() - t0
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    jobs = scheduler.get_jobs()
+    # minuto mais cheio: quantos jobs o APScheduler dispara de uma vez
+    _, jobs_pico = Counter(j.next_run_time for j in jobs).most_common(1)[0]
+
+    # o que o APScheduler faz a cada acordada: buscar vencidos e o próximo horário
+    store = scheduler._lookup_jobstore("default")
+    primeiro = jobs[0].next_run_time
+    t0 = time.perf_counter()
+    store.get_due_jobs(primeiro)
+    store.get_next_run_time()
+    busca = time.perf_counter() - t0
+
+    scheduler.shutdown(wait=False)
+    return {
+        "modo": modo,
+        "lembretes": len(lembretes),
+        "jobs": len(jobs),
+        "montar_s": montar,
+        "pico_mb": pico / 1e6,
+        "jobs_pico": jobs_pico,
+        "busca_ms": busca * 1000,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--consultas", type=int, default=20000)
+    parser.add_argument("--sqlite", action="store_true", help="usa o job store SQLAlchemy/SQLite em vez da memória")
+    args = parser.parse_args()
+
+    sch.logger.setLevel(logging.WARNING)  # sem uma linha de log por job
+    consultas = gerar_consultas(args.consultas)
+    with tempfile.TemporaryDirectory() as tmp:
+        resultados = [medir(modo, consultas, tmp if args.sqlite else None) for modo in ("por_job", "bucket")]
+
+    print(f"{'modo':<8} {'lembretes':>10} {'jobs':>8} {'montar (s)':>11} {'memória (MB)':>13} "
+          f"{'jobs/min pico':>14} {'acordada (ms)':>14}")
+    for r in resultados:
+        print(f"{r['modo']:<8} {r['lembretes']:>10} {r['jobs']:>8} {r['montar_s']:>11.2f} {r['pico_mb']:>13.1f} "
+              f"{r['jobs_pico']:>14} {r['busca_ms']:>14.2f}")
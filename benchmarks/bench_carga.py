@@ -0,0 +1,93 @@
+# benchmarks/bench_carga.py
+"""
+Importação de pacientes: json.loads do arquivo inteiro x leitura em streaming (src/carga.py).
+
+    python benchmarks/bench_carga.py --tamanhos 10000,100000,300000
+
+Para cada tamanho gera o arquivo (JSON array, JSON lines e CSV, com 1% de
+linhas inválidas) e importa num SQLite novo duas vezes: uma para o tempo e
+outra sob tracemalloc, para o pico de memória alocada (o tracemalloc deixa
+tudo mais lento). No streaming o pico não cresce com o arquivo.
+"""
+import os, sys, csv, json, time, random, argparse, tempfile, tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+os.environ.setdefault("LOG_DIR", str(Path(tempfile.gettempdir()) / "bench_carga_logs"))
+
+import logging
+from carga import Relatorio
+from storage import SQLiteStorage, importar_arquivo
+
+CAMPOS = ("nome", "telefone", "responsavel", "responsavel_ativo", "data", "hora", "link")
+
+def gerar(n, seed=42):
+    rnd = random.Random(seed)
+    for i in range(n):
+        yield {
+            "nome": f"Paciente {i}",
+            "telefone": f"55119{i:08d}",
+            "responsavel": f"55139{i:08d}" if i % 3 == 0 else None,
+            "responsavel_ativo": True,
+            # 1% com data impossível: o import relata e segue
+            "data": "31/02/2030" if i % 100 == 99 else f"{rnd.randrange(1, 29):02d}/{rnd.randrange(1, 13):02d}/2030",
+            "hora": f"{rnd.randrange(7, 19):02d}:{rnd.choice((0, 30)):02d}",
+            "link": "https://hcclinicas.org/teleconsulta/demo",
+        }
+
+def escrever(n, pasta: Path):
+    arquivos = {"json": pasta / f"p{n}.json", "jsonl": pasta / f"p{n}.jsonl", "csv": pasta / f"p{n}.csv"}
+    with open(arquivos["json"], "w", encoding="utf-8") as fj, open(arquivos["jsonl"], "w", encoding="utf-8") as fl, \
+            open(arquivos["csv"], "w", encoding="utf-8", newline="") as fc:
+        escritor = csv.DictWriter(fc, CAMPOS)
+        escritor.writeheader()
+        fj.write("[\n")
+        for i, r in enumerate(gerar(n)):
+            linha = json.dumps(r, ensure_ascii=False)
+            fj.write(("," if i else "") + linha + "\n")
+            fl.write(linha + "\n")
+            escritor.writerow(r)
+        fj.write("]\n")
+    return arquivos
+
+def medir(func, pasta: Path):
+    """(importados, segundos, pico MB) de func(storage), cada rodada num banco novo."""
+    t0 = time.perf_counter()
+    n = func(SQLiteStorage(Path(tempfile.mkdtemp(dir=pasta)) / "t.db"))
+    dt = time.perf_counter() - t0
+    tracemalloc.start()
+    func(SQLiteStorage(Path(tempfile.mkdtemp(dir=pasta)) / "m.db"))
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return n, dt, pico / 1024 / 1024
+
+def importar_inteiro(path: Path, storage: SQLiteStorage) -> int:
+    """como era antes: o array inteiro em memória e um strptime que derruba tudo."""
+    from formatacao import parse_data_hora
+    validos = []
+    for p in json.loads(path.read_text(encoding="utf-8")):
+        try:
+            parse_data_hora(p["data"], p["hora"])
+        except ValueError:
+            continue
+        validos.append(p)
+    return storage.importar(validos)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pico de memória da importação de pacientes.")
+    parser.add_argument("--tamanhos", default="10000,100000")
+    args = parser.parse_args()
+    logging.getLogger("scheduler.carga").disabled = True  # 1% de avisos não entra na medida
+
+    print(f"{'registros':>10} {'modo':<16} {'importados':>10} {'tempo s':>8} {'pico MB':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        for n in (int(t) for t in args.tamanhos.split(",")):
+            arquivos = escrever(n, tmp)
+            casos = [("json.loads", lambda st: importar_inteiro(arquivos["json"], st))]
+            for formato, path in arquivos.items():
+                casos.append((f"streaming {formato}",
+                              lambda st, path=path: importar_arquivo(st, path, relatorio=Relatorio())))
+            for nome, func in casos:
+                importados, dt, pico = medir(func, tmp)
+                print(f"{n:>10} {nome:<16} {importados:>10} {dt:>8.2f} {pico:>8.1f}", flush=True)
@@ -0,0 +1,221 @@
+# benchmarks/bench_e2e.py
+"""
+Ponta a ponta sem Meta: scheduler.py e webhook de verdade contra a Graph simulada.
+
+    python benchmarks/bench_e2e.py --pacientes 2000
+    python benchmarks/bench_e2e.py --pacientes 5000 --mps 0 --graph-mps 200 --taxa-erro 0.05
+    python benchmarks/bench_e2e.py --pacientes 2000 --modo bucket --webhook asgi --minutos 3
+    python benchmarks/bench_e2e.py --pacientes 4000 --nos 3 --mps 40 --derrubar 20
+
+Gera N pacientes sintéticos num SQLite temporário, com as consultas marcadas
+para que um lembrete de cada uma vença no(s) próximo(s) minuto(s) cheio(s).
+Sobe a Graph simulada (benchmarks/graph_stub.py), o webhook, que recebe de
+volta os statuses de cada mensagem, e o scheduler.py em subprocessos. Mede:
+- tempo do plano, vazão dos envios e latência do horário marcado até a Graph
+  aceitar (p50/p95/p99)
+- 500/429 devolvidos pela Graph e callbacks de status entregues ao webhook
+- o que chegou em envios_status e o pico de memória (RSS) de cada processo
+Com `--nos N` sobem N schedulers em cluster (SCHEDULER_SHARDS) dividindo as
+consultas; `--derrubar S` mata um deles com SIGKILL S segundos depois do
+primeiro disparo para ver os outros assumirem. `duplicadas` conta mensagens
+aceitas mais de uma vez para o mesmo destinatário e template.
+"""
+import os, sys, json, time, signal, sqlite3, argparse, tempfile, subprocess
+from pathlib import Path
+from datetime import datetime, timedelta
+
+SRC = Path(__file__).resolve().parent.parent / "src"
+sys.path.insert(0, str(SRC))
+os.environ.setdefault("LOG_DIR", str(Path(tempfile.gettempdir()) / "bench_e2e_logs"))
+
+from graph_stub import GraphStub
+from bench_webhook import percentil, porta_livre, subir
+from scheduler import ANTECEDENCIAS
+from storage import SQLiteStorage
+
+def gerar_pacientes(n: int, inicio: datetime, minutos: int):
+    """
+    consulta i: o lembrete ANTECEDENCIAS[i % 4] vence em `inicio` + (i // 4) % `minutos` min;
+    os lembretes anteriores dela já passaram e os seguintes ficam para depois.
+    Devolve os pacientes e {telefone: epoch em que a mensagem deveria sair}.
+    """
+    pacientes, vencimentos = [], {}
+    for i in range(n):
+        _, delta = ANTECEDENCIAS[i % len(ANTECEDENCIAS)]
+        run_at = inicio + timedelta(minutes=(i // len(ANTECEDENCIAS)) % minutos)
+        consulta = run_at + delta
+        telefone = f"55119{i:08d}"
+        responsavel = f"55139{i:08d}" if i % 3 == 0 else None
+        pacientes.append({
+            "nome": f"Paciente {i}", "telefone": telefone, "responsavel": responsavel,
+            "data": consulta.strftime("%d/%m/%Y"), "hora": consulta.strftime("%H:%M"),
+            "link": "https://hcclinicas.org/teleconsulta/demo",
+        })
+        vencimentos[telefone] = run_at.timestamp()
+        if responsavel:
+            vencimentos[responsavel] = run_at.timestamp()
+    return pacientes, vencimentos
+
+def pico_rss_mb(proc: subprocess.Popen):
+    """VmHWM do processo (Linux); None se não der para ler."""
+    try:
+        for linha in Path(f"/proc/{proc.pid}/status").read_text().splitlines():
+            if linha.startswith("VmHWM:"):
+                return int(linha.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+def plano_pronto(logs: Path):
+    """horário (epoch) do último 'Plano pronto' no log JSON do scheduler (com --nos, o do nó mais lento)."""
+    pronto = None
+    try:
+        for linha in (logs / "scheduler.log").read_text(encoding="utf-8").splitlines():
+            if "Plano pronto" in linha:
+                pronto = datetime.fromisoformat(json.loads(linha)["ts"]).timestamp()
+    except (OSError, ValueError):
+        pass
+    return pronto
+
+def encerrar(proc: subprocess.Popen) -> None:
+    proc.terminate()
+    try:
+        proc.wait(15)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+def rodar(args, tmp: Path) -> dict:
+    logs = tmp / "logs"
+    comum = {
+        "PYTHONPATH": str(SRC), "WHATSAPP_TOKEN": "bench", "PHONE_NUMBER_ID": "123",
+        "STORAGE_DB": str(tmp / "storage.db"), "STATUS_DB": str(tmp / "status.db"),
+        "LOG_DIR": str(logs), "LOG_TERMINAL": "0",
+    }
+
+    porta_webhook = porta_livre()
+    webhook_url = f"http://127.0.0.1:{porta_webhook}/webhook" if args.webhook != "nenhum" else None
+    stub = GraphStub(latencia=args.latencia, jitter=args.jitter, taxa_erro=args.taxa_erro, mps=args.graph_mps,
+                     webhook=webhook_url, atraso_status=args.atraso_status, taxa_falha=args.taxa_falha,
+                     seed=42).start()
+    comum["WHATSAPP_GRAPH_URL"] = stub.url
+
+    agora = datetime.now()
+    inicio = (agora + timedelta(seconds=args.preparo + 59)).replace(second=0, microsecond=0)
+    pacientes, vencimentos = gerar_pacientes(args.pacientes, inicio, args.minutos)
+    SQLiteStorage(tmp / "storage.db").importar(pacientes)
+
+    processos = {}
+    try:
+        if webhook_url:
+            processos["webhook"] = subir(args.webhook, porta_webhook, 1, stub.url, tmp, **comum)
+        t_sub = time.time()
+        for i in range(args.nos):
+            nome = "scheduler" if args.nos == 1 else f"scheduler-{i}"
+            cluster = {} if args.nos == 1 else {
+                "SCHEDULER_SHARDS": str(args.shards), "SCHEDULER_NO": nome, "SCHEDULER_LEASE_S": str(args.lease),
+                "SCHEDULER_CLUSTER_DB": str(tmp / "cluster.db")}
+            processos[nome] = subprocess.Popen(
+                [sys.executable, "-c", "import scheduler; scheduler.run()"], cwd=tmp,
+                env={**os.environ, **comum, **cluster,
+                     "FILA_DB": str(tmp / "fila.db"), "SCHEDULER_JOBS_DB": str(tmp / f"jobs_{i}.db"),
+                     "SCHEDULER_JOBSTORE": args.jobstore, "SCHEDULER_MODO": args.modo,
+                     "SCHEDULER_RECONCILIAR_S": "0", "FILA_ENVIOS": "0" if args.sem_fila else "1",
+                     "WHATSAPP_MPS": str(args.mps), "FILA_BACKOFF_BASE": "1"},
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        print(f"{len(pacientes)} consultas, {len(vencimentos)} mensagens a partir de {inicio:%H:%M:%S} "
+              f"em {args.minutos} min" + (f" | {args.nos} nós, {args.shards} shards" if args.nos > 1 else ""),
+              flush=True)
+
+        derrubado = None
+        prazo = inicio.timestamp() + args.minutos * 60 + args.espera_max
+        while time.time() < prazo:
+            aceitas = {to for _, to, _ in list(stub.entregas) if to in vencimentos}
+            pendentes = stub.callbacks.pendentes() if stub.callbacks else 0
+            if len(aceitas) >= len(vencimentos) and pendentes == 0:
+                break
+            if args.derrubar is not None and derrubado is None and time.time() >= inicio.timestamp() + args.derrubar:
+                derrubado = "scheduler" if args.nos == 1 else "scheduler-0"
+                processos[derrubado].send_signal(signal.SIGKILL)
+                print(f"{derrubado} derrubado (SIGKILL) com {len(aceitas)}/{len(vencimentos)} aceitas", flush=True)
+            vivos = [p for nome, p in processos.items() if nome.startswith("scheduler") and nome != derrubado]
+            if all(p.poll() is not None for p in vivos):
+                print("scheduler.py saiu antes do fim")
+                break
+            time.sleep(0.2)
+        time.sleep(1.5)  # o webhook grava os statuses em lote a cada 1s
+        memoria = {nome: pico_rss_mb(p) for nome, p in processos.items() if nome != derrubado}
+    finally:
+        for p in processos.values():
+            encerrar(p)
+        stub.shutdown()
+
+    primeira, duplicadas, vistas = {}, 0, set()
+    for quando, to, template in stub.entregas:
+        if to not in vencimentos:
+            continue
+        if (to, template) in vistas:
+            duplicadas += 1
+        vistas.add((to, template))
+        primeira.setdefault(to, quando)
+    lat = sorted(quando - vencimentos[to] for to, quando in primeira.items())
+    tempos = sorted(primeira.values())
+    r = {
+        "plano s": (plano_pronto(logs) or float("nan")) - t_sub,
+        "folga s": inicio.timestamp() - (plano_pronto(logs) or float("nan")),
+        "esperadas": len(vencimentos),
+        "entregues": len(primeira),
+        "duplicadas": duplicadas,
+        "graph": stub.stats(),
+        "memoria": memoria,
+    }
+    if lat:
+        r["vazao"] = len(tempos) / max(tempos[-1] - tempos[0], 1e-9)
+        r["lat"] = {p: percentil(lat, p) for p in (0.50, 0.95, 0.99, 1.0)}
+    if stub.callbacks and stub.callbacks.latencias:
+        cb = sorted(stub.callbacks.latencias)
+        r["callback ms"] = {p: percentil(cb, p) * 1000 for p in (0.50, 0.99)}
+    if (tmp / "status.db").exists():
+        with sqlite3.connect(tmp / "status.db") as conn:
+            r["envios_status"] = dict(conn.execute("SELECT status, COUNT(*) FROM envios_status GROUP BY status"))
+    return r
+
+def imprimir(r: dict) -> None:
+    print(f"plano: {r['plano s']:.1f}s (folga de {r['folga s']:.1f}s até o primeiro disparo)")
+    print(f"mensagens: {r['entregues']}/{r['esperadas']} aceitas pela Graph, {r['duplicadas']} duplicadas | {r['graph']}")
+    if "lat" in r:
+        lat = " ".join(f"p{int(p * 100)}={v:.2f}s" for p, v in r["lat"].items())
+        print(f"vazão: {r['vazao']:.0f} msg/s | horário marcado -> Graph: {lat}")
+    if "callback ms" in r:
+        print("POST de status no webhook: " + " ".join(f"p{int(p * 100)}={v:.1f}ms" for p, v in r["callback ms"].items()))
+    if "envios_status" in r:
+        print(f"envios_status: {r['envios_status']}")
+    print("pico de memória: " + " | ".join(f"{nome} {mb:.0f} MB" if mb else f"{nome} -" for nome, mb in r["memoria"].items()))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scheduler + webhook ponta a ponta contra a Graph simulada.")
+    parser.add_argument("--pacientes", type=int, default=2000)
+    parser.add_argument("--minutos", type=int, default=1, help="minutos cheios em que os lembretes vencem")
+    parser.add_argument("--preparo", type=float, default=None,
+                        help="segundos para importar e planejar antes do primeiro disparo (padrão: pelo tamanho)")
+    parser.add_argument("--modo", default="por_job", choices=("por_job", "bucket"))
+    parser.add_argument("--jobstore", default="sqlite", choices=("sqlite", "memoria"))
+    parser.add_argument("--sem-fila", action="store_true", help="envia direto do job (FILA_ENVIOS=0)")
+    parser.add_argument("--mps", type=float, default=80, help="WHATSAPP_MPS do scheduler (0 = sem limite)")
+    parser.add_argument("--webhook", default="flask", choices=("flask", "asgi", "nenhum"))
+    parser.add_argument("--latencia", type=float, default=0.05, help="latência da Graph simulada (s)")
+    parser.add_argument("--jitter", type=float, default=0.05)
+    parser.add_argument("--taxa-erro", type=float, default=0.0, help="fração de 500 na Graph")
+    parser.add_argument("--graph-mps", type=float, default=0.0, help="ritmo acima do qual a Graph responde 429")
+    parser.add_argument("--taxa-falha", type=float, default=0.01, help="fração de mensagens com status failed")
+    parser.add_argument("--atraso-status", type=float, default=0.5)
+    parser.add_argument("--espera-max", type=float, default=300, help="limite depois do último minuto (s)")
+    parser.add_argument("--nos", type=int, default=1, help="schedulers em cluster (SCHEDULER_SHARDS)")
+    parser.add_argument("--shards", type=int, default=16)
+    parser.add_argument("--lease", type=float, default=6, help="SCHEDULER_LEASE_S dos nós")
+    parser.add_argument("--derrubar", type=float, help="mata um scheduler S segundos depois do primeiro disparo")
+    args = parser.parse_args()
+    if args.preparo is None:
+        args.preparo = 10 + args.pacientes * (0.004 if args.jobstore == "sqlite" else 0.001)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        imprimir(rodar(args, Path(tmp)))
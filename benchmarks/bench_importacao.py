@@ -0,0 +1,122 @@
+# benchmarks/bench_importacao.py
+"""
+Custo de partida a frio dos processos: `python -X importtime -c "import webhook"`.
+
+    python benchmarks/bench_importacao.py
+    python benchmarks/bench_importacao.py --modulos webhook,scheduler --repeticoes 9 --top 10
+    python benchmarks/bench_importacao.py --sem-env --historico importacao.jsonl --limite-ms 300
+
+Cada repetição é um interpretador novo (o cache de disco do SO fica quente).
+Mostra, por módulo, a mediana do import segundo o -X importtime e do processo
+inteiro (`python -c "import m"`, sem o -X), quanto custa cada import direto do
+módulo e quais dependências pesadas (Flask, requests, APScheduler...) já
+entram na importação. Com --historico acrescenta uma linha JSON por execução e
+compara com a anterior; com --limite-ms sai com erro se algum módulo passar
+do limite. --sem-env mede sem .env (o dotenv nem é importado), como nos
+deploys que recebem tudo pelo ambiente.
+"""
+import os, sys, json, time, shutil, argparse, tempfile, statistics, subprocess
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+SRC = Path(__file__).resolve().parent.parent / "src"
+PESADAS = ("flask", "werkzeug", "requests", "urllib3", "httpx", "asyncio", "apscheduler",
+           "sqlalchemy", "dotenv", "uvicorn", "http.server")
+
+def ambiente(tmp: Path, sem_env: bool) -> Dict[str, str]:
+    env = {**os.environ, "PYTHONPATH": str(SRC), "LOG_DIR": str(tmp / "logs"), "LOG_TERMINAL": "0",
+           "STORAGE_DB": str(tmp / "storage.db"), "SCHEDULER_JOBS_DB": str(tmp / "jobs.db")}
+    if sem_env:
+        env["ENV_FILE"] = str(tmp / "sem.env")  # não existe: config.carregar_env() não faz nada
+    return env
+
+def importtime(modulo: str, env: Dict[str, str]) -> Tuple[float, List[Tuple[str, float]]]:
+    """(ms do import do módulo, [(import direto, ms acumulado)]) de um interpretador novo."""
+    r = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {modulo}"],
+                       env=env, capture_output=True, text=True, check=True)
+    total, diretos, pendentes = 0.0, [], []
+    for linha in r.stderr.splitlines():
+        if not linha.startswith("import time:") or "cumulative" in linha:
+            continue
+        _, acumulado, nome = linha.split("|")
+        profundidade = (len(nome) - len(nome.lstrip())) // 2
+        ms = int(acumulado) / 1000
+        if profundidade == 1:
+            pendentes.append((nome.strip(), ms))
+        elif profundidade == 0:
+            if nome.strip() == modulo:
+                total, diretos = ms, pendentes
+            pendentes = []  # os filhos aparecem antes do pai; os de outro pai ficam para trás
+    return total, diretos
+
+def processo(modulo: str, env: Dict[str, str]) -> Tuple[float, List[str]]:
+    """(ms do processo inteiro, dependências pesadas carregadas pelo import)."""
+    codigo = f"import sys, {modulo}; print(','.join(m for m in {PESADAS!r} if m in sys.modules))"
+    t0 = time.perf_counter()
+    r = subprocess.run([sys.executable, "-c", codigo], env=env, capture_output=True, text=True, check=True)
+    return (time.perf_counter() - t0) * 1000, [m for m in r.stdout.strip().split(",") if m]
+
+def medir(modulo: str, env: Dict[str, str], repeticoes: int) -> Dict:
+    imports, processos, diretos = [], [], {}
+    for _ in range(repeticoes):
+        total, filhos = importtime(modulo, env)
+        imports.append(total)
+        for nome, ms in filhos:
+            diretos.setdefault(nome, []).append(ms)
+        ms, pesadas = processo(modulo, env)
+        processos.append(ms)
+    return {
+        "importacao_ms": round(statistics.median(imports), 1),
+        "processo_ms": round(statistics.median(processos), 1),
+        "pesadas": pesadas,
+        "diretos": {n: round(statistics.median(v), 1) for n, v in diretos.items()},
+    }
+
+def ultima_linha(path: Path):
+    if not path.exists():
+        return None
+    linhas = path.read_text(encoding="utf-8").splitlines()
+    return json.loads(linhas[-1]) if linhas else None
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="partida a frio: custo de importar webhook e scheduler.")
+    parser.add_argument("--modulos", default="webhook,webhook_asgi,scheduler")
+    parser.add_argument("--repeticoes", type=int, default=5)
+    parser.add_argument("--top", type=int, default=6, help="imports diretos mais caros por módulo")
+    parser.add_argument("--sem-env", action="store_true", help="sem .env (ENV_FILE inexistente)")
+    parser.add_argument("--historico", default="", help="JSON lines: uma linha por execução, comparada com a anterior")
+    parser.add_argument("--limite-ms", type=float, default=0, help="erro se o import de algum módulo passar disso")
+    args = parser.parse_args()
+
+    tmp = Path(tempfile.mkdtemp(prefix="bench_importacao_"))
+    env = ambiente(tmp, args.sem_env)
+    base = statistics.median(processo("sys", env)[0] for _ in range(args.repeticoes))
+    anterior = ultima_linha(Path(args.historico)) if args.historico else None
+
+    resultados = {}
+    print(f"python sem nada: {base:.1f} ms | {args.repeticoes} repetições, mediana"
+          f"{' | sem .env' if args.sem_env else ''}\n")
+    print(f"{'módulo':<14} {'import ms':>10} {'processo ms':>12} {'antes':>8}  pesadas carregadas")
+    for modulo in filter(None, (m.strip() for m in args.modulos.split(","))):
+        r = resultados[modulo] = medir(modulo, env, args.repeticoes)
+        antes = (anterior or {}).get("modulos", {}).get(modulo, {}).get("importacao_ms")
+        print(f"{modulo:<14} {r['importacao_ms']:>10.1f} {r['processo_ms']:>12.1f} "
+              f"{f'{antes:.1f}' if antes is not None else '-':>8}  {', '.join(r['pesadas']) or '-'}")
+    for modulo, r in resultados.items():
+        print(f"\n{modulo}: imports diretos mais caros (ms, com o que cada um puxou primeiro)")
+        for nome, ms in sorted(r["diretos"].items(), key=lambda x: -x[1])[:args.top]:
+            print(f"  {nome:<36} {ms:>8.1f}")
+
+    if args.historico:
+        linha = {"data": datetime.now().isoformat(timespec="seconds"), "python": sys.version.split()[0],
+                 "sem_env": args.sem_env, "python_ms": round(base, 1),
+                 "modulos": {m: {k: r[k] for k in ("importacao_ms", "processo_ms", "pesadas")}
+                             for m, r in resultados.items()}}
+        with open(args.historico, "a", encoding="utf-8") as f:
+            f.write(json.dumps(linha, ensure_ascii=False) + "\n")
+    shutil.rmtree(tmp, ignore_errors=True)
+    acima = [m for m, r in resultados.items() if args.limite_ms and r["importacao_ms"] > args.limite_ms]
+    if acima:
+        print(f"\n❌ acima de {args.limite_ms:g} ms: {', '.join(acima)}")
+        sys.exit(1)
@@ -0,0 +1,70 @@
+# benchmarks/bench_plano.py
+"""
+Custo de montar o plano (scheduler.montar_plano) por etapa, com o modo de perfil (src/perfil.py).
+
+    python benchmarks/bench_plano.py --pacientes 20000
+    python benchmarks/bench_plano.py --pacientes 20000 --modo bucket --jobstore sqlite
+    python benchmarks/bench_plano.py --pacientes 5000 --dump plano.prof --amostras plano.folded
+
+Gera N pacientes num SQLite temporário (storage e, com --jobstore sqlite, job
+store) e mede leitura, datas, validação dos templates e agendamento. Com
+--dump grava o cProfile do plano (snakeviz plano.prof); com --amostras, as
+pilhas no formato folded (flamegraph.pl plano.folded > plano.svg, ou speedscope).
+"""
+import os, sys, time, argparse, tempfile
+from pathlib import Path
+from datetime import datetime, timedelta
+
+SRC = Path(__file__).resolve().parent.parent / "src"
+sys.path.insert(0, str(SRC))
+
+def gerar_pacientes(n: int):
+    """consultas espalhadas pelos próximos 30 dias, uma a cada 5 min em horário comercial."""
+    inicio = (datetime.now() + timedelta(days=3)).replace(hour=8, minute=0, second=0, microsecond=0)
+    for i in range(n):
+        dia, slot = divmod(i, 120)
+        consulta = inicio + timedelta(days=dia % 30, minutes=5 * slot)
+        yield {
+            "nome": f"Paciente {i}", "telefone": f"55119{i:08d}",
+            "responsavel": f"55139{i:08d}" if i % 3 == 0 else None,
+            "data": consulta.strftime("%d/%m/%Y"), "hora": consulta.strftime("%H:%M"),
+            "link": "https://hcclinicas.org/teleconsulta/demo",
+        }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="custo do plano do scheduler por etapa.")
+    parser.add_argument("--pacientes", type=int, default=10000)
+    parser.add_argument("--modo", choices=("por_job", "bucket"), default="por_job")
+    parser.add_argument("--jobstore", choices=("memoria", "sqlite"), default="memoria")
+    parser.add_argument("--dump", default="", help="cProfile do plano (.prof)")
+    parser.add_argument("--amostras", default="", help="pilhas no formato folded")
+    args = parser.parse_args()
+
+    tmp = Path(tempfile.mkdtemp(prefix="bench_plano_"))
+    os.environ.update({
+        "LOG_DIR": str(tmp), "STORAGE_DB": str(tmp / "storage.db"), "SCHEDULER_JOBS_DB": str(tmp / "jobs.db"),
+        "SCHEDULER_MODO": args.modo, "SCHEDULER_JOBSTORE": args.jobstore, "LOG_TERMINAL": "0",
+    })
+
+    import perfil
+    import scheduler
+    from storage import SQLiteStorage
+
+    storage = SQLiteStorage(tmp / "storage.db")
+    storage.importar(gerar_pacientes(args.pacientes))
+
+    perfil.ligar(args.dump, args.amostras)
+    sched = scheduler.criar_scheduler()
+    sched.start(paused=True)
+    agenda = scheduler.criar_agenda(sched, "scheduler:enviar_para_paciente_e_responsavel")
+    t0 = time.perf_counter()
+    with perfil.perfilar():
+        plano = scheduler.montar_plano(storage, agenda)
+    total = time.perf_counter() - t0
+    sched.shutdown(wait=False)
+
+    print(f"{plano['consultas']} consultas, {plano['novos']} lembretes agendados em {total:.2f}s "
+          f"({plano['consultas'] / total:,.0f} consultas/s) | modo={args.modo} jobstore={args.jobstore}\n")
+    print(perfil.resumo())
+    for arquivo in perfil.encerrar():
+        print(f"\ngravado: {arquivo}")
@@ -0,0 +1,56 @@
+# benchmarks/bench_templates.py
+"""
+Montagem do JSON de cada envio: dict + json.dumps x esqueleto pré-serializado (src/templates.py).
+
+    python benchmarks/bench_templates.py --n 200000
+
+Para cada template do registro confere que os dois caminhos geram o mesmo
+JSON e mede payloads/s de cada um (melhor de `--repeticoes`).
+"""
+import sys, json, time, argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+import templates
+
+LINK = "https://hcclinicas.org/teleconsulta/demo?sala=8f3a"
+PARAMS = {3: ["Maria José da Silva", "15/09/2025, segunda-feira", "14:30"], 2: ["Maria José da Silva", "14:30"]}
+
+def casos(n):
+    for nome, t in templates.REGISTRO.items():
+        params = PARAMS[t.n_params]
+        link = LINK if t.botao_url else None
+        envios = [(f"55119{i:08d}", params, link) for i in range(n)]
+        yield nome, envios
+
+def atual(nome, envios):
+    for to, params, link in envios:
+        json.dumps(templates.montar_payload(nome, to, params, link, "pt_BR"))
+
+def esqueleto(nome, envios):
+    for to, params, link in envios:
+        templates.corpo(nome, to, params, link, "pt_BR")
+
+def medir(func, nome, envios, repeticoes):
+    melhor = float("inf")
+    for _ in range(repeticoes):
+        t0 = time.perf_counter()
+        func(nome, envios)
+        melhor = min(melhor, time.perf_counter() - t0)
+    return len(envios) / melhor
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="payloads/s: json.dumps do dict x esqueleto pré-serializado.")
+    parser.add_argument("--n", type=int, default=100000, help="envios por template")
+    parser.add_argument("--repeticoes", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'template':<20} {'dict+dumps/s':>14} {'esqueleto/s':>14} {'ganho':>7}")
+    for nome, envios in casos(args.n):
+        to, params, link = envios[0]
+        antes = json.dumps(templates.montar_payload(nome, to, params, link, "pt_BR"))
+        assert templates.corpo(nome, to, params, link, "pt_BR") == antes, f"{nome}: JSON diferente"
+        a = medir(atual, nome, envios, args.repeticoes)
+        e = medir(esqueleto, nome, envios, args.repeticoes)
+        print(f"{nome:<20} {a:>14,.0f} {e:>14,.0f} {e / a:>6.1f}x")
@@ -0,0 +1,135 @@
+# benchmarks/bench_webhook.py
+"""
+Teste de carga do webhook: app Flask (webhook.py) x app ASGI (webhook_asgi.py sob uvicorn).
+
+    python benchmarks/bench_webhook.py --posts 2000 --concorrencia 50
+    python benchmarks/bench_webhook.py --modos asgi --processos 4 --latencia 0.2
+
+Sobe um stub da Graph (benchmarks/graph_stub.py), sobe cada servidor num
+subprocesso com banco e logs temporários e dispara POSTs com mensagens de texto
+(cada uma gera uma resposta para a Graph). Mede requisições/s e latência
+p50/p99 do POST e quanto tempo até a última resposta chegar na Graph.
+"""
+import os, sys, json, time, socket, asyncio, argparse, tempfile, subprocess
+from pathlib import Path
+
+import httpx
+from graph_stub import GraphStub
+
+SRC = Path(__file__).resolve().parent.parent / "src"
+
+def porta_livre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def evento(i: int) -> dict:
+    msg = {"from": f"55119{i:08d}", "id": f"wamid.bench.{i}.{time.time_ns()}", "timestamp": str(int(time.time())),
+           "type": "text", "text": {"body": "oi"}}
+    return {"object": "whatsapp_business_account",
+            "entry": [{"id": "0", "changes": [{"field": "messages", "value": {"messages": [msg]}}]}]}
+
+def subir(modo: str, porta: int, processos: int, graph_url: str, tmp: Path, **extra: str) -> subprocess.Popen:
+    """sobe o webhook num subprocesso; `extra` sobrescreve variáveis de ambiente."""
+    env = {**os.environ, "PYTHONPATH": str(SRC), "WHATSAPP_GRAPH_URL": graph_url,
+           "WHATSAPP_TOKEN": "bench", "PHONE_NUMBER_ID": "123", "STORAGE_DB": str(tmp / f"{modo}.db"),
+           "WEBHOOK_FILA_MAX": "100000", **extra}
+    if modo == "flask":
+        cmd = [sys.executable, "-c", f"import webhook; webhook.app.run(port={porta}, threaded=True)"]
+    else:
+        cmd = [sys.executable, "-m", "uvicorn", "webhook_asgi:app", "--port", str(porta),
+               "--workers", str(processos), "--log-level", "warning", "--no-access-log"]
+    proc = subprocess.Popen(cmd, cwd=tmp, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(200):
+        try:
+            httpx.get(f"http://127.0.0.1:{porta}/", timeout=0.5)
+            return proc
+        except httpx.HTTPError:
+            time.sleep(0.05)
+    proc.kill()
+    raise RuntimeError(f"{modo} não subiu na porta {porta}")
+
+async def disparar(porta: int, posts: int, concorrencia: int):
+    """
+    `concorrencia` conexões keep-alive em asyncio puro: o gerador gasta pouca CPU
+    e não vira o gargalo (o httpx sozinho não passa de ~200 req/s num núcleo).
+    """
+    latencias, status = [], {}
+    proximos = iter(range(posts))
+
+    async def conexao():
+        writer = None
+        try:
+            for i in proximos:
+                corpo = json.dumps(evento(i)).encode()
+                t0 = time.perf_counter()
+                if writer is None:
+                    reader, writer = await asyncio.open_connection("127.0.0.1", porta)
+                writer.write(b"POST /webhook HTTP/1.1\r\nHost: bench\r\nContent-Type: application/json\r\n"
+                             b"Content-Length: %d\r\n\r\n%s" % (len(corpo), corpo))
+                cabecalho = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1").lower()
+                linhas = cabecalho.split("\r\n")
+                tamanho = next(int(l.split(":", 1)[1]) for l in linhas if l.startswith("content-length:"))
+                await reader.readexactly(tamanho)
+                latencias.append(time.perf_counter() - t0)
+                codigo = int(linhas[0].split()[1])
+                status[codigo] = status.get(codigo, 0) + 1
+                if "connection: close" in linhas:  # servidor de desenvolvimento do Flask
+                    writer.close()
+                    writer = None
+        finally:
+            if writer is not None:
+                writer.close()
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(conexao() for _ in range(concorrencia)))
+    return time.perf_counter() - t0, sorted(latencias), status
+
+def percentil(valores, p):
+    return valores[min(len(valores) - 1, int(len(valores) * p))]
+
+def medir(modo, args, stub, tmp):
+    porta = porta_livre()
+    proc = subir(modo, porta, args.processos, stub.url, tmp)
+    try:
+        antes = stub.aceitas
+        t0 = time.perf_counter()
+        duracao, lat, status = asyncio.run(disparar(porta, args.posts, args.concorrencia))
+        aceitos = status.get(200, 0)
+        while stub.aceitas - antes < aceitos and time.perf_counter() - t0 < args.espera_max:
+            time.sleep(0.01)
+        drenagem = time.perf_counter() - t0
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(15)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+    return {
+        "modo": modo if modo == "flask" else f"asgi x{args.processos}",
+        "req/s": args.posts / duracao,
+        "p50 ms": percentil(lat, 0.50) * 1000,
+        "p99 ms": percentil(lat, 0.99) * 1000,
+        "status": status,
+        "graph": stub.aceitas - antes,
+        "drenagem s": drenagem,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Carga no webhook Flask x ASGI com Graph local.")
+    parser.add_argument("--posts", type=int, default=2000)
+    parser.add_argument("--concorrencia", type=int, default=50)
+    parser.add_argument("--latencia", type=float, default=0.05, help="latência simulada da Graph (s)")
+    parser.add_argument("--processos", type=int, default=2, help="workers do uvicorn")
+    parser.add_argument("--modos", default="flask,asgi")
+    parser.add_argument("--espera-max", type=float, default=120, help="limite para a Graph receber tudo (s)")
+    args = parser.parse_args()
+
+    stub = GraphStub(latencia=args.latencia).start()
+    print(f"{args.posts} POSTs, concorrência {args.concorrencia}, Graph com {args.latencia * 1000:.0f} ms\n")
+    print(f"{'modo':<10} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'graph':>6} {'drenagem s':>11}  status")
+    with tempfile.TemporaryDirectory() as tmp:
+        for modo in args.modos.split(","):
+            r = medir(modo.strip(), args, stub, Path(tmp))
+            print(f"{r['modo']:<10} {r['req/s']:>8.0f} {r['p50 ms']:>8.1f} {r['p99 ms']:>8.1f} "
+                  f"{r['graph']:>6} {r['drenagem s']:>11.2f}  {r['status']}")
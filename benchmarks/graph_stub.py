@@ -0,0 +1,237 @@
+# benchmarks/graph_stub.py
+"""
+Simulador local do endpoint /{versao}/{phone_id}/messages da Graph API.
+
+    python benchmarks/graph_stub.py --porta 8900 --latencia 0.05
+    python benchmarks/graph_stub.py --latencia 0.1 --jitter 0.1 --taxa-erro 0.02 --mps 80 \\
+        --webhook http://127.0.0.1:5000/webhook
+
+Responde 200 com um wamid falso depois de `latencia` (+ até `jitter`) segundos.
+- `taxa_erro`: fração de POSTs que volta 500 (erro temporário da Graph)
+- `mps`: acima desse ritmo responde 429 com code 130429, como a Cloud API
+- `webhook`: manda os statuses de cada mensagem aceita para o /webhook
+  (sent, delivered e, com `taxa_lido`, read; `taxa_falha` vira sent + failed 131026)
+GET /contagem devolve os contadores.
+"""
+import json, time, heapq, random, argparse, threading, itertools, http.client
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+class GraphStub(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, porta: int = 0, latencia: float = 0.0, jitter: float = 0.0, taxa_erro: float = 0.0,
+                 mps: float = 0.0, webhook: Optional[str] = None, atraso_status: float = 0.5,
+                 taxa_lido: float = 0.5, taxa_falha: float = 0.0, seed: Optional[int] = None):
+        super().__init__(("127.0.0.1", porta), _Handler)
+        self.latencia = latencia
+        self.jitter = jitter
+        self.taxa_erro = taxa_erro
+        self.taxa_lido = taxa_lido
+        self.taxa_falha = taxa_falha
+        self.atraso_status = atraso_status
+        self.mps = mps
+        self._rnd = random.Random(seed)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._tokens = mps
+        self._ultimo = time.monotonic()
+        self.recebidas = 0
+        self.aceitas = 0
+        self.erros = 0
+        self.limitadas = 0
+        self.entregas: List[Tuple[float, str, str]] = []  # (time.time() do aceite, to, template)
+        self.callbacks = _Callbacks(webhook) if webhook else None
+
+    def handle_error(self, request, client_address):
+        pass  # cliente que caiu no meio da resposta (ex.: scheduler derrubado no bench)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def start(self) -> "GraphStub":
+        threading.Thread(target=self.serve_forever, name="graph-stub", daemon=True).start()
+        return self
+
+    def decidir(self) -> Tuple[str, float]:
+        """resultado do POST (ok | erro | limite) e quanto demorar."""
+        with self._lock:
+            self.recebidas += 1
+            espera = self.latencia + (self._rnd.uniform(0, self.jitter) if self.jitter else 0.0)
+            if self.mps > 0:
+                agora = time.monotonic()
+                self._tokens = min(self.mps, self._tokens + (agora - self._ultimo) * self.mps)
+                self._ultimo = agora
+                if self._tokens < 1:
+                    self.limitadas += 1
+                    return "limite", 0.0
+                self._tokens -= 1
+            if self.taxa_erro and self._rnd.random() < self.taxa_erro:
+                self.erros += 1
+                return "erro", espera
+            return "ok", espera
+
+    def aceitar(self, to: str, template: str) -> str:
+        with self._lock:
+            self.aceitas += 1
+            wamid = f"wamid.stub.{next(self._ids)}"
+            agora = time.time()
+            self.entregas.append((agora, to, template))
+            falha = self.taxa_falha and self._rnd.random() < self.taxa_falha
+            lido = not falha and self._rnd.random() < self.taxa_lido
+        if self.callbacks:
+            passo = self.atraso_status
+            etapas = ["sent", "failed"] if falha else ["sent", "delivered"] + (["read"] if lido else [])
+            for i, status in enumerate(etapas, 1):
+                self.callbacks.agendar(agora + passo * i, _status(wamid, status, to, agora + passo * i))
+        return wamid
+
+    def stats(self) -> Dict[str, Any]:
+        s = {"recebidas": self.recebidas, "aceitas": self.aceitas, "erros": self.erros, "limitadas": self.limitadas}
+        if self.callbacks:
+            s.update(self.callbacks.stats())
+        return s
+
+def _status(wamid: str, status: str, to: str, quando: float) -> Dict[str, Any]:
+    st = {"id": wamid, "status": status, "timestamp": str(int(quando)), "recipient_id": to}
+    if status == "failed":
+        st["errors"] = [{"code": 131026, "title": "Message undeliverable"}]
+    return st
+
+def evento_status(statuses: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """POST do webhook no formato da Meta com uma lista de statuses."""
+    return {"object": "whatsapp_business_account",
+            "entry": [{"id": "0", "changes": [{"field": "messages", "value": {
+                "messaging_product": "whatsapp", "statuses": statuses}}]}]}
+
+class _Callbacks:
+    """
+    Fila por horário dos statuses a mandar para o webhook; `threads` conexões
+    keep-alive fazem os POSTs. 503 do webhook (fila cheia) ou erro de conexão
+    volta para a fila em 1s, como a Meta faz.
+    """
+
+    def __init__(self, url: str, threads: int = 4):
+        partes = urlsplit(url)
+        self.host, self.porta, self.path = partes.hostname, partes.port or 80, partes.path or "/"
+        self._heap: List[Tuple[float, int, Dict[str, Any]]] = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._em_voo = 0
+        self.enviados = 0
+        self.reenviados = 0
+        self.falhas = 0
+        self.latencias: List[float] = []
+        for i in range(threads):
+            threading.Thread(target=self._loop, name=f"callbacks-{i}", daemon=True).start()
+
+    def agendar(self, quando: float, status: Dict[str, Any]) -> None:
+        with self._cond:
+            heapq.heappush(self._heap, (quando, next(self._seq), status))
+            self._cond.notify()
+
+    def pendentes(self) -> int:
+        with self._cond:
+            return len(self._heap) + self._em_voo
+
+    def _proximo(self) -> Dict[str, Any]:
+        with self._cond:
+            while True:
+                espera = self._heap[0][0] - time.time() if self._heap else None
+                if espera is not None and espera <= 0:
+                    self._em_voo += 1
+                    return heapq.heappop(self._heap)[2]
+                self._cond.wait(espera)
+
+    def _loop(self) -> None:
+        conn = None
+        while True:
+            status = self._proximo()
+            corpo = json.dumps(evento_status([status])).encode()
+            t0 = time.perf_counter()
+            codigo = None
+            try:
+                if conn is None:
+                    conn = http.client.HTTPConnection(self.host, self.porta, timeout=10)
+                conn.request("POST", self.path, corpo, {"Content-Type": "application/json"})
+                resp = conn.getresponse()
+                resp.read()
+                codigo = resp.status
+                if (resp.getheader("Connection") or "").lower() == "close":
+                    conn.close()
+                    conn = None
+            except (OSError, http.client.HTTPException):
+                if conn is not None:
+                    conn.close()
+                conn = None
+            with self._cond:
+                self._em_voo -= 1
+                if codigo == 200:
+                    self.enviados += 1
+                    self.latencias.append(time.perf_counter() - t0)
+                elif codigo == 503 or codigo is None:  # fila cheia ou conexão keep-alive derrubada
+                    self.reenviados += 1
+                    heapq.heappush(self._heap, (time.time() + 1, next(self._seq), status))
+                    self._cond.notify()
+                else:
+                    self.falhas += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {"callbacks": self.enviados, "callbacks_reenviados": self.reenviados,
+                "callbacks_falhas": self.falhas, "callbacks_pendentes": self.pendentes()}
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, como a Graph
+
+    def do_POST(self):
+        corpo = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        resultado, espera = self.server.decidir()
+        if espera:
+            time.sleep(espera)
+        if resultado == "limite":
+            return self._json(429, {"error": {"message": "(#130429) Rate limit hit", "type": "OAuthException",
+                                              "code": 130429}})
+        if resultado == "erro":
+            return self._json(500, {"error": {"message": "(#131000) Something went wrong", "code": 131000}})
+        try:
+            payload = json.loads(corpo)
+        except ValueError:
+            payload = {}
+        template = (payload.get("template") or {}).get("name") or payload.get("type")
+        wamid = self.server.aceitar(payload.get("to"), template)
+        self._json(200, {"messaging_product": "whatsapp", "messages": [{"id": wamid}]})
+
+    def do_GET(self):
+        self._json(200, self.server.stats())
+
+    def _json(self, status, data):
+        corpo = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, *args):
+        pass
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulador local da Graph API.")
+    parser.add_argument("--porta", type=int, default=8900)
+    parser.add_argument("--latencia", type=float, default=0.05, help="segundos por requisição")
+    parser.add_argument("--jitter", type=float, default=0.0, help="até quantos segundos somar à latência")
+    parser.add_argument("--taxa-erro", type=float, default=0.0, help="fração de respostas 500")
+    parser.add_argument("--mps", type=float, default=0.0, help="mensagens/s antes de responder 429 (0 = sem limite)")
+    parser.add_argument("--webhook", help="URL do /webhook que recebe os statuses")
+    parser.add_argument("--atraso-status", type=float, default=0.5, help="segundos entre um status e o próximo")
+    parser.add_argument("--taxa-lido", type=float, default=0.5)
+    parser.add_argument("--taxa-falha", type=float, default=0.0, help="fração de mensagens que termina em failed")
+    args = parser.parse_args()
+    stub = GraphStub(args.porta, args.latencia, args.jitter, args.taxa_erro, args.mps,
+                     args.webhook, args.atraso_status, args.taxa_lido, args.taxa_falha)
+    print(f"Graph simulada em {stub.url} (latência {args.latencia}s, erro {args.taxa_erro:.0%}, "
+          f"mps {args.mps or 'sem limite'}, webhook {args.webhook or '-'})")
+    stub.serve_forever()
@@ -0,0 +1,55 @@
+# src/agrupamento.py
+# Agrupamento por destinatário dos lembretes que vencem juntos (responsável de
+# vários pacientes, casa de repouso): um envio só no lugar de N quase iguais.
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+# nenhum | responsavel (só mensagens a responsáveis) | destinatario (qualquer número)
+POLITICA  = os.getenv("FILA_AGRUPAR", "nenhum").strip().lower()
+JANELA_S  = float(os.getenv("FILA_AGRUPAR_S", "60"))   # quanto um lembrete agrupável espera pelos outros
+MAX_GRUPO = int(os.getenv("FILA_AGRUPAR_MAX", "10"))   # pacientes por mensagem agrupada
+
+# template aprovado na Meta: {{1}} = quando é a consulta, {{2}} = a lista de pacientes e horários
+TEMPLATE_AGRUPADO = "lembrete_agrupado"
+QUANDO = {"lembrete_48h": "em 2 dias", "lembrete_24h": "amanhã", "lembrete__1h": "em 1 hora"}
+
+Envio = Dict[str, Any]
+
+def agrupavel(envio: Envio, politica: str = POLITICA) -> bool:
+    """
+    o envio pode esperar até JANELA_S e sair junto com outros do mesmo template
+    para o mesmo número (consulta_comecando tem link próprio e não espera).
+    """
+    if politica not in ("responsavel", "destinatario") or envio["template"] not in QUANDO:
+        return False
+    if politica == "responsavel":
+        return (envio.get("paciente") or envio["telefone"]) != envio["telefone"]
+    return True
+
+def agrupar(envios: List[Envio], politica: str = POLITICA, maximo: int = MAX_GRUPO) -> List[List[Envio]]:
+    """envios reservados juntos -> grupos (telefone, template) de até `maximo`, na ordem de chegada."""
+    grupos: List[List[Envio]] = []
+    abertos: Dict[Tuple[str, str], List[Envio]] = {}
+    for envio in envios:
+        if not agrupavel(envio, politica):
+            grupos.append([envio])
+            continue
+        chave = (envio["telefone"], envio["template"])
+        grupo = abertos.get(chave)
+        if grupo is None or len(grupo) >= maximo:
+            grupo = abertos[chave] = []
+            grupos.append(grupo)
+        grupo.append(envio)
+    return grupos
+
+def _linha(params: List[str]) -> str:
+    nome, *quando = params
+    return f"{nome} – {' às '.join(quando)}" if quando else nome
+
+def mensagem(grupo: List[Envio]) -> Tuple[str, str, List[str], Optional[str]]:
+    """(template, telefone, params, link) do que vai para a Graph pelo grupo."""
+    primeiro = grupo[0]
+    linhas = list(dict.fromkeys(_linha(e["params"]) for e in grupo))  # o mesmo lembrete repetido sai uma vez
+    if len(linhas) == 1:
+        return primeiro["template"], primeiro["telefone"], primeiro["params"], primeiro["link"]
+    return TEMPLATE_AGRUPADO, primeiro["telefone"], [QUANDO[primeiro["template"]], "; ".join(linhas)], None
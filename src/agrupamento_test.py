@@ -0,0 +1,57 @@
+# src/agrupamento_test.py
+# Agrupamento por destinatário: quem agrupa, limite por mensagem e o que vai para a Graph.
+#   python -m pytest src/agrupamento_test.py
+import agrupamento
+from agrupamento import agrupar, agrupavel, mensagem, TEMPLATE_AGRUPADO
+from fila import FilaEnvios
+
+RESP = "5511900000009"
+
+def _envio(nome, paciente, telefone=RESP, template="lembrete_24h", hora="09:00"):
+    return {"template": template, "telefone": telefone, "paciente": paciente,
+            "params": [nome, "10/01/2030, quinta-feira", hora], "link": None}
+
+def test_responsavel_de_varios_pacientes_recebe_uma_mensagem():
+    envios = [_envio("Ana", "5511900000001"), _envio("Bia", "5511900000002", hora="09:30")]
+    grupo, = agrupar(envios, "responsavel")
+
+    assert mensagem(grupo) == (TEMPLATE_AGRUPADO, RESP, [
+        "amanhã", "Ana – 10/01/2030, quinta-feira às 09:00; Bia – 10/01/2030, quinta-feira às 09:30"], None)
+
+def test_proprio_paciente_e_comecando_nao_agrupam():
+    proprio = _envio("Caio", RESP)
+    comecando = _envio("Ana", "5511900000001", template="consulta_comecando")
+    assert not agrupavel(proprio, "responsavel") and agrupavel(proprio, "destinatario")
+    assert not agrupavel(comecando, "destinatario")
+    assert not agrupavel(_envio("Ana", "5511900000001"), "nenhum")
+
+    grupos = agrupar([proprio, _envio("Ana", "5511900000001"), comecando, _envio("Bia", "5511900000002")],
+                     "responsavel")
+    assert [[e["params"][0] for e in g] for g in grupos] == [["Caio"], ["Ana", "Bia"], ["Ana"]]
+
+def test_separa_por_template_e_respeita_o_maximo():
+    envios = [_envio(f"P{i}", f"55119000000{i:02d}") for i in range(5)]
+    envios.append(_envio("Ana", "5511900000001", template="lembrete_48h"))
+    grupos = agrupar(envios, "destinatario", maximo=2)
+
+    assert [len(g) for g in grupos] == [2, 2, 1, 1]
+    assert grupos[3][0]["template"] == "lembrete_48h"
+    assert mensagem(grupos[3])[:2] == ("lembrete_48h", RESP)  # sozinho: template original
+
+def test_lembrete_repetido_sai_uma_vez():
+    envio = _envio("Ana", "5511900000001")
+    assert mensagem([envio, dict(envio)]) == ("lembrete_24h", RESP, envio["params"], None)
+
+def test_fila_reserva_os_irmaos_do_mesmo_responsavel(tmp_path):
+    f = FilaEnvios(tmp_path / "fila.db", politica="responsavel", janela=0)
+    f.enfileirar_varios([
+        ["lembrete_24h", RESP, ["Ana", "10/01/2030, quinta-feira", "09:00"], None, None, "c1", "5511900000001"],
+        ["lembrete_24h", RESP, ["Bia", "10/01/2030, quinta-feira", "09:30"], None, None, "c2", "5511900000002"],
+        ["lembrete_24h", "5511900000003", ["Caio", "10/01/2030, quinta-feira", "10:00"], None, None, "c3", None],
+    ])
+    envios = f.reservar(1)  # um vencido puxa o irmão junto, o outro número fica
+    assert sorted(e["params"][0] for e in envios) == ["Ana", "Bia"]
+    assert f.contagem() == {"enviando": 2, "pendente": 1, "mortos": 0}
+
+    grupo, = agrupar(envios, "responsavel", agrupamento.MAX_GRUPO)
+    assert mensagem(grupo)[0] == TEMPLATE_AGRUPADO
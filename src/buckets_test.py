@@ -0,0 +1,57 @@
+# src/buckets_test.py
+# SCHEDULER_MODO=bucket: um job por minuto com os ids que vencem nele (AgendaPorBucket).
+#   python -m pytest src/buckets_test.py
+from datetime import datetime
+
+import pytest
+
+import scheduler
+from scheduler import AgendaPorBucket, planejar_consulta
+
+def _consulta(telefone, hora):
+    return planejar_consulta({"nome": "Ana", "telefone": telefone, "data": "10/01/2030", "hora": hora,
+                              "link": "https://hcclinicas.org/teleconsulta/1"})
+
+@pytest.fixture
+def agenda(monkeypatch):
+    from apscheduler.schedulers.background import BackgroundScheduler
+    monkeypatch.setattr(scheduler, "_suavizador", None)
+    s = BackgroundScheduler()
+    s.start(paused=True)
+    yield AgendaPorBucket(s)
+    s.shutdown(wait=False)
+
+def _buckets(agenda):
+    return {job.id: list(job.args[0]) for job in agenda.scheduler.get_jobs()}
+
+def test_mesmo_minuto_vai_para_o_mesmo_bucket(agenda):
+    ana, bia, caio = _consulta("5511900000001", "09:00"), _consulta("5511900000002", "09:00"), \
+        _consulta("5511900000003", "09:30")
+    assert agenda.agendar(ana + bia + caio, datetime(2030, 1, 1)) == 12
+
+    buckets = _buckets(agenda)
+    assert len(buckets) == 8
+    assert buckets["bucket_2030-01-08T09:00"] == [ana[0]["id"], bia[0]["id"]]
+    assert buckets["bucket_2030-01-10T08:50"] == [ana[3]["id"], bia[3]["id"]]
+    job = agenda.scheduler.get_job("bucket_2030-01-10T09:20")
+    assert list(job.args) == [[caio[3]["id"]]] and job.func_ref == "scheduler:disparar_bucket"
+
+    agenda.agendar(ana, datetime(2030, 1, 1))  # replanejar não duplica o id
+    assert _buckets(agenda) == buckets
+    assert agenda.existentes() == {l["id"]: l["run_at"] for l in ana + bia + caio}
+
+def test_remover_tira_o_id_e_apaga_o_bucket_vazio(agenda):
+    ana, bia = _consulta("5511900000001", "09:00"), _consulta("5511900000002", "09:00")
+    agenda.agendar(ana + bia, datetime(2030, 1, 1))
+
+    agenda.remover([l["id"] for l in ana])
+    buckets = _buckets(agenda)
+    assert len(buckets) == 4 and all(ids == [l["id"]] for ids, l in zip(buckets.values(), bia))
+
+    agenda.remover([l["id"] for l in bia])
+    assert _buckets(agenda) == {}
+
+def test_horario_passado_nao_entra(agenda):
+    ana = _consulta("5511900000001", "09:00")
+    assert agenda.agendar(ana, datetime(2030, 1, 9, 12, 0)) == 2  # 48h e 24h já venceram
+    assert sorted(_buckets(agenda)) == ["bucket_2030-01-10T08:00", "bucket_2030-01-10T08:50"]
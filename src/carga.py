@@ -0,0 +1,193 @@
+# src/carga.py
+# Leitura em streaming de arquivos de pacientes/consultas (JSON array, JSON lines, CSV).
+import io, csv, json, logging
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import formatacao
+
+# filho do logger do scheduler: herda arquivo e terminal dele
+logger = logging.getLogger("scheduler.carga")
+
+FORMATOS = ("json", "jsonl", "csv")
+BLOCO = 64 * 1024  # bytes lidos por vez do JSON array
+
+class RegistroInvalido(ValueError):
+    """registro que não vira consulta (campo faltando, telefone, data ou hora inválidos)."""
+
+class Relatorio:
+    """contagem de lidos/válidos/inválidos e os primeiros `max_erros` motivos, com a posição no arquivo."""
+
+    def __init__(self, max_erros: int = 50):
+        self.max_erros = max_erros
+        self.lidos = 0
+        self.validos = 0
+        self.invalidos = 0
+        self.erros: List[Tuple[str, str]] = []
+
+    def invalido(self, posicao: str, motivo: str) -> None:
+        self.invalidos += 1
+        if len(self.erros) < self.max_erros:
+            self.erros.append((posicao, motivo))
+        logger.warning("Registro inválido ignorado (%s): %s", posicao, motivo)
+
+    def resumo(self) -> str:
+        linhas = [f"{self.lidos} lidos, {self.validos} válidos, {self.invalidos} inválidos"]
+        linhas += [f"  {posicao}: {motivo}" for posicao, motivo in self.erros]
+        if self.invalidos > len(self.erros):
+            linhas.append(f"  ... e mais {self.invalidos - len(self.erros)}")
+        return "\n".join(linhas)
+
+# -------------------- validação --------------------
+VERDADEIRO = {"1", "true", "sim", "s", "yes", "y", "t"}
+FALSO = {"0", "false", "nao", "não", "n", "no", "f", ""}
+
+def _telefone(valor: Any, campo: str) -> str:
+    tel = "".join(c for c in str(valor) if c not in "+-() .")
+    if not tel.isdigit() or not 10 <= len(tel) <= 15:
+        raise RegistroInvalido(f"{campo} inválido: {valor!r}")
+    return tel
+
+def _booleano(valor: Any) -> bool:
+    if isinstance(valor, bool):
+        return valor
+    texto = str(valor).strip().lower()
+    if texto in VERDADEIRO:
+        return True
+    if texto in FALSO:
+        return False
+    raise RegistroInvalido(f"responsavel_ativo inválido: {valor!r}")
+
+def validar(registro: Any) -> Dict[str, Any]:
+    """registro no formato do pacientes.json, normalizado; RegistroInvalido se não der para agendar."""
+    if not isinstance(registro, dict):
+        raise RegistroInvalido(f"esperado objeto, veio {type(registro).__name__}")
+    faltando = [c for c in ("nome", "telefone", "data", "hora") if not str(registro.get(c) or "").strip()]
+    if faltando:
+        raise RegistroInvalido(f"campos obrigatórios vazios: {', '.join(faltando)}")
+
+    data, hora = str(registro["data"]).strip(), str(registro["hora"]).strip()
+    try:
+        formatacao.parse_data_hora(data, hora)  # o mesmo parse do planejamento
+    except ValueError:
+        raise RegistroInvalido(f"data/hora inválida: {data!r} {hora!r}") from None
+
+    responsavel = str(registro.get("responsavel") or "").strip()
+    return {
+        "nome": str(registro["nome"]).strip(),
+        "telefone": _telefone(registro["telefone"], "telefone"),
+        "responsavel": _telefone(responsavel, "responsavel") if responsavel else None,
+        "responsavel_ativo": _booleano(registro.get("responsavel_ativo", True)),
+        "data": data,
+        "hora": hora,
+        "link": str(registro.get("link") or "").strip() or None,
+    }
+
+# -------------------- leitura --------------------
+def _cortado(e: json.JSONDecodeError, buffer: str) -> bool:
+    """
+    o erro é o fim do buffer no meio do registro? String aberta até o fim ou parada
+    nos últimos caracteres (literal, número ou \\uXXXX pela metade).
+    """
+    return e.msg.startswith("Unterminated string") or e.pos >= len(buffer) - 8
+
+def _json_array(arquivo: io.TextIOBase) -> Iterator[Tuple[str, Any]]:
+    """elementos de um JSON array, um a um, lendo o arquivo em blocos."""
+    decoder = json.JSONDecoder()
+    buffer, pos, fim, n = "", 0, False, 0
+
+    def proximo_caractere() -> Optional[str]:
+        nonlocal buffer, pos, fim
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n":
+                pos += 1
+            if pos < len(buffer):
+                return buffer[pos]
+            if fim:
+                return None
+            buffer, pos = arquivo.read(BLOCO), 0
+            fim = not buffer
+
+    if proximo_caractere() != "[":
+        raise ValueError("o arquivo JSON não começa com '['")
+    pos += 1
+    while True:
+        c = proximo_caractere()
+        if c == "]":
+            return
+        if c is None:
+            raise ValueError(f"JSON terminou antes do ']' (depois do registro {n})")
+        if n:
+            if c != ",":
+                raise ValueError(f"JSON inválido depois do registro {n}: esperado ',' ou ']'")
+            pos += 1
+            proximo_caractere()
+        while True:
+            try:
+                valor, fim_valor = decoder.raw_decode(buffer, pos)
+                break
+            except json.JSONDecodeError as e:
+                # só um registro cortado no fim do buffer se resolve lendo mais; erro no meio, não
+                bloco = "" if fim or not _cortado(e, buffer) else arquivo.read(BLOCO)
+                if not bloco:
+                    raise ValueError(f"JSON inválido no registro {n + 1}: {e.msg}") from None
+                buffer, pos = buffer[pos:] + bloco, 0
+        n += 1
+        pos = fim_valor
+        yield f"registro {n}", valor
+
+def _json_linhas(arquivo: io.TextIOBase) -> Iterator[Tuple[str, Any]]:
+    for n, linha in enumerate(arquivo, 1):
+        if not linha.strip():
+            continue
+        try:
+            yield f"linha {n}", json.loads(linha)
+        except json.JSONDecodeError as e:
+            yield f"linha {n}", RegistroInvalido(f"JSON inválido: {e.msg}")
+
+def _csv(arquivo: io.TextIOBase) -> Iterator[Tuple[str, Any]]:
+    amostra = arquivo.read(4096)
+    arquivo.seek(0)
+    try:
+        dialeto = csv.Sniffer().sniff(amostra, delimiters=",;\t")
+    except csv.Error:
+        dialeto = csv.excel
+    leitor = csv.DictReader(arquivo, dialect=dialeto)
+    for registro in leitor:
+        yield f"linha {leitor.line_num}", registro
+
+def detectar_formato(path: Path) -> str:
+    sufixo = path.suffix.lower()
+    if sufixo in (".jsonl", ".ndjson"):
+        return "jsonl"
+    if sufixo == ".csv":
+        return "csv"
+    # .json: array ou, se começar com '{', um objeto por linha
+    with open(path, encoding="utf-8-sig") as f:
+        inicio = f.read(BLOCO).lstrip()
+    return "jsonl" if inicio.startswith("{") else "json"
+
+def ler_consultas(path: Path, formato: Optional[str] = None,
+                  relatorio: Optional[Relatorio] = None) -> Iterator[Dict[str, Any]]:
+    """
+    consultas válidas do arquivo, uma de cada vez (memória constante com o tamanho do arquivo).
+    Registros inválidos vão para o `relatorio` em vez de interromper a leitura.
+    """
+    path = Path(path)
+    formato = formato or detectar_formato(path)
+    if formato not in FORMATOS:
+        raise ValueError(f"formato desconhecido: {formato} (use {', '.join(FORMATOS)})")
+    relatorio = relatorio if relatorio is not None else Relatorio()
+    leitor = {"json": _json_array, "jsonl": _json_linhas, "csv": _csv}[formato]
+
+    with open(path, encoding="utf-8-sig", newline="" if formato == "csv" else None) as arquivo:
+        for posicao, registro in leitor(arquivo):
+            relatorio.lidos += 1
+            try:
+                if isinstance(registro, RegistroInvalido):
+                    raise registro
+                consulta = validar(registro)
+            except RegistroInvalido as e:
+                relatorio.invalido(posicao, str(e))
+                continue
+            relatorio.validos += 1
+            yield consulta
@@ -0,0 +1,92 @@
+# src/carga_test.py
+# Carga de pacientes em JSON array, JSON lines e CSV: registros ruins vão para o relatório.
+#   python -m pytest src/carga_test.py
+import io, json
+
+import pytest
+
+import carga
+from carga import Relatorio, ler_consultas
+
+BOA = {"nome": "Ana", "telefone": "+55 (11) 90000-0001", "responsavel": "5513998085263",
+       "data": "10/01/2030", "hora": "09:00", "link": "https://hcclinicas.org/teleconsulta/1"}
+
+RUINS = [
+    {**BOA, "nome": ""},                    # campo obrigatório vazio
+    {**BOA, "telefone": "12ab"},            # telefone
+    {**BOA, "responsavel": "123"},          # responsável curto demais
+    {**BOA, "data": "31/02/2030"},          # data que não existe
+    {**BOA, "hora": "25:00"},               # hora
+    {**BOA, "responsavel_ativo": "talvez"},  # booleano
+    ["não", "é", "objeto"],
+]
+
+def _ler(path, formato=None):
+    relatorio = Relatorio()
+    return list(ler_consultas(path, formato, relatorio)), relatorio
+
+def test_json_array_pula_os_ruins_e_conta(tmp_path):
+    path = tmp_path / "pacientes.json"
+    path.write_text(json.dumps([BOA, *RUINS, {**BOA, "hora": "10:00"}]), encoding="utf-8")
+    consultas, relatorio = _ler(path)
+
+    assert [c["hora"] for c in consultas] == ["09:00", "10:00"]
+    assert consultas[0]["telefone"] == "5511900000001" and consultas[0]["responsavel_ativo"] is True
+    assert (relatorio.lidos, relatorio.validos, relatorio.invalidos) == (9, 2, 7)
+    posicoes = [p for p, _ in relatorio.erros]
+    assert posicoes == [f"registro {n}" for n in range(2, 9)]
+    motivos = " | ".join(m for _, m in relatorio.erros)
+    for trecho in ("campos obrigatórios vazios: nome", "telefone inválido", "responsavel inválido",
+                   "data/hora inválida", "responsavel_ativo inválido", "esperado objeto"):
+        assert trecho in motivos
+
+def test_jsonl_linha_quebrada_nao_para_a_carga(tmp_path):
+    path = tmp_path / "pacientes.jsonl"
+    path.write_text(json.dumps(BOA) + "\n{quebrado\n\n" + json.dumps({**BOA, "telefone": "x"}) + "\n",
+                    encoding="utf-8")
+    consultas, relatorio = _ler(path)
+
+    assert len(consultas) == 1
+    assert [p for p, _ in relatorio.erros] == ["linha 2", "linha 4"]
+    assert relatorio.erros[0][1].startswith("JSON inválido")
+
+def test_csv_com_ponto_e_virgula(tmp_path):
+    path = tmp_path / "pacientes.csv"
+    path.write_text("nome;telefone;responsavel;responsavel_ativo;data;hora;link\n"
+                    "Ana;5511900000001;;não;10/01/2030;09:00;\n"
+                    "Bia;5511900000002;;sim;10/01/2030;;\n", encoding="utf-8")
+    consultas, relatorio = _ler(path)
+
+    assert consultas == [{"nome": "Ana", "telefone": "5511900000001", "responsavel": None,
+                          "responsavel_ativo": False, "data": "10/01/2030", "hora": "09:00", "link": None}]
+    assert relatorio.erros == [("linha 3", "campos obrigatórios vazios: hora")]
+
+def test_json_truncado_interrompe(tmp_path, monkeypatch):
+    monkeypatch.setattr(carga, "BLOCO", 16)  # força o registro a atravessar blocos
+    path = tmp_path / "pacientes.json"
+    path.write_text(json.dumps([BOA, BOA])[:-30], encoding="utf-8")
+    with pytest.raises(ValueError, match="registro 2"):
+        _ler(path)
+
+def test_json_com_erro_no_meio_para_sem_ler_o_resto(monkeypatch):
+    monkeypatch.setattr(carga, "BLOCO", 256)
+    registro = json.dumps(BOA)
+    texto = "[" + ",".join([registro, registro.replace(", ", " ", 1)] + [registro] * 1000) + "]"
+    leituras = []
+
+    class Arquivo(io.StringIO):
+        def read(self, n=-1):
+            leituras.append(n)
+            return super().read(n)
+
+    with pytest.raises(ValueError, match="registro 2: Expecting ',' delimiter"):
+        list(carga._json_array(Arquivo(texto)))
+    assert len(leituras) <= 2  # antes: lia os ~600 blocos restantes, um por um, para dentro do buffer
+
+@pytest.mark.parametrize("bloco", range(1, 41))
+def test_json_valido_cortado_em_qualquer_ponto(monkeypatch, bloco):
+    monkeypatch.setattr(carga, "BLOCO", bloco)
+    registros = [{**BOA, "nome": "João \"Jota\" 😊", "responsavel_ativo": False, "idade": -12.5e3},
+                 {**BOA, "responsavel_ativo": True, "link": None}]
+    texto = json.dumps(registros, indent=2)  # ensure_ascii: \uXXXX também atravessa blocos
+    assert [v for _, v in carga._json_array(io.StringIO(texto))] == registros
@@ -0,0 +1,270 @@
+# src/cli.py
+# Ponto de entrada único:
+#   python src/cli.py plan pacientes.json --saida plano.tsv --picos 10   (sem Graph: só os horários)
+#   python src/cli.py run [--perfil]                                      (o scheduler de produção)
+#   python src/cli.py replay plano.tsv --speedup 60                       (o plano contra a Graph simulada)
+import os, sys, json, gzip, time, heapq, argparse
+from collections import Counter
+from datetime import datetime, timedelta
+from json.encoder import encode_basestring as _json_str
+from operator import itemgetter
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, TextIO, Tuple
+import config  # carrega o .env antes de ler o ambiente
+from carga import FORMATOS, Relatorio, ler_consultas
+from pacientes_store import PACIENTES_PATH
+
+config.carregar_env()
+
+BASE_DIR = Path(__file__).resolve().parent
+
+# uma linha por lembrete, em ordem de horário; .gz comprime
+COLUNAS = ("run_at", "template", "telefone", "responsavel", "consulta", "link", "params")
+UM_MINUTO = timedelta(minutes=1)
+
+def _abrir(path: str, modo: str) -> TextIO:
+    if path == "-":
+        return sys.stdout if modo == "w" else sys.stdin
+    if path.endswith(".gz"):
+        return gzip.open(path, modo + "t", compresslevel=5, encoding="utf-8")
+    return open(path, modo, encoding="utf-8")
+
+# -------------------- plan --------------------
+def _linha(args: List[Any], params_json: str) -> Tuple[str, int]:
+    """colunas do lembrete depois do run_at e quantas mensagens ele gera."""
+    template, telefone, _, responsavel, link, consulta_iso = args
+    mensagens = 2 if responsavel and responsavel != telefone else 1
+    return f"{template}\t{telefone}\t{responsavel or ''}\t{consulta_iso}\t{link or ''}\t{params_json}\n", mensagens
+
+def planejar(path: Path, formato: Optional[str] = None, desde: Optional[datetime] = None,
+             relatorio: Optional[Relatorio] = None, suavizador=None) -> Iterator[Tuple[datetime, str, int]]:
+    """
+    (run_at, colunas, mensagens) de todos os lembretes do arquivo depois de `desde`, em
+    ordem de horário. Cada template é a lista de consultas ordenada deslocada por uma
+    antecedência fixa: ordena as consultas uma vez e intercala os 4 fluxos. Com
+    `suavizador` os horários deixam de ser deslocamentos fixos e o plano é ordenado inteiro.
+    """
+    from scheduler import ANTECEDENCIAS, planejar_consulta
+
+    relatorio = relatorio if relatorio is not None else Relatorio()
+    consultas = []   # (consulta_dt, linhas por template)
+    suavizados = []  # (run_at, colunas, mensagens), com suavizador
+    for p in ler_consultas(path, formato, relatorio):
+        try:
+            lembretes = planejar_consulta(p)
+        except (KeyError, ValueError) as e:
+            relatorio.validos -= 1  # passou na leitura, mas o template não aceitaria
+            relatorio.invalido(f"telefone {p.get('telefone')}", str(e))
+            continue
+        jsons: Dict[Tuple[str, ...], str] = {}  # 48h/24h e 1h/começando têm os mesmos parâmetros
+        linhas = []
+        for l in lembretes:
+            params = tuple(l["args"][2])
+            if params not in jsons:
+                jsons[params] = "[" + ",".join(_json_str(v) for v in params) + "]"
+            linhas.append(_linha(l["args"], jsons[params]))
+        if suavizador is not None:
+            suavizador.ajustar(lembretes, agora=desde or datetime.min)
+            suavizados += [(l["run_at"], *linha) for l, linha in zip(lembretes, linhas)
+                           if desde is None or l["run_at"] > desde]
+        else:
+            consultas.append((lembretes[0]["consulta_dt"], linhas))
+    if suavizador is not None:
+        suavizados.sort(key=itemgetter(0))
+        return iter(suavizados)
+    consultas.sort(key=itemgetter(0))
+
+    def fluxo(k: int, antecedencia: timedelta):
+        for consulta_dt, linhas in consultas:
+            run_at = consulta_dt - antecedencia
+            if desde is None or run_at > desde:
+                yield run_at, *linhas[k]
+
+    return heapq.merge(*(fluxo(k, delta) for k, (_, delta) in enumerate(ANTECEDENCIAS)), key=itemgetter(0))
+
+def escrever_plano(lembretes: Iterator[Tuple[datetime, str, int]], saida: str) -> Counter:
+    """grava o plano e devolve mensagens por minuto (paciente + responsável com outro número)."""
+    por_minuto: Counter = Counter()
+    f = _abrir(saida, "w")
+    try:
+        f.write("# " + "\t".join(COLUNAS) + "\n")
+        anterior, quando = datetime.min, None
+        for run_at, colunas, mensagens in lembretes:
+            # em ordem: o mesmo minuto vem seguido (suavizado, com segundos diferentes)
+            if run_at != anterior and (run_at.minute != anterior.minute or run_at - anterior >= UM_MINUTO):
+                anterior, quando = run_at, run_at.isoformat(timespec="minutes")
+            f.write(f"{quando}\t{colunas}")
+            por_minuto[quando] += mensagens
+    finally:
+        if f is not sys.stdout:
+            f.close()
+    return por_minuto
+
+def ler_plano(path: str) -> Iterator[Tuple[datetime, List[Tuple[str, str, List[str], Optional[str]]]]]:
+    """(run_at, envios do minuto) do arquivo do plan; envio = (template, telefone, params, link)."""
+    f = _abrir(path, "r")
+    try:
+        atual, envios = None, []
+        for linha in f:
+            if linha.startswith("#"):
+                continue
+            quando, template, telefone, responsavel, _, link, params = linha.rstrip("\n").split("\t")
+            if quando != atual:
+                if envios:
+                    yield datetime.fromisoformat(atual), envios
+                atual, envios = quando, []
+            params = json.loads(params)
+            envios.append((template, telefone, params, link or None))
+            if responsavel and responsavel != telefone:
+                envios.append((template, responsavel, params, link or None))
+        if envios:
+            yield datetime.fromisoformat(atual), envios
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+def cmd_plan(args) -> None:
+    from whatsapp import MPS
+
+    t0 = time.perf_counter()
+    relatorio = Relatorio()
+    desde = None if args.todos else datetime.fromisoformat(args.desde) if args.desde else datetime.now()
+    suavizador = None
+    if args.suavizar:
+        from suavizacao import Suavizador
+        suavizador = Suavizador(args.suavizar)
+    por_minuto = escrever_plano(planejar(Path(args.arquivo), args.formato, desde, relatorio, suavizador), args.saida)
+    total = sum(por_minuto.values())
+    avisar = sys.stderr if args.saida == "-" else sys.stdout
+    print(f"🗓️ {relatorio.validos} consultas | {total} mensagens em {len(por_minuto)} minutos "
+          f"| {time.perf_counter() - t0:.1f}s → {args.saida}", file=avisar)
+    if relatorio.invalidos:
+        print(f"⚠️ {relatorio.resumo()}", file=avisar)
+    if args.picos and por_minuto:
+        print(f"\nMinutos mais cheios (WHATSAPP_MPS={MPS:g}):", file=avisar)
+        for minuto, n in por_minuto.most_common(args.picos):
+            drenar = f"{n / MPS:6.1f}s para drenar" if MPS else ""
+            print(f"  {minuto}  {n:>6} mensagens  {drenar}", file=avisar)
+    if suavizador is not None:
+        print(f"\nSuavização a {args.suavizar:g} msg/s — minutos por faixa de mensagens/min:", file=avisar)
+        print(suavizador.relatorio(), file=avisar)
+
+# -------------------- run --------------------
+def cmd_run(args) -> None:
+    import perfil
+    if args.perfil or args.perfil_dump or args.perfil_amostras:
+        perfil.ligar(args.perfil_dump, args.perfil_amostras)
+    # os jobs persistidos apontam para "scheduler:...": roda pelo módulo importado
+    import scheduler
+    scheduler.run()
+
+# -------------------- replay --------------------
+def _percentil(valores: List[float], p: float) -> float:
+    return valores[min(len(valores) - 1, int(len(valores) * p))]
+
+def cmd_replay(args) -> None:
+    stub = None
+    if args.graph:
+        graph_url = args.graph
+    else:
+        sys.path.insert(0, str(BASE_DIR.parent / "benchmarks"))
+        from graph_stub import GraphStub
+        stub = GraphStub(latencia=args.latencia, mps=args.graph_mps).start()
+        graph_url = stub.url
+    # credenciais de mentira: o replay nunca fala com a Meta
+    os.environ.update({"WHATSAPP_GRAPH_URL": graph_url, "WHATSAPP_TOKEN": "replay", "PHONE_NUMBER_ID": "replay"})
+    from whatsapp import MPS, enviar_templates_lote
+
+    inicio = datetime.fromisoformat(args.inicio) if args.inicio else None
+    v0 = t0 = fim = None
+    drenagens, atrasos = [], []
+    enviadas = erros = estourados = 0
+    cheios: List[Tuple[float, str, int]] = []
+    try:
+        for run_at, envios in ler_plano(args.plano):
+            if inicio and run_at < inicio:
+                continue
+            if v0 is None:
+                v0, t0 = run_at, time.monotonic()
+                fim = v0 + timedelta(hours=args.horas) if args.horas else None
+            if fim and run_at >= fim:
+                break
+            alvo = t0 + (run_at - v0).total_seconds() / args.speedup
+            espera = alvo - time.monotonic()
+            if espera > 0:
+                time.sleep(espera)
+            comeco = time.monotonic()
+            resultados = enviar_templates_lote(envios)
+            drenagem = time.monotonic() - comeco
+            ok = sum(1 for r in resultados if r["ok"])
+            enviadas += ok
+            erros += len(resultados) - ok
+            drenagens.append(drenagem)
+            atrasos.append(max(0.0, comeco - alvo))
+            estourados += drenagem > 60  # o envio é em tempo real: em produção, não cabe no minuto
+            heapq.heappush(cheios, (drenagem, run_at.isoformat(timespec="minutes"), len(envios)))
+            if len(cheios) > 5:
+                heapq.heappop(cheios)
+            if args.verbose:
+                print(f"{run_at:%d/%m %H:%M}  {len(envios):>5} envios  {drenagem:6.2f}s")
+    except KeyboardInterrupt:
+        print("🛑 Replay interrompido.")
+    finally:
+        if stub:
+            stub.shutdown()
+
+    if not drenagens:
+        print("Nada para reproduzir nessa janela.")
+        return
+    drenagens.sort()
+    atrasos.sort()
+    print(f"▶️ {len(drenagens)} minutos do plano a {args.speedup:g}x | {enviadas} enviadas, {erros} erros "
+          f"| WHATSAPP_MPS={MPS:g}")
+    print(f"drenagem do minuto (s reais): p50 {_percentil(drenagens, 0.5):.2f}  p95 {_percentil(drenagens, 0.95):.2f}"
+          f"  máx {drenagens[-1]:.2f}")
+    print(f"atraso do disparo (s reais, com o tempo entre minutos acelerado): p50 {_percentil(atrasos, 0.5):.2f}"
+          f"  p95 {_percentil(atrasos, 0.95):.2f}  máx {atrasos[-1]:.2f}")
+    print(f"minutos com mais de 60s de envio (não cabem no minuto em produção): {estourados}")
+    for drenagem, minuto, n in sorted(cheios, reverse=True):
+        print(f"  {minuto}  {n:>6} envios  {drenagem:6.2f}s")
+
+# -------------------- argumentos --------------------
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Lembretes de teleconsulta: planejar, rodar e reproduzir.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    plan = sub.add_parser("plan", help="horários de todos os lembretes de um arquivo, sem enviar nada")
+    plan.add_argument("arquivo", nargs="?", default=str(PACIENTES_PATH))
+    plan.add_argument("--formato", choices=FORMATOS, help="padrão: pela extensão/conteúdo")
+    plan.add_argument("--saida", default="plano.tsv", help="arquivo do plano (.gz comprime; - = stdout)")
+    plan.add_argument("--desde", help="só lembretes depois deste horário ISO (padrão: agora)")
+    plan.add_argument("--todos", action="store_true", help="inclui os lembretes que já passaram")
+    plan.add_argument("--picos", type=int, default=10, help="quantos minutos mais cheios listar (0 = nenhum)")
+    plan.add_argument("--suavizar", type=float, default=float(os.getenv("SCHEDULER_SUAVIZAR_MPS", "0")),
+                      metavar="MPS", help="espalha os disparos para este ritmo alvo (SCHEDULER_SUAVIZAR_MPS)")
+    plan.set_defaults(func=cmd_plan)
+
+    run = sub.add_parser("run", help="o scheduler de produção (envia de verdade)")
+    run.add_argument("--perfil", action="store_true", help="tempo por etapa (PERFIL=1)")
+    run.add_argument("--perfil-dump", metavar="ARQUIVO", default=os.getenv("PERFIL_DUMP", ""))
+    run.add_argument("--perfil-amostras", metavar="ARQUIVO", default=os.getenv("PERFIL_AMOSTRAS", ""))
+    run.set_defaults(func=cmd_run)
+
+    replay = sub.add_parser("replay", help="envia um plano contra a Graph simulada em tempo acelerado")
+    replay.add_argument("plano")
+    replay.add_argument("--speedup", type=float, default=60.0, help="minutos virtuais por minuto real")
+    replay.add_argument("--inicio", help="horário ISO do plano onde começar (padrão: o primeiro lembrete)")
+    replay.add_argument("--horas", type=float, default=0.0, help="horas do plano a reproduzir (0 = até o fim)")
+    replay.add_argument("--graph", help="URL de um graph_stub já rodando (padrão: sobe um aqui)")
+    replay.add_argument("--latencia", type=float, default=0.05, help="latência do stub local (s)")
+    replay.add_argument("--graph-mps", type=float, default=0.0, help="429 acima deste ritmo no stub local")
+    replay.add_argument("-v", "--verbose", action="store_true", help="uma linha por minuto reproduzido")
+    replay.set_defaults(func=cmd_replay)
+
+    args = parser.parse_args(argv)
+    if getattr(args, "speedup", 1) <= 0:
+        parser.error("--speedup precisa ser > 0")
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
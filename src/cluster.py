@@ -0,0 +1,254 @@
+# src/cluster.py
+import os, math, time, zlib, socket, sqlite3, logging, threading, argparse
+from pathlib import Path
+from typing import Callable, Iterable, List, Optional, Set, Tuple
+from storage import DB_PATH
+from metricas import contador, medidor
+
+# filho do logger do scheduler: herda arquivo e terminal dele
+logger = logging.getLogger("scheduler.cluster")
+
+SHARDS       = int(os.getenv("SCHEDULER_SHARDS", "0"))        # 0 = sem cluster (um scheduler só)
+# estável entre reinícios: nomeia o job store do nó (jobs_{NO}.db); dois nós na mesma máquina
+# precisam cada um do seu SCHEDULER_NO
+NO           = os.getenv("SCHEDULER_NO", "").strip() or socket.gethostname()
+CLUSTER_DB   = Path(os.getenv("SCHEDULER_CLUSTER_DB", DB_PATH))
+LEASE_S      = float(os.getenv("SCHEDULER_LEASE_S", "30"))     # s até um nó calado perder os shards
+RETOMADA_MAX = float(os.getenv("SCHEDULER_RETOMADA_MAX", "3600"))
+DISPAROS_TTL = 7 * 24 * 3600  # lembretes disparados guardados para dedup (s)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cluster_nos (
+    no        TEXT PRIMARY KEY,
+    visto_em  REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS cluster_shards (
+    shard       INTEGER PRIMARY KEY,
+    dono        TEXT,
+    expira_em   REAL NOT NULL DEFAULT 0,
+    renovado_em REAL
+);
+CREATE TABLE IF NOT EXISTS lembretes_disparados (
+    id           TEXT PRIMARY KEY,
+    no           TEXT NOT NULL,
+    disparado_em REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_disparados_em ON lembretes_disparados(disparado_em);
+"""
+
+PULADOS = contador("scheduler_cluster_pulados_total",
+                   "lembretes vencidos que este nó não mandou (sem_lease, ja_disparado)", ("motivo",))
+SHARDS_DO_NO = medidor("scheduler_cluster_shards", "shards com lease deste nó")
+
+class Cluster:
+    """
+    Vários scheduler.py dividindo as consultas:
+    - shard = crc32(telefone) % shards; cada shard tem um dono por lease em cluster_shards
+    - renovar() a cada LEASE_S/3: os nós vivos dividem os shards por igual; shard de
+      nó que parou de renovar fica livre quando a lease vence e outro assume
+    - disparar() no horário do lembrete: só passa com lease válida e se nenhum nó
+      já disparou aquele id (lembretes_disparados), então a troca de dono não duplica envio
+    """
+
+    def __init__(self, shards: int = SHARDS, no: str = NO, path: Path = CLUSTER_DB, lease: float = LEASE_S):
+        if shards < 1:
+            raise ValueError("o cluster precisa de SCHEDULER_SHARDS >= 1")
+        self.shards = shards
+        self.no = no
+        self.path = Path(path)
+        self.lease = lease
+        self.meus: Set[int] = set()
+        self._valido_ate = 0.0      # lease local termina antes da do banco (folga de LEASE_S/5)
+        self._renovado_em: Optional[float] = None
+        self._limpo_em = 0.0
+        self._local = threading.local()
+        self._parar = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self.ao_mudar: Optional[Callable[[Set[int], Set[int], float], None]] = None
+        self._pendente: Tuple[Set[int], Set[int], float] = (set(), set(), 0.0)
+        self._pendente_lock = threading.Lock()
+
+        conn = self._conn()
+        conn.executescript(SCHEMA)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            existentes = conn.execute("SELECT COUNT(*) FROM cluster_shards").fetchone()[0]
+            if existentes and existentes != shards:
+                raise ValueError(f"{self.path} tem {existentes} shards; todos os nós precisam de SCHEDULER_SHARDS={existentes}")
+            conn.executemany("INSERT OR IGNORE INTO cluster_shards (shard) VALUES (?)", [(s,) for s in range(shards)])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def shard(self, telefone: str) -> int:
+        return zlib.crc32(str(telefone).encode()) % self.shards
+
+    def meu(self, telefone: str) -> bool:
+        """o shard do telefone é deste nó (para planejar; o disparo confere também a lease)."""
+        return self.shard(telefone) in self.meus
+
+    # -------------------- leases --------------------
+    def renovar(self) -> Tuple[Set[int], Set[int], float]:
+        """
+        um ciclo de lease: renova os shards deste nó, solta o que passa da cota
+        (shards / nós vivos) e pega shards livres ou vencidos.
+        Devolve (ganhos, perdidos, retomada): `retomada` é há quantos segundos o
+        dono anterior de um shard ganho deu sinal de vida, para agendar os
+        lembretes que venceram sem ninguém olhando.
+        """
+        agora = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("INSERT INTO cluster_nos (no, visto_em) VALUES (?, ?)"
+                         " ON CONFLICT(no) DO UPDATE SET visto_em = excluded.visto_em", (self.no, agora))
+            conn.execute("DELETE FROM cluster_nos WHERE visto_em <= ?", (agora - 10 * self.lease,))
+            vivos = conn.execute("SELECT COUNT(*) FROM cluster_nos WHERE visto_em > ?",
+                                 (agora - self.lease,)).fetchone()[0]
+            cota = math.ceil(self.shards / max(vivos, 1))
+
+            linhas = conn.execute("SELECT shard, dono, expira_em, renovado_em FROM cluster_shards ORDER BY shard").fetchall()
+            meus = [s for s, dono, _, _ in linhas if dono == self.no]
+            ficar, soltar = meus[:cota], meus[cota:]
+            livres = [(s, renovado) for s, dono, expira, renovado in linhas
+                      if dono != self.no and (dono is None or expira <= agora)]
+            pegar = livres[:max(0, cota - len(ficar))]
+
+            conn.executemany("UPDATE cluster_shards SET dono = NULL, expira_em = 0, renovado_em = ? WHERE shard = ?",
+                             [(agora, s) for s in soltar])
+            conn.executemany("UPDATE cluster_shards SET dono = ?, expira_em = ?, renovado_em = ? WHERE shard = ?",
+                             [(self.no, agora + self.lease, agora, s) for s in ficar + [s for s, _ in pegar]])
+            if agora - self._limpo_em > 3600:
+                conn.execute("DELETE FROM lembretes_disparados WHERE disparado_em < ?", (agora - DISPAROS_TTL,))
+                self._limpo_em = agora
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        antes, novos = self.meus, set(ficar) | {s for s, _ in pegar}
+        ganhos, perdidos = novos - antes, antes - novos
+        retomada = max((agora - renovado for s, renovado in pegar if renovado), default=0.0)
+        if antes and agora >= self._valido_ate and self._renovado_em:
+            # a lease local venceu (processo travado): os jobs desse intervalo foram pulados
+            ganhos, perdidos = novos, antes
+            retomada = max(retomada, agora - self._renovado_em)
+        self.meus = novos
+        self._valido_ate = agora + self.lease * 0.8
+        self._renovado_em = agora
+        SHARDS_DO_NO.definir(len(novos))
+        if ganhos or perdidos:
+            logger.info("Nó %s: %d shards (+%s -%s), %d nós vivos", self.no, len(novos),
+                        sorted(ganhos), sorted(perdidos), vivos)
+        return ganhos, perdidos, min(retomada, RETOMADA_MAX)
+
+    def liberar(self) -> None:
+        """encerramento: devolve os shards na hora em vez de esperar a lease vencer."""
+        agora = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("UPDATE cluster_shards SET dono = NULL, expira_em = 0, renovado_em = ? WHERE dono = ?",
+                     (agora, self.no))
+        conn.execute("DELETE FROM cluster_nos WHERE no = ?", (self.no,))
+        conn.execute("COMMIT")
+        self.meus = set()
+        self._valido_ate = 0.0
+        SHARDS_DO_NO.definir(0)
+        logger.info("Nó %s liberou os shards", self.no)
+
+    # -------------------- disparo --------------------
+    def disparar(self, ids: Iterable[str]) -> List[str]:
+        """
+        dos lembretes ({telefone}_{template}_{consulta_iso}) que venceram aqui, os que
+        este nó deve mandar: shard com lease válida e primeiro disparo do id no cluster.
+        O id fica marcado antes do envio: na dúvida, o lembrete não sai duas vezes.
+        """
+        agora = time.time()
+        liberados = []
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for lembrete_id in ids:
+                if agora >= self._valido_ate or not self.meu(lembrete_id.split("_", 1)[0]):
+                    PULADOS.inc(motivo="sem_lease")
+                    logger.warning("Lembrete %s pulado: shard sem lease neste nó", lembrete_id)
+                    continue
+                cur = conn.execute("INSERT OR IGNORE INTO lembretes_disparados (id, no, disparado_em) VALUES (?, ?, ?)",
+                                   (lembrete_id, self.no, agora))
+                if cur.rowcount:
+                    liberados.append(lembrete_id)
+                else:
+                    PULADOS.inc(motivo="ja_disparado")
+                    logger.warning("Lembrete %s pulado: já disparado por outro nó", lembrete_id)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return liberados
+
+    # -------------------- threads --------------------
+    def start(self) -> None:
+        """
+        renova a cada LEASE_S/3 numa thread e, em outra, chama self.ao_mudar(ganhos,
+        perdidos, retomada) quando os shards mudam; replanejar um shard grande não
+        atrasa a renovação. Sem ao_mudar ainda (plano inicial rodando), as mudanças acumulam.
+        """
+        for alvo, nome in ((self._renovar_loop, "cluster"), (self._aplicar_loop, "cluster-shards")):
+            t = threading.Thread(target=alvo, name=nome, daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self) -> None:
+        self._parar.set()
+        for t in self._threads:
+            t.join(5)
+
+    def _renovar_loop(self) -> None:
+        while not self._parar.wait(self.lease / 3):
+            try:
+                ganhos, perdidos, retomada = self.renovar()
+            except Exception as e:
+                logger.exception("Erro na renovação dos shards: %s", e)
+                continue
+            if ganhos or perdidos:
+                with self._pendente_lock:
+                    g, p, r = self._pendente
+                    self._pendente = (g | ganhos, p | perdidos, max(r, retomada))
+
+    def _aplicar_loop(self) -> None:
+        while not self._parar.wait(0.2):
+            if self.ao_mudar is None:
+                continue
+            with self._pendente_lock:
+                ganhos, perdidos, retomada = self._pendente
+                if not (ganhos or perdidos):
+                    continue
+                self._pendente = (set(), set(), 0.0)
+            try:
+                self.ao_mudar(ganhos, perdidos, retomada)
+            except Exception as e:
+                logger.exception("Erro ao aplicar a troca de shards: %s", e)
+
+def situacao(path: Path = CLUSTER_DB) -> List[Tuple]:
+    """(shard, dono, segundos até a lease vencer) de cada shard."""
+    with sqlite3.connect(path) as conn:
+        agora = time.time()
+        return [(s, dono, max(0.0, expira - agora))
+                for s, dono, expira in conn.execute("SELECT shard, dono, expira_em FROM cluster_shards ORDER BY shard")]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Leases dos shards do scheduler em cluster.")
+    parser.add_argument("--db", default=str(CLUSTER_DB))
+    args = parser.parse_args()
+    for shard, dono, resta in situacao(Path(args.db)):
+        print(f"shard {shard:>3}: {dono or '-':<30} {f'{resta:.0f}s' if dono else ''}")
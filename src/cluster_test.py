@@ -0,0 +1,86 @@
+# src/cluster_test.py
+# Scheduler em cluster: leases dos shards e cada lembrete disparado por um nó só.
+#   python -m pytest src/cluster_test.py
+import os, socket, subprocess, sys, threading
+from pathlib import Path
+
+import pytest
+
+import cluster
+from cluster import Cluster
+
+class Relogio:
+    def __init__(self):
+        self.agora = 1_000_000.0
+
+    def time(self):
+        return self.agora
+
+@pytest.fixture
+def relogio(monkeypatch):
+    r = Relogio()
+    monkeypatch.setattr(cluster, "time", r)
+    return r
+
+@pytest.fixture
+def nos(tmp_path, relogio):
+    """dois nós no mesmo banco, 4 shards, lease de 30 s."""
+    return [Cluster(shards=4, no=no, path=tmp_path / "cluster.db", lease=30) for no in ("a", "b")]
+
+def _id_do_shard(c, shard, n=0):
+    telefones = (f"55119{i:08d}" for i in range(10_000))
+    telefone = [t for t in telefones if c.shard(t) == shard][n]
+    return f"{telefone}_lembrete_24h_2030-01-10T09:00"
+
+def test_nos_vivos_dividem_os_shards(nos, relogio):
+    a, b = nos
+    assert a.renovar()[0] == {0, 1, 2, 3}
+    assert b.renovar()[0] == set()  # tudo com lease válida de 'a'
+
+    relogio.agora += 10
+    assert a.renovar()[1] == {2, 3}  # com 2 nós vivos a cota é 2: solta o resto
+    assert b.renovar()[0] == {2, 3}
+    assert a.meus == {0, 1} and b.meus == {2, 3}
+
+def test_lembrete_dispara_uma_vez_mesmo_trocando_de_dono(nos, relogio):
+    a, b = nos
+    a.renovar()
+    lembrete = _id_do_shard(a, 0)
+    assert a.disparar([lembrete]) == [lembrete]
+    assert a.disparar([lembrete]) == []  # o APScheduler repetiu o job
+
+    relogio.agora += 31  # 'a' travou: a lease venceu e 'b' assume o shard
+    ganhos, _, retomada = b.renovar()
+    assert 0 in ganhos and retomada == pytest.approx(31)
+    outro = _id_do_shard(a, 0, 1)
+    assert b.disparar([lembrete, outro]) == [outro]  # retomada não reenvia o que 'a' já mandou
+    assert a.disparar([_id_do_shard(a, 0, 2)]) == []  # 'a' sem lease não manda nada
+
+def test_disparo_concorrente_sai_de_um_no_so(nos):
+    a, b = nos
+    for c in nos:  # os dois acham que são donos (a janela de troca de lease)
+        c.meus, c._valido_ate = {0, 1, 2, 3}, float("inf")
+    ids = [f"55119{i:08d}_lembrete_24h_2030-01-10T09:00" for i in range(200)]
+    largada = threading.Barrier(2)
+    enviados = {}
+
+    def disparar(c):
+        largada.wait()
+        enviados[c.no] = [l for lote in (ids[i:i + 10] for i in range(0, len(ids), 10)) for l in c.disparar(lote)]
+    threads = [threading.Thread(target=disparar, args=(c,)) for c in nos]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert sorted(enviados["a"] + enviados["b"]) == sorted(ids)
+    assert not set(enviados["a"]) & set(enviados["b"])
+
+def test_nome_do_no_e_o_mesmo_a_cada_reinicio():
+    env = {k: v for k, v in os.environ.items() if k != "SCHEDULER_NO"}
+    env["PYTHONPATH"] = str(Path(cluster.__file__).resolve().parent)
+
+    def no_de_um_processo():
+        return subprocess.run([sys.executable, "-c", "import cluster; print(cluster.NO)"], env=env,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    assert no_de_um_processo() == no_de_um_processo() == socket.gethostname()  # o job store jobs_{NO}.db sobrevive
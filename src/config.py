@@ -0,0 +1,67 @@
+# src/config.py
+# Configuração do processo, lida uma vez: o .env entra no os.environ na importação
+# (antes das constantes dos outros módulos) e os dados da Graph API — antes repetidos
+# no whatsapp.py e nos dois webhooks — ficam num objeto só (get_config()).
+import os, threading
+from pathlib import Path
+from typing import Dict, Mapping, Optional, Set
+
+def _achar_env() -> Optional[Path]:
+    """o .env mais próximo subindo a partir de src/ (o mesmo que o load_dotenv() achava)."""
+    pasta = Path(__file__).resolve().parent
+    for candidata in (pasta, *pasta.parents):
+        arquivo = candidata / ".env"
+        if arquivo.is_file():
+            return arquivo
+    return None
+
+ENV_FILE = Path(os.environ["ENV_FILE"]) if os.getenv("ENV_FILE") else _achar_env()
+
+_carregados: Set[Path] = set()
+
+def carregar_env(arquivo: Optional[Path] = ENV_FILE) -> None:
+    """
+    .env -> os.environ sem sobrescrever o ambiente; sem arquivo, nem importa o dotenv.
+    Chamado na importação e por quem lê o ambiente: cada arquivo só é lido uma vez.
+    """
+    if arquivo is None or arquivo in _carregados or not arquivo.is_file():
+        return
+    _carregados.add(arquivo)
+    from dotenv import load_dotenv
+    load_dotenv(arquivo)
+
+carregar_env()
+
+class Config:
+    """Graph API: endereço, versão, número, token e idioma dos templates; verify token do webhook."""
+
+    def __init__(self, env: Mapping[str, str] = os.environ):
+        self.graph_url       = env.get("WHATSAPP_GRAPH_URL", "https://graph.facebook.com").rstrip("/")
+        self.api_version     = env.get("WHATSAPP_API_VERSION", "v23.0").strip()
+        self.phone_number_id = env.get("PHONE_NUMBER_ID", "").strip()
+        self.token           = env.get("WHATSAPP_TOKEN", "").strip()
+        self.default_lang    = env.get("DEFAULT_LANG", "pt_BR").strip()
+        self.verify_token    = env.get("WEBHOOK_VERIFY_TOKEN", "token123")
+        self.messages_url    = self.url(f"{self.phone_number_id}/messages")
+        self.headers: Dict[str, str] = {
+            "Authorization": f"Bearer {self.token}",
+            "Content-Type": "application/json",
+        }
+
+    def url(self, path: str) -> str:
+        return f"{self.graph_url}/{self.api_version}/{path}"
+
+    @property
+    def credenciais(self) -> bool:
+        return bool(self.token and self.phone_number_id)
+
+_config: Optional[Config] = None
+_config_lock = threading.Lock()
+
+def get_config() -> Config:
+    """configuração única por processo, montada na primeira chamada."""
+    global _config
+    with _config_lock:
+        if _config is None:
+            _config = Config()
+        return _config
@@ -0,0 +1,4 @@
+# src/conftest.py
+# main_test.py e scheduler_test.py são scripts manuais (enviam de verdade / rodam para sempre):
+# ficam fora do `python -m pytest src`.
+collect_ignore = ["main_test.py", "scheduler_test.py"]
@@ -1,121 +1,66 @@
 # src/demo_scheduler.py
-import time, json, locale, logging
-from pathlib import Path
+import time
 from datetime import datetime, timedelta
 from apscheduler.schedulers.background import BackgroundScheduler
 from whatsapp import enviar_template
+from storage import get_storage
+from formatacao import fmt_data_hora_ptbr, parse_data_hora
+from logconfig import setup_logger
 
 # ---------------- Logging ----------------
-def setup_logger(name: str, file_name: str) -> logging.Logger:
-    logs_dir = Path("logs")
-    logs_dir.mkdir(exist_ok=True)
-
-    logger = logging.getLogger(name)
-    logger.setLevel(logging.INFO)
-
-    if not logger.handlers:
-        # Arquivo
-        fh = logging.FileHandler(logs_dir / file_name, encoding="utf-8")
-        fh.setFormatter(logging.Formatter(
-            fmt="%(asctime)s [%(levelname)s] %(message)s",
-            datefmt="%d/%m/%Y %H:%M:%S"
-        ))
-
-        # Terminal
-        sh = logging.StreamHandler()
-        sh.setFormatter(logging.Formatter(
-            fmt="%(asctime)s [%(levelname)s] %(message)s",
-            datefmt="%d/%m/%Y %H:%M:%S"
-        ))
-
-        logger.addHandler(fh)
-        logger.addHandler(sh)
-
-    return logger
-
-logger = setup_logger("demo", "demo.log")
+logger = setup_logger("demo", "demo.log", datefmt="%d/%m/%Y %H:%M:%S")
 
 # -------------------- helpers --------------------
-def fmt_data_hora_ptbr(dt: datetime):
-    """retorna (data_br, dia_semana, hora_br)"""
-    try:
-        locale.setlocale(locale.LC_TIME, "pt_BR.UTF-8")
-    except Exception:
-        for cand in ("pt_BR", "Portuguese_Brazil.1252"):
-            try:
-                locale.setlocale(locale.LC_TIME, cand)
-                break
-            except Exception:
-                pass
-
-    dias = ["segunda-feira","terça-feira","quarta-feira","quinta-feira","sexta-feira","sábado","domingo"]
-
-    try:
-        dia_semana = dt.strftime("%A").lower()
-    except Exception:
-        dia_semana = dias[dt.weekday()]
-
-    if dia_semana not in dias:
-        dia_semana = dias[dt.weekday()]
-
-    data_br = dt.strftime("%d/%m/%Y")
-    hora_br = dt.strftime("%H:%M")
-    return data_br, dia_semana, hora_br
-
 def enviar_para_paciente_e_responsavel(template, telefone, params, responsavel=None, link=None):
     """envia ao paciente e, se ativo, ao responsável."""
-    try:
-        with open("src/pacientes.json", "r", encoding="utf-8") as f:
-            pacientes = json.load(f)
-    except FileNotFoundError:
-        logger.error("pacientes.json não encontrado.")
-        return
-
     try:
         enviar_template(template, telefone, params, link)
         print(f"✅ Enviado {template} para paciente {telefone}")
-        logger.info(f"Enviado {template} para paciente {telefone} | params={params} | link={link}")
+        logger.info("Enviado %s para paciente %s", template, telefone,
+                    extra={"template": template, "telefone": telefone})
     except Exception as e:
-        logger.error(f"Falha ao enviar {template} para paciente {telefone}: {e}")
+        logger.error("Falha ao enviar %s para paciente %s: %s", template, telefone, e)
         return
 
-    if responsavel:
-        pac = next((p for p in pacientes if p.get("telefone") == telefone), None)
-        ativo = pac.get("responsavel_ativo", True) if pac else True
+    if responsavel and responsavel != telefone:  # mesmo número do paciente: já recebeu
+        try:
+            ativo = get_storage().responsavel_ativo(telefone)
+        except FileNotFoundError:
+            logger.error("pacientes.json não encontrado.")
+            return
         if ativo:
             try:
                 enviar_template(template, responsavel, params, link)
                 print(f"✅ Enviado {template} para responsável {responsavel}")
-                logger.info(f"Enviado {template} para responsável {responsavel} | params={params} | link={link}")
+                logger.info("Enviado %s para responsável %s", template, responsavel,
+                            extra={"template": template, "telefone": responsavel, "paciente": telefone})
             except Exception as e:
-                logger.error(f"Falha ao enviar {template} para responsável {responsavel}: {e}")
+                logger.error("Falha ao enviar %s para responsável %s: %s", template, responsavel, e)
         else:
             print(f"⏸️ Responsável {responsavel} desativado — lembrete não enviado.")
-            logger.warning(f"Responsável {responsavel} desativado — lembrete não enviado.")
+            logger.warning("Responsável %s desativado — lembrete não enviado.", responsavel)
 
 # -------------------- demo --------------------
 def demo():
-    with open("src/pacientes.json", "r", encoding="utf-8") as f:
-        pacientes = json.load(f)
-
     scheduler = BackgroundScheduler()
 
-    for p in pacientes:
-        nome        = p["nome"]
-        telefone    = p["telefone"]
-        responsavel = p.get("responsavel")
-        data_str    = p["data"]  # pode estar "15/09/2025" OU "15/09/2025, segunda-feira"
-        hora_str    = p["hora"]
-        link        = p.get("link")
-
-        # garante parsing mesmo que venha "15/09/2025, segunda-feira"
-        data_somente = data_str.split(",")[0].strip()
-        consulta_dt  = datetime.strptime(f"{data_somente} {hora_str}", "%d/%m/%Y %H:%M")
+    for p in get_storage().iterar_consultas():
+        try:
+            nome        = p["nome"]
+            telefone    = p["telefone"]
+            responsavel = p.get("responsavel")
+            data_str    = p["data"]  # pode estar "15/09/2025" OU "15/09/2025, segunda-feira"
+            hora_str    = p["hora"]
+            link        = p.get("link")
+            consulta_dt = parse_data_hora(data_str, hora_str)
+        except (KeyError, ValueError) as e:
+            logger.error("Consulta inválida ignorada (%s): %s", p.get("telefone"), e)
+            continue
         data_br, dia_semana, hora_br = fmt_data_hora_ptbr(consulta_dt)
         data_amigavel = f"{data_br}, {dia_semana}"
 
         print(f"[DEMO] Lembretes agendados para {nome} ({telefone}) | {data_amigavel} às {hora_br}")
-        logger.info(f"[DEMO] Agendando para {nome} | data={data_amigavel} | hora={hora_br} | tel={telefone}")
+        logger.info("[DEMO] Agendando para %s | data=%s | hora=%s | tel=%s", nome, data_amigavel, hora_br, telefone)
 
         start = datetime.now()
 
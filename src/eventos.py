@@ -0,0 +1,184 @@
+# src/eventos.py
+# Regras do webhook sem framework: usadas pelo app Flask (webhook.py) e pelo ASGI (webhook_asgi.py).
+import os, time, sqlite3, logging, threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Tuple
+from storage import DB_PATH
+from metricas import contador, histograma, medidor
+from whatsapp import WhatsAppError
+
+# filho do logger do webhook: herda arquivo e terminal dele
+logger = logging.getLogger("webhook.eventos")
+
+PAUSAR_CMD   = "PAUSAR"
+RETORNAR_CMD = "RETORNAR"
+
+# ação = ("ativo", responsavel, bool) | ("texto", to, texto) | ("botao", to, texto, botoes)
+Acao = Tuple[Any, ...]
+
+# a rota já respondeu 200 e a Meta não reenvia: ação que falhou é repetida aqui mesmo
+ACAO_TENTATIVAS = int(os.getenv("WEBHOOK_TENTATIVAS", "3"))
+ACAO_ESPERA     = float(os.getenv("WEBHOOK_ESPERA", "1"))  # s antes da 2ª tentativa; dobra a cada uma
+
+# -------------------- métricas (as mesmas nos dois apps) --------------------
+TEMPO_REQUISICAO = histograma("webhook_requisicao_segundos", "tempo do POST /webhook até a resposta, por status HTTP",
+                              ("status",))
+TEMPO_EVENTO = histograma("webhook_processamento_segundos", "tempo de processar um evento fora da requisição")
+MENSAGENS = contador("webhook_mensagens_total", "mensagens recebidas por resultado (processada, repetida, erro)",
+                     ("resultado",))
+STATUSES = contador("webhook_statuses_total", "statuses de entrega recebidos", ("status",))
+FILA = medidor("webhook_fila", "eventos aguardando processamento")  # cada app liga a sua fila em FILA.funcao
+
+# -------------------- dedup --------------------
+class VistosTTL:
+    """
+    Conjunto limitado de ids já processados (dedup de reentregas da Meta).
+    - cada id expira após `ttl` segundos
+    - acima de `capacidade`, os mais antigos saem primeiro
+    """
+
+    def __init__(self, capacidade: int = 10000, ttl: float = 24 * 3600):
+        self.capacidade = capacidade
+        self.ttl = ttl
+        self._ids: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def marcar(self, msg_id: str) -> bool:
+        """True se o id é novo (e passa a ser visto); False se é repetido."""
+        agora = time.monotonic()
+        with self._lock:
+            while self._ids:
+                antigo, visto_em = next(iter(self._ids.items()))
+                if agora - visto_em < self.ttl and len(self._ids) < self.capacidade:
+                    break
+                self._ids.popitem(last=False)
+            if msg_id in self._ids:
+                return False
+            self._ids[msg_id] = agora
+            return True
+
+    def __len__(self):
+        return len(self._ids)
+
+class VistosSQLite:
+    """
+    Mesmo contrato do VistosTTL, mas num SQLite compartilhado:
+    vale para vários processos (uvicorn --workers N), que recebem reentregas uns dos outros.
+    """
+
+    LIMPEZA_A_CADA = 1000  # marcações entre uma limpeza de expirados e outra
+
+    def __init__(self, path: Path = DB_PATH, ttl: float = 24 * 3600):
+        self.path = Path(path)
+        self.ttl = ttl
+        self._local = threading.local()
+        self._marcacoes = 0
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS webhook_vistos (id TEXT PRIMARY KEY, visto_em REAL NOT NULL)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def marcar(self, msg_id: str) -> bool:
+        agora = time.time()
+        conn = self._conn()
+        self._marcacoes += 1
+        if self._marcacoes % self.LIMPEZA_A_CADA == 0:
+            conn.execute("DELETE FROM webhook_vistos WHERE visto_em < ?", (agora - self.ttl,))
+        # um id expirado conta como novo: o REPLACE só acontece se ele já venceu
+        cur = conn.execute(
+            "INSERT INTO webhook_vistos (id, visto_em) VALUES (?, ?)"
+            " ON CONFLICT(id) DO UPDATE SET visto_em = excluded.visto_em WHERE visto_em < ?",
+            (msg_id, agora, agora - self.ttl),
+        )
+        return cur.rowcount == 1
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM webhook_vistos").fetchone()[0]
+
+# -------------------- leitura do evento --------------------
+def mensagens(data: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """todas as mensagens do POST (todas as entries e changes)."""
+    for e in data.get("entry", []):
+        for ch in e.get("changes", []):
+            yield from ch.get("value", {}).get("messages", [])
+
+def statuses(data: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    for e in data.get("entry", []):
+        for ch in e.get("changes", []):
+            yield from ch.get("value", {}).get("statuses", [])
+
+def acoes_da_mensagem(msg: Dict[str, Any]) -> List[Acao]:
+    """o que fazer com uma mensagem recebida: clique em botão ou comando de texto."""
+    from_number = msg.get("from")
+
+    # 1) botões (interactive.button_reply)
+    interactive_obj = msg.get("interactive")
+    if interactive_obj and interactive_obj.get("type") == "button_reply":
+        payload = interactive_obj.get("button_reply", {}).get("id")  # "confirmar" | "ativar"
+        logger.info("Botão clicado por %s: %s", from_number, payload)
+        if payload == "confirmar":
+            return [("ativo", from_number, False),
+                    ("texto", from_number, "✅ Você parou de receber os lembretes.")]
+        if payload == "ativar":
+            return [("ativo", from_number, True),
+                    ("texto", from_number, "✅ Você voltou a receber os lembretes.")]
+        return []
+
+    # 2) textos simples (PAUSAR / RETORNAR)
+    text_obj = msg.get("text")
+    if text_obj:
+        body = (text_obj.get("body") or "").strip().upper()
+        logger.info("Texto de %s: %s", from_number, body)
+        if body == PAUSAR_CMD:
+            return [("botao", from_number,
+                     "Você pediu para parar de receber os lembretes. Confirme abaixo:",
+                     [{"id": "confirmar", "title": "CONFIRMAR"}])]
+        if body == RETORNAR_CMD:
+            return [("botao", from_number,
+                     "Deseja voltar a receber os lembretes? Clique abaixo:",
+                     [{"id": "ativar", "title": "ATIVAR"}])]
+        return [("texto", from_number,
+                 "Comandos: PAUSAR (parar de receber) • RETORNAR (voltar a receber)")]
+    return []
+
+def conferir_resposta(r, tipo: str, to_number: str) -> None:
+    """
+    resposta da Graph a um texto/botão: 429, limite de taxa e 5xx levantam WhatsAppError
+    (a ação é repetida); outro 4xx não adianta repetir e só fica no log.
+    """
+    logger.info("Resposta envio %s (%s): %s", tipo, to_number, r.status_code)
+    if r.status_code < 400:
+        return
+    try:
+        e = r.json().get("error") or {}
+    except (ValueError, AttributeError):
+        e = {}
+    erro = WhatsAppError(f"HTTP {r.status_code} ao enviar {tipo} para {to_number}. "
+                         f"(code={e.get('code')}) {e.get('message')}",
+                         status=r.status_code, code=e.get("code"), subcode=e.get("error_subcode"))
+    if r.status_code == 429 or r.status_code >= 500 or erro.limite_de_taxa:
+        raise erro
+    logger.error("%s - falha permanente, não será repetida", erro)
+
+def payload_texto(to_number: str, text: str) -> Dict[str, Any]:
+    return {"messaging_product": "whatsapp", "to": to_number, "type": "text", "text": {"body": text}}
+
+def payload_botoes(to_number: str, text: str, buttons: list) -> Dict[str, Any]:
+    return {
+        "messaging_product": "whatsapp",
+        "to": to_number,
+        "type": "interactive",
+        "interactive": {
+            "type": "button",
+            "body": {"text": text},
+            "action": {"buttons": [{"type": "reply", "reply": {"id": b["id"], "title": b["title"]}} for b in buttons]}
+        }
+    }
@@ -0,0 +1,383 @@
+# src/fila.py
+import os, json, time, sqlite3, logging, threading, argparse
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from whatsapp import WhatsAppError, enviar_template, enviar_templates_lote
+from templates import TemplateInvalido
+from metricas import contador
+import agrupamento
+import perfil
+from storage import DB_PATH, get_storage
+from status_envios import get_status_envios, wamid_da_resposta
+
+# filho do logger do scheduler: herda arquivo e terminal dele
+logger = logging.getLogger("scheduler.fila")
+
+FILA_DB        = Path(os.getenv("FILA_DB", DB_PATH))
+MAX_TENTATIVAS = int(os.getenv("FILA_MAX_TENTATIVAS", "8"))
+BACKOFF_BASE   = float(os.getenv("FILA_BACKOFF_BASE", "5"))     # s
+BACKOFF_MAX    = float(os.getenv("FILA_BACKOFF_MAX", "1800"))   # s
+LEASE          = float(os.getenv("FILA_LEASE", "120"))          # s até um envio travado voltar para a fila
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS fila_envios (
+    id          INTEGER PRIMARY KEY,
+    template    TEXT NOT NULL,
+    telefone    TEXT NOT NULL,
+    params      TEXT NOT NULL,
+    link        TEXT,
+    responsavel TEXT,
+    paciente    TEXT,
+    consulta    TEXT,
+    tentativas  INTEGER NOT NULL DEFAULT 0,
+    proxima_em  REAL NOT NULL,
+    status      TEXT NOT NULL DEFAULT 'pendente',
+    travado_em  REAL,
+    ultimo_erro TEXT,
+    criado_em   REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_fila_status_proxima ON fila_envios(status, proxima_em);
+CREATE INDEX IF NOT EXISTS idx_fila_telefone ON fila_envios(telefone, template);
+
+CREATE TABLE IF NOT EXISTS envios_mortos (
+    id          INTEGER PRIMARY KEY,
+    template    TEXT NOT NULL,
+    telefone    TEXT NOT NULL,
+    params      TEXT NOT NULL,
+    link        TEXT,
+    responsavel TEXT,
+    paciente    TEXT,
+    consulta    TEXT,
+    tentativas  INTEGER NOT NULL,
+    erro        TEXT,
+    criado_em   REAL NOT NULL,
+    morto_em    REAL NOT NULL
+);
+"""
+
+# colunas que entraram depois da primeira versão da fila (bancos antigos ganham via ALTER TABLE)
+COLUNAS_NOVAS = {"paciente": "TEXT", "consulta": "TEXT"}
+
+AGRUPADOS = contador("fila_envios_agrupados_total",
+                     "lembretes que saíram dentro de uma mensagem agrupada (agrupamento.py)", ("template",))
+
+def erro_permanente(exc: Optional[BaseException]) -> bool:
+    """4xx (fora limite de taxa) e parâmetros fora do template não adianta repetir; 5xx, timeout e conexão sim."""
+    if isinstance(exc, TemplateInvalido):
+        return True
+    if isinstance(exc, WhatsAppError):
+        return exc.status is not None and 400 <= exc.status < 500 and not exc.limite_de_taxa
+    return False
+
+class FilaEnvios:
+    """
+    Fila de saída persistente em SQLite (WAL).
+    - o job só enfileira; workers enviam
+    - falha temporária: backoff exponencial; permanente: vai para envios_mortos
+    - um envio travado em 'enviando' (processo caiu) volta para a fila após LEASE s
+    - com `politica` de agrupamento, lembretes agrupáveis esperam `janela` s e são
+      reservados junto com os do mesmo template para o mesmo número
+    """
+
+    def __init__(self, path: Path = FILA_DB, politica: str = agrupamento.POLITICA,
+                 janela: float = agrupamento.JANELA_S):
+        self.path = Path(path)
+        self.politica = politica
+        self.janela = janela
+        self._local = threading.local()
+        self._novos = threading.Event()
+        conn = self._conn()
+        conn.executescript(SCHEMA)
+        for tabela in ("fila_envios", "envios_mortos"):
+            existentes = {r["name"] for r in conn.execute(f"PRAGMA table_info({tabela})")}
+            for coluna, tipo in COLUNAS_NOVAS.items():
+                if coluna not in existentes:
+                    conn.execute(f"ALTER TABLE {tabela} ADD COLUMN {coluna} {tipo}")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # -------------------- produtor --------------------
+    def enfileirar(self, template: str, telefone: str, params: List[str],
+                   link: Optional[str] = None, responsavel: Optional[str] = None,
+                   paciente: Optional[str] = None, consulta: Optional[str] = None) -> int:
+        return self.enfileirar_varios([[template, telefone, params, responsavel, link, consulta, paciente]])[0]
+
+    def enfileirar_varios(self, itens: List[List[Any]]) -> List[int]:
+        """
+        itens = [[template, telefone, params, responsavel, link, consulta?, paciente?], ...] numa transação só.
+        paciente (padrão: o próprio telefone) e consulta vão para o status de entrega.
+        """
+        agora = time.time()
+        conn = self._conn()
+        ids = []
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for template, telefone, params, responsavel, link, *extra in itens:
+                consulta = extra[0] if extra else None
+                paciente = extra[1] if len(extra) > 1 and extra[1] else telefone
+                espera = self.janela if agrupamento.agrupavel(
+                    {"template": template, "telefone": telefone, "paciente": paciente}, self.politica) else 0
+                cur = conn.execute(
+                    "INSERT INTO fila_envios (template, telefone, params, link, responsavel, paciente, consulta,"
+                    " proxima_em, criado_em) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (template, telefone, json.dumps(params, ensure_ascii=False), link, responsavel,
+                     paciente, consulta, agora + espera, agora),
+                )
+                ids.append(cur.lastrowid)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self._novos.set()
+        return ids
+
+    # -------------------- consumidor --------------------
+    def reservar(self, limite: int = 1) -> List[Dict[str, Any]]:
+        """
+        pega até `limite` envios vencidos e marca como 'enviando'; com agrupamento,
+        leva junto os pendentes do mesmo número e template que vencem dentro da janela.
+        """
+        agora = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute("""
+                SELECT * FROM fila_envios
+                 WHERE (status = 'pendente' AND proxima_em <= ?)
+                    OR (status = 'enviando' AND travado_em <= ?)
+                 ORDER BY proxima_em
+                 LIMIT ?
+            """, (agora, agora - LEASE, limite)).fetchall()
+            if self.politica != "nenhum":
+                rows += self._irmaos(conn, rows, agora)
+            conn.executemany(
+                "UPDATE fila_envios SET status = 'enviando', travado_em = ? WHERE id = ?",
+                [(agora, r["id"]) for r in rows],
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return [{**dict(r), "params": json.loads(r["params"])} for r in rows]
+
+    def _irmaos(self, conn: sqlite3.Connection, rows: List[sqlite3.Row], agora: float) -> List[sqlite3.Row]:
+        """pendentes agrupáveis com o mesmo telefone e template dos já reservados."""
+        ids = {r["id"] for r in rows}
+        chaves = {(r["telefone"], r["template"]) for r in rows if agrupamento.agrupavel(dict(r), self.politica)}
+        irmaos = []
+        for telefone, template in chaves:
+            for r in conn.execute("""
+                SELECT * FROM fila_envios
+                 WHERE telefone = ? AND template = ? AND status = 'pendente' AND proxima_em <= ?
+                 ORDER BY proxima_em
+            """, (telefone, template, agora + self.janela)):
+                if r["id"] not in ids and agrupamento.agrupavel(dict(r), self.politica):
+                    ids.add(r["id"])
+                    irmaos.append(r)
+        return irmaos
+
+    def concluir(self, envio_id: int) -> None:
+        self._conn().execute("DELETE FROM fila_envios WHERE id = ?", (envio_id,))
+
+    def falhar(self, envio: Dict[str, Any], erro: str, permanente: bool = False) -> None:
+        """reagenda com backoff ou move para envios_mortos."""
+        tentativas = envio["tentativas"] + 1
+        conn = self._conn()
+        if permanente or tentativas >= MAX_TENTATIVAS:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("""
+                    INSERT INTO envios_mortos (template, telefone, params, link, responsavel, paciente, consulta,
+                                               tentativas, erro, criado_em, morto_em)
+                    SELECT template, telefone, params, link, responsavel, paciente, consulta, ?, ?, criado_em, ?
+                      FROM fila_envios WHERE id = ?
+                """, (tentativas, erro, time.time(), envio["id"]))
+                conn.execute("DELETE FROM fila_envios WHERE id = ?", (envio["id"],))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            logger.error("Envio %s (%s -> %s) foi para mortos: %s", envio["id"], envio["template"], envio["telefone"], erro)
+            return
+
+        espera = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (tentativas - 1))
+        conn.execute(
+            "UPDATE fila_envios SET status = 'pendente', tentativas = ?, proxima_em = ?, ultimo_erro = ?, travado_em = NULL"
+            " WHERE id = ?",
+            (tentativas, time.time() + espera, erro, envio["id"]),
+        )
+        logger.warning("Envio %s falhou (%s); nova tentativa em %.0fs", envio["id"], erro, espera)
+
+    def liberar(self, ids: List[int], espera: float = BACKOFF_BASE) -> int:
+        """devolve para 'pendente' (daqui a `espera` s) os envios reservados que não foram concluídos nem reagendados."""
+        if not ids:
+            return 0
+        cur = self._conn().execute(
+            f"UPDATE fila_envios SET status = 'pendente', travado_em = NULL, proxima_em = ?"
+            f" WHERE status = 'enviando' AND id IN ({','.join('?' * len(ids))})",
+            (time.time() + espera, *ids),
+        )
+        return cur.rowcount
+
+    def aguardar_novos(self, timeout: float) -> None:
+        self._novos.wait(timeout)
+        self._novos.clear()
+
+    # -------------------- mortos / inspeção --------------------
+    def listar_mortos(self) -> List[Dict[str, Any]]:
+        rows = self._conn().execute("SELECT * FROM envios_mortos ORDER BY id").fetchall()
+        return [dict(r) for r in rows]
+
+    def reprocessar_mortos(self, ids: Optional[List[int]] = None) -> int:
+        """devolve envios mortos para a fila, zerando tentativas."""
+        filtro, args = ("", ()) if ids is None else (
+            f" WHERE id IN ({','.join('?' * len(ids))})", tuple(ids))
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            cur = conn.execute(f"""
+                INSERT INTO fila_envios (template, telefone, params, link, responsavel, paciente, consulta, proxima_em, criado_em)
+                SELECT template, telefone, params, link, responsavel, paciente, consulta, ?, criado_em FROM envios_mortos{filtro}
+            """, (time.time(), *args))
+            conn.execute(f"DELETE FROM envios_mortos{filtro}", args)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self._novos.set()
+        return cur.rowcount
+
+    def contagem(self) -> Dict[str, int]:
+        conn = self._conn()
+        res = {r["status"]: r["n"] for r in conn.execute(
+            "SELECT status, COUNT(*) AS n FROM fila_envios GROUP BY status")}
+        res["mortos"] = conn.execute("SELECT COUNT(*) FROM envios_mortos").fetchone()[0]
+        return res
+
+# -------------------- workers --------------------
+class WorkerFila:
+    """
+    Pool de threads que esvazia a fila.
+    Cada worker pega até `lote` envios: um vai por enviar_template, vários por
+    enviar_templates_lote. Quando o paciente recebe, o responsável (se ativo)
+    entra na fila — mesma regra de enviar_para_paciente_e_responsavel.
+    """
+
+    def __init__(self, fila: FilaEnvios, workers: int = 4, lote: int = 20, intervalo: float = 1.0):
+        self.fila = fila
+        self.workers = workers
+        self.lote = lote
+        self.intervalo = intervalo
+        self._parar = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> None:
+        for i in range(self.workers):
+            t = threading.Thread(target=self._loop, name=f"fila-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self, timeout: float = 10) -> None:
+        self._parar.set()
+        self.fila._novos.set()
+        for t in self._threads:
+            t.join(timeout)
+
+    def _loop(self) -> None:
+        while not self._parar.is_set():
+            try:
+                envios = self.fila.reservar(self.lote)
+            except sqlite3.OperationalError as e:
+                logger.warning("Fila ocupada: %s", e)
+                envios = []
+            if not envios:
+                self.fila.aguardar_novos(self.intervalo)
+                continue
+            try:
+                self.processar(envios)
+            except Exception:
+                # sem isso a thread morre e os envios reservados só voltam depois do LEASE
+                logger.exception("Erro no worker da fila com %d envios; devolvendo para a fila", len(envios))
+                try:
+                    self.fila.liberar([e["id"] for e in envios])
+                except Exception as e:
+                    logger.error("Não consegui devolver os envios (voltam após FILA_LEASE): %s", e)
+
+    @perfil.medido("fila.processar")
+    def processar(self, envios: List[Dict[str, Any]]) -> None:
+        grupos = agrupamento.agrupar(envios, self.fila.politica)
+        mensagens = [agrupamento.mensagem(grupo) for grupo in grupos]
+        if len(mensagens) == 1:
+            try:
+                resultados = [{"ok": True, "resposta": enviar_template(*mensagens[0]), "erro": None, "excecao": None}]
+            except Exception as exc:
+                resultados = [{"ok": False, "resposta": None, "erro": str(exc) or type(exc).__name__, "excecao": exc}]
+        else:
+            resultados = enviar_templates_lote(mensagens)
+
+        enviados = []
+        for grupo, r in zip(grupos, resultados):
+            if len(grupo) > 1 and r["ok"]:
+                AGRUPADOS.inc(len(grupo), template=grupo[0]["template"])
+                logger.info("Enviado %s (%d lembretes %s) para %s", agrupamento.TEMPLATE_AGRUPADO,
+                            len(grupo), grupo[0]["template"], grupo[0]["telefone"])
+            for envio in grupo:
+                if r["ok"]:
+                    self._sucesso(envio)
+                else:
+                    self.fila.falhar(envio, r["erro"], permanente=erro_permanente(r.get("excecao")))
+            if r["ok"]:
+                # um wamid por mensagem: o status de entrega fica no primeiro lembrete do grupo
+                envio = grupo[0]
+                enviados.append((wamid_da_resposta(r["resposta"]), envio["template"], envio["telefone"],
+                                 envio["paciente"], envio["consulta"]))
+        if enviados:
+            try:
+                get_status_envios().registrar_envios(enviados)
+            except Exception as e:
+                logger.error("Falha ao registrar status de %d envios: %s", len(enviados), e)
+
+    def _sucesso(self, envio: Dict[str, Any]) -> None:
+        self.fila.concluir(envio["id"])
+        logger.info("Enviado %s para %s", envio["template"], envio["telefone"],
+                    extra={"template": envio["template"], "telefone": envio["telefone"], "paciente": envio["paciente"]})
+
+        responsavel = envio["responsavel"]
+        if not responsavel or responsavel == envio["telefone"]:
+            return  # sem responsável ou com o mesmo número do paciente, que já recebeu
+        if get_storage().responsavel_ativo(envio["telefone"]):
+            self.fila.enfileirar(envio["template"], responsavel, envio["params"], envio["link"],
+                                 paciente=envio["paciente"], consulta=envio["consulta"])
+        else:
+            logger.warning("Responsável %s desativado — lembrete não enviado.", responsavel)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fila de envios do WhatsApp.")
+    parser.add_argument("--db", default=str(FILA_DB))
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("status", help="quantidade de envios por estado")
+    sub.add_parser("mortos", help="lista os envios que falharam de vez")
+    rep = sub.add_parser("reprocessar", help="devolve envios mortos para a fila")
+    rep.add_argument("ids", nargs="*", type=int)
+    rep.add_argument("--todos", action="store_true")
+    args = parser.parse_args()
+
+    fila = FilaEnvios(Path(args.db))
+    if args.cmd == "status":
+        print(fila.contagem())
+    elif args.cmd == "mortos":
+        for m in fila.listar_mortos():
+            print(f"#{m['id']} {m['template']} -> {m['telefone']} | tentativas={m['tentativas']} | {m['erro']}")
+    elif args.cmd == "reprocessar":
+        if not args.ids and not args.todos:
+            parser.error("informe ids ou --todos")
+        n = fila.reprocessar_mortos(None if args.todos else args.ids)
+        print(f"♻️ {n} envios devolvidos para a fila (o scheduler envia na próxima rodada)")
@@ -0,0 +1,94 @@
+# src/fila_test.py
+# Fila de saída: retentativa com backoff, mortos e worker que sobrevive a erro.
+#   python -m pytest src/fila_test.py
+import threading, time
+
+import pytest
+
+import fila
+from fila import FilaEnvios, WorkerFila
+from whatsapp import WhatsAppError
+
+@pytest.fixture
+def f(tmp_path):
+    return FilaEnvios(tmp_path / "fila.db", politica="nenhum")
+
+def _um(f):
+    f.enfileirar("lembrete_24h", "5511900000001", ["Ana", "10/01/2030, quinta-feira", "09:00"])
+    envios = f.reservar(10)
+    assert len(envios) == 1 and f.contagem() == {"enviando": 1, "mortos": 0}
+    return envios[0]
+
+def test_falha_temporaria_reagenda_com_backoff(f):
+    envio = _um(f)
+    antes = time.time()
+    f.falhar(envio, "HTTP 500")
+
+    assert f.contagem() == {"pendente": 1, "mortos": 0}
+    assert f.reservar(10) == []  # ainda no backoff
+    row = f._conn().execute("SELECT tentativas, proxima_em, ultimo_erro FROM fila_envios").fetchone()
+    assert row["tentativas"] == 1 and row["ultimo_erro"] == "HTTP 500"
+    assert row["proxima_em"] >= antes + fila.BACKOFF_BASE
+
+def test_esgotou_tentativas_vai_para_mortos_e_volta(f):
+    envio = _um(f)
+    envio["tentativas"] = fila.MAX_TENTATIVAS - 1
+    f.falhar(envio, "HTTP 503")
+
+    assert f.contagem() == {"mortos": 1}
+    morto, = f.listar_mortos()
+    assert (morto["telefone"], morto["tentativas"], morto["erro"]) == ("5511900000001", fila.MAX_TENTATIVAS, "HTTP 503")
+    assert f.reprocessar_mortos() == 1
+    assert f.contagem() == {"pendente": 1, "mortos": 0}
+
+def test_erro_permanente_nao_repete(f):
+    envio = _um(f)
+    erro = WhatsAppError("HTTP 400", status=400, code=132000)
+    f.falhar(envio, str(erro), permanente=fila.erro_permanente(erro))
+    assert f.contagem() == {"mortos": 1}
+    assert not fila.erro_permanente(WhatsAppError("HTTP 429", status=429, code=130429))
+
+def test_morto_com_erro_desfaz_transacao(f):
+    envio = _um(f)
+    f._conn().execute("DROP TABLE envios_mortos")
+    with pytest.raises(Exception):
+        f.falhar(envio, "x", permanente=True)
+
+    assert not f._conn().in_transaction
+    assert f._conn().execute("SELECT status FROM fila_envios").fetchone()["status"] == "enviando"
+
+def test_reprocessar_com_erro_desfaz_transacao(f):
+    envio = _um(f)
+    f.falhar(envio, "x", permanente=True)
+    f._conn().execute("CREATE TRIGGER falha BEFORE DELETE ON envios_mortos BEGIN SELECT RAISE(ABORT, 'disco'); END")
+    with pytest.raises(Exception, match="disco"):
+        f.reprocessar_mortos()
+
+    assert not f._conn().in_transaction
+    assert f.contagem() == {"mortos": 1}  # o INSERT na fila foi desfeito junto
+    f._conn().execute("DROP TRIGGER falha")
+    assert f.reprocessar_mortos() == 1  # a conexão continua aceitando BEGIN
+
+def test_worker_sobrevive_a_erro_e_devolve_o_lote(f, monkeypatch):
+    chamadas = []
+    errou = threading.Event()
+
+    def processar(envios):
+        chamadas.append([e["id"] for e in envios])
+        errou.set()
+        raise RuntimeError("storage fora do ar")
+    worker = WorkerFila(f, workers=1, intervalo=0.05)
+    monkeypatch.setattr(worker, "processar", processar)
+    _id = f.enfileirar("lembrete_24h", "5511900000001", ["Ana", "10/01/2030, quinta-feira", "09:00"])
+    worker.start()
+    try:
+        assert errou.wait(5)
+        for _ in range(100):
+            if f.contagem().get("pendente"):
+                break
+            time.sleep(0.02)
+        assert chamadas == [[_id]]
+        assert f.contagem() == {"pendente": 1, "mortos": 0}  # devolvido, não preso em 'enviando' até o LEASE
+        assert all(t.is_alive() for t in worker._threads)
+    finally:
+        worker.stop(2)
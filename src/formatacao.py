@@ -0,0 +1,33 @@
+# src/formatacao.py
+from datetime import date, datetime
+from functools import lru_cache
+from typing import Tuple
+
+# sem locale: setlocale é global ao processo e não é thread-safe
+DIAS_SEMANA = ("segunda-feira", "terça-feira", "quarta-feira", "quinta-feira",
+               "sexta-feira", "sábado", "domingo")
+
+@lru_cache(maxsize=4096)
+def _data(d: date) -> Tuple[str, str]:
+    return f"{d.day:02d}/{d.month:02d}/{d.year:04d}", DIAS_SEMANA[d.weekday()]
+
+@lru_cache(maxsize=4096)
+def data_amigavel(d: date) -> str:
+    """ex.: 15/09/2025, segunda-feira"""
+    data_br, dia_semana = _data(d)
+    return f"{data_br}, {dia_semana}"
+
+@lru_cache(maxsize=1440)
+def hora_br(hora: int, minuto: int) -> str:
+    return f"{hora:02d}:{minuto:02d}"
+
+@lru_cache(maxsize=65536)
+def parse_data_hora(data_str: str, hora_str: str) -> datetime:
+    """aceita "15/09/2025" ou "15/09/2025, segunda-feira" + "15:00"."""
+    data_somente = data_str.split(",")[0].strip()
+    return datetime.strptime(f"{data_somente} {hora_str}", "%d/%m/%Y %H:%M")
+
+def fmt_data_hora_ptbr(dt: datetime) -> Tuple[str, str, str]:
+    """retorna (data_br, dia_semana, hora_br)"""
+    data_br, dia_semana = _data(dt.date())
+    return data_br, dia_semana, hora_br(dt.hour, dt.minute)
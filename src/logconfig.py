@@ -0,0 +1,160 @@
+# src/logconfig.py
+# Logging compartilhado por webhook, webhook_asgi, scheduler e demo_scheduler.
+import os, sys, json, queue, atexit, logging, threading
+import logging.handlers
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List
+import config  # carrega o .env antes de ler o ambiente
+
+config.carregar_env()
+
+LOG_DIR      = Path(os.getenv("LOG_DIR", "logs"))
+LOG_NIVEL    = os.getenv("LOG_NIVEL", "INFO").strip().upper()
+LOG_FORMATO  = os.getenv("LOG_FORMATO", "json").strip().lower()        # json | texto (arquivo)
+LOG_TERMINAL = os.getenv("LOG_TERMINAL", "1") != "0"
+LOG_ROTACAO  = os.getenv("LOG_ROTACAO", "tamanho").strip().lower()     # tamanho | diaria | nenhuma
+LOG_MAX_MB   = float(os.getenv("LOG_MAX_MB", "20"))
+LOG_BACKUPS  = int(os.getenv("LOG_BACKUPS", "7"))
+LOG_FILA_MAX = int(os.getenv("LOG_FILA_MAX", "10000"))
+
+# dumps de alto volume: 1 a cada N registros marcados com extra={"amostra": chave}
+AMOSTRAGEM = {"eventos": int(os.getenv("LOG_AMOSTRA_EVENTOS", "100"))}
+
+TEXTO = "%(asctime)s [%(levelname)s] %(message)s"
+
+# atributos padrão do LogRecord; o resto (extra=...) vira campo no JSON
+_PADRAO = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "amostra"}
+
+class JsonLinhas(logging.Formatter):
+    """um objeto JSON por linha: ts, nivel, logger, msg, campos de extra e exc."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        linha: Dict[str, Any] = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "nivel": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for chave, valor in vars(record).items():
+            if chave not in _PADRAO:
+                linha[chave] = valor
+        if record.exc_info:
+            linha["exc"] = self.formatException(record.exc_info)
+        return json.dumps(linha, ensure_ascii=False, default=str)
+
+class Json:
+    """argumento preguiçoso: só vira JSON se a linha for mesmo escrita (no listener)."""
+
+    __slots__ = ("dados",)
+
+    def __init__(self, dados: Any):
+        self.dados = dados
+
+    def __str__(self) -> str:
+        return json.dumps(self.dados, ensure_ascii=False)
+
+class FiltroAmostragem(logging.Filter):
+    """deixa passar 1 a cada N registros com extra={"amostra": chave}; os demais nem entram na fila."""
+
+    def __init__(self, taxas: Dict[str, int]):
+        super().__init__()
+        self.taxas = taxas
+        self._contagem: Dict[str, int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        chave = getattr(record, "amostra", None)
+        if chave is None:
+            return True
+        n = self.taxas.get(chave, 1)
+        if n <= 1:
+            return True
+        i = self._contagem.get(chave, 0)
+        self._contagem[chave] = i + 1  # corrida entre threads só desloca a amostra
+        return i % n == 0
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """
+    Enfileira o LogRecord sem formatar: msg % args, JSON e traceback
+    são montados na thread do listener, fora do caminho de envio.
+    Fila cheia descarta (e conta) em vez de bloquear quem loga; quando a fila
+    volta a andar, uma linha de aviso registra quantas se perderam.
+    """
+
+    descartados = 0
+
+    def __init__(self, fila):
+        super().__init__(fila)
+        self._perdidos = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            if self._perdidos:
+                aviso = logging.makeLogRecord({"name": record.name, "levelno": logging.WARNING, "levelname": "WARNING",
+                                               "msg": "%d linhas de log descartadas (fila de log cheia)",
+                                               "args": (self._perdidos,)})
+                self.queue.put_nowait(aviso)
+                self._perdidos = 0
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self._perdidos += 1
+            _QueueHandler.descartados += 1
+
+_listeners: List[logging.handlers.QueueListener] = []
+_lock = threading.Lock()
+
+def _arquivo(path: Path) -> logging.Handler:
+    # várias instâncias no mesmo arquivo (uvicorn --workers): use LOG_ROTACAO=nenhuma e rotacione por fora
+    if LOG_ROTACAO == "diaria":
+        return logging.handlers.TimedRotatingFileHandler(path, when="midnight", backupCount=LOG_BACKUPS, encoding="utf-8")
+    if LOG_ROTACAO == "tamanho":
+        return logging.handlers.RotatingFileHandler(path, maxBytes=int(LOG_MAX_MB * 1024 * 1024),
+                                                    backupCount=LOG_BACKUPS, encoding="utf-8")
+    return logging.FileHandler(path, encoding="utf-8")
+
+def setup_logger(name: str, file_name: str, datefmt: str = None) -> logging.Logger:
+    """
+    logger com QueueHandler; uma thread (QueueListener) escreve no arquivo
+    (JSON lines, rotacionado) e no terminal. Chamadas repetidas devolvem o mesmo logger.
+    """
+    logger = logging.getLogger(name)
+    with _lock:
+        if logger.handlers:
+            return logger
+        logger.setLevel(LOG_NIVEL)
+        LOG_DIR.mkdir(exist_ok=True)
+
+        fh = _arquivo(LOG_DIR / file_name)
+        fh.setFormatter(JsonLinhas() if LOG_FORMATO == "json" else logging.Formatter(TEXTO, datefmt))
+        destinos: List[logging.Handler] = [fh]
+        if LOG_TERMINAL:
+            sh = logging.StreamHandler(sys.stderr)
+            sh.setFormatter(logging.Formatter(TEXTO, datefmt))
+            destinos.append(sh)
+
+        fila: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=LOG_FILA_MAX)
+        qh = _QueueHandler(fila)
+        qh.addFilter(FiltroAmostragem(AMOSTRAGEM))
+        logger.addHandler(qh)
+
+        listener = logging.handlers.QueueListener(fila, *destinos, respect_handler_level=True)
+        listener.start()
+        _listeners.append(listener)
+    return logger
+
+def descartados() -> int:
+    """registros perdidos com a fila de log cheia."""
+    return _QueueHandler.descartados
+
+@atexit.register
+def encerrar() -> None:
+    """esvazia as filas e fecha os arquivos (também roda na saída do processo)."""
+    with _lock:
+        while _listeners:
+            listener = _listeners.pop()
+            listener.stop()
+            for h in listener.handlers:
+                h.close()
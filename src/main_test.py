@@ -1,10 +1,12 @@
-from whatsapp import enviar_templates, WhatsAppError
+import os
+from whatsapp import enviar_template, WhatsAppError
 
-DESTINO = "5511919941208"
+# sem Meta: WHATSAPP_GRAPH_URL=http://127.0.0.1:8900 com benchmarks/graph_stub.py rodando
+DESTINO = os.getenv("TESTE_DESTINO", "5511919941208")
 
 def teste_lembrete():
     print("Enviando 'lembrete_consulta_v2'...")
-    resp = enviar_templates(
+    resp = enviar_template(
         "lembrete_consulta_v2",
         DESTINO,
         ["Matheus Moya de Oliveira", "12/09/2025", "18:00"],
@@ -14,7 +16,7 @@ def teste_lembrete():
 
 def teste_comecando():
     print("Enviando 'consulta_comecando'...")
-    resp = enviar_templates(
+    resp = enviar_template(
         "consulta_comecando",
         DESTINO,
         ["Matheus Moya de Oliveira", "18:00"],
@@ -0,0 +1,195 @@
+# src/metricas.py
+# Métricas no formato texto do Prometheus, sem dependência externa.
+# Webhooks expõem em GET /metrics; o scheduler numa porta própria (SCHEDULER_METRICAS_PORTA).
+import time, threading
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# segundos: chamadas HTTP (Graph, rota do webhook)
+BUCKETS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# segundos: atraso do disparo dos jobs em relação ao run_date
+BUCKETS_ATRASO = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0, 900.0)
+
+def _escapar(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _rotulos(nomes: Sequence[str], valores: Sequence[str], extra: str = "") -> str:
+    pares = [f'{n}="{_escapar(v)}"' for n, v in zip(nomes, valores)]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+def _numero(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if v != int(v) else str(int(v))
+
+class _Metrica:
+    tipo = "untyped"
+
+    def __init__(self, nome: str, ajuda: str, rotulos: Sequence[str] = ()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self._lock = threading.Lock()
+        self._valores: Dict[Tuple[str, ...], object] = {}
+
+    def _chave(self, rotulos: Dict[str, object]) -> Tuple[str, ...]:
+        if set(rotulos) != set(self.rotulos):
+            raise ValueError(f"{self.nome}: rótulos esperados {self.rotulos}, recebidos {tuple(rotulos)}")
+        return tuple(str(rotulos[n]) for n in self.rotulos)
+
+    def _amostras(self) -> List[str]:
+        with self._lock:
+            itens = list(self._valores.items())
+        return [f"{self.nome}{_rotulos(self.rotulos, k)} {_numero(v)}" for k, v in itens]
+
+    def exportar(self) -> List[str]:
+        return [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} {self.tipo}", *self._amostras()]
+
+class Contador(_Metrica):
+    """só cresce: envios, erros, requisições."""
+
+    tipo = "counter"
+
+    def inc(self, valor: float = 1.0, **rotulos) -> None:
+        chave = self._chave(rotulos)
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0.0) + valor
+
+class Medidor(_Metrica):
+    """
+    valor instantâneo (profundidade de fila, jobs pendentes).
+    `funcao` é chamada a cada coleta: devolve um número ou, com um rótulo,
+    um dict {valor_do_rótulo: número}.
+    """
+
+    tipo = "gauge"
+
+    def __init__(self, nome: str, ajuda: str, rotulos: Sequence[str] = (),
+                 funcao: Optional[Callable[[], object]] = None):
+        super().__init__(nome, ajuda, rotulos)
+        self.funcao = funcao
+
+    def definir(self, valor: float, **rotulos) -> None:
+        chave = self._chave(rotulos)
+        with self._lock:
+            self._valores[chave] = valor
+
+    def _amostras(self) -> List[str]:
+        if self.funcao is None:
+            return super()._amostras()
+        try:
+            valor = self.funcao()
+        except Exception:
+            return []  # coleta não derruba o /metrics
+        if isinstance(valor, dict):
+            return [f"{self.nome}{_rotulos(self.rotulos, (k,))} {_numero(v)}" for k, v in valor.items()]
+        return [f"{self.nome} {_numero(valor)}"]
+
+class Histograma(_Metrica):
+    """distribuição (latência, atraso): buckets cumulativos, soma e contagem."""
+
+    tipo = "histogram"
+
+    def __init__(self, nome: str, ajuda: str, rotulos: Sequence[str] = (),
+                 buckets: Sequence[float] = BUCKETS_LATENCIA):
+        super().__init__(nome, ajuda, rotulos)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observar(self, valor: float, **rotulos) -> None:
+        chave = self._chave(rotulos)
+        with self._lock:
+            serie = self._valores.get(chave)
+            if serie is None:
+                serie = self._valores[chave] = [[0] * len(self.buckets), 0.0, 0]
+            contagens = serie[0]
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    contagens[i] += 1
+                    break
+            serie[1] += valor
+            serie[2] += 1
+
+    @contextmanager
+    def cronometrar(self, **rotulos):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(time.perf_counter() - t0, **rotulos)
+
+    def _amostras(self) -> List[str]:
+        with self._lock:
+            itens = [(k, list(c), s, n) for k, (c, s, n) in self._valores.items()]
+        linhas = []
+        for chave, contagens, soma, n in itens:
+            acumulado = 0
+            for limite, c in zip(self.buckets, contagens):
+                acumulado += c
+                le = 'le="' + _numero(limite) + '"'
+                linhas.append(f"{self.nome}_bucket{_rotulos(self.rotulos, chave, le)} {acumulado}")
+            linhas.append(f"{self.nome}_sum{_rotulos(self.rotulos, chave)} {_numero(soma)}")
+            linhas.append(f"{self.nome}_count{_rotulos(self.rotulos, chave)} {n}")
+        return linhas
+
+# -------------------- registro --------------------
+_registro: Dict[str, _Metrica] = {}
+_registro_lock = threading.Lock()
+
+def _registrar(classe, nome: str, *args, **kwargs):
+    """mesma métrica pedida de novo (webhook.py e webhook_asgi.py no mesmo processo) volta a mesma instância."""
+    with _registro_lock:
+        metrica = _registro.get(nome)
+        if metrica is None:
+            metrica = _registro[nome] = classe(nome, *args, **kwargs)
+        elif not isinstance(metrica, classe):
+            raise ValueError(f"métrica {nome} já registrada como {metrica.tipo}")
+        return metrica
+
+def contador(nome: str, ajuda: str, rotulos: Sequence[str] = ()) -> Contador:
+    return _registrar(Contador, nome, ajuda, rotulos)
+
+def medidor(nome: str, ajuda: str, rotulos: Sequence[str] = (),
+            funcao: Optional[Callable[[], object]] = None) -> Medidor:
+    m = _registrar(Medidor, nome, ajuda, rotulos)
+    if funcao is not None:
+        m.funcao = funcao
+    return m
+
+def histograma(nome: str, ajuda: str, rotulos: Sequence[str] = (),
+               buckets: Sequence[float] = BUCKETS_LATENCIA) -> Histograma:
+    return _registrar(Histograma, nome, ajuda, rotulos, buckets)
+
+def exportar() -> str:
+    """todas as métricas do processo no formato texto do Prometheus."""
+    with _registro_lock:
+        metricas = list(_registro.values())
+    return "\n".join(linha for m in metricas for linha in m.exportar()) + "\n"
+
+# -------------------- servidor próprio (scheduler) --------------------
+def servir(porta: int, host: str = "0.0.0.0"):
+    """GET /metrics numa thread daemon; devolve o servidor (shutdown() para parar)."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer  # só o scheduler sobe porta própria
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            corpo = exportar().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(corpo)))
+            self.end_headers()
+            self.wfile.write(corpo)
+
+        def log_message(self, *args):
+            pass
+
+    servidor = ThreadingHTTPServer((host, porta), Handler)
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, name="metricas", daemon=True).start()
+    return servidor
@@ -0,0 +1,99 @@
+# src/pacientes_store.py
+import json, threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+BASE_DIR       = Path(__file__).resolve().parent
+PACIENTES_PATH = BASE_DIR / "pacientes.json"
+
+class PacientesStore:
+    """
+    Índice em memória do pacientes.json.
+    - o arquivo só é relido quando o mtime/tamanho muda (ou após invalidar())
+    - busca por telefone e por responsável em O(1)
+    """
+
+    def __init__(self, path: Path = PACIENTES_PATH):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._assinatura: Optional[Tuple[int, int]] = None
+        self._pacientes: List[Dict[str, Any]] = []
+        self._por_telefone: Dict[str, Dict[str, Any]] = {}
+        self._consultas_por_telefone: Dict[str, List[Dict[str, Any]]] = {}
+        self._por_responsavel: Dict[str, List[Dict[str, Any]]] = {}
+
+    def _assinatura_arquivo(self) -> Optional[Tuple[int, int]]:
+        try:
+            st = self.path.stat()
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def recarregar_se_mudou(self) -> None:
+        """relê o arquivo só se ele mudou desde a última leitura."""
+        assinatura = self._assinatura_arquivo()
+        if assinatura is None:
+            raise FileNotFoundError(str(self.path))
+        if assinatura == self._assinatura:
+            return
+
+        with self._lock:
+            if assinatura == self._assinatura:
+                return
+            pacientes = json.loads(self.path.read_text(encoding="utf-8"))
+
+            por_telefone: Dict[str, Dict[str, Any]] = {}
+            consultas_por_telefone: Dict[str, List[Dict[str, Any]]] = {}
+            por_responsavel: Dict[str, List[Dict[str, Any]]] = {}
+            for p in pacientes:
+                # mesmo critério do next(...) antigo: vale o primeiro registro do telefone
+                por_telefone.setdefault(p.get("telefone"), p)
+                consultas_por_telefone.setdefault(p.get("telefone"), []).append(p)
+                if p.get("responsavel"):
+                    por_responsavel.setdefault(p["responsavel"], []).append(p)
+
+            self._pacientes = pacientes
+            self._por_telefone = por_telefone
+            self._consultas_por_telefone = consultas_por_telefone
+            self._por_responsavel = por_responsavel
+            self._assinatura = assinatura
+
+    def invalidar(self) -> None:
+        """força releitura na próxima consulta (ex.: depois de salvar o arquivo)."""
+        with self._lock:
+            self._assinatura = None
+
+    # -------------------- consultas --------------------
+    def todos(self) -> List[Dict[str, Any]]:
+        self.recarregar_se_mudou()
+        return self._pacientes
+
+    def paciente(self, telefone: str) -> Optional[Dict[str, Any]]:
+        self.recarregar_se_mudou()
+        return self._por_telefone.get(telefone)
+
+    def consultas(self, telefone: str) -> List[Dict[str, Any]]:
+        """todos os registros (consultas) do telefone."""
+        self.recarregar_se_mudou()
+        return self._consultas_por_telefone.get(telefone, [])
+
+    def por_responsavel(self, responsavel: str) -> List[Dict[str, Any]]:
+        self.recarregar_se_mudou()
+        return self._por_responsavel.get(responsavel, [])
+
+    def responsavel_ativo(self, telefone: str) -> bool:
+        """se o paciente não existe, mantém o padrão antigo (ativo)."""
+        pac = self.paciente(telefone)
+        return pac.get("responsavel_ativo", True) if pac else True
+
+_stores: Dict[Path, PacientesStore] = {}
+_stores_lock = threading.Lock()
+
+def get_store(path: Path = PACIENTES_PATH) -> PacientesStore:
+    """store compartilhado por caminho (um índice por processo)."""
+    path = Path(path).resolve()
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = _stores[path] = PacientesStore(path)
+        return store
@@ -0,0 +1,193 @@
+# src/perfil.py
+# Modo de perfil (PERFIL=1 ou --perfil): tempo por etapa do plano, dos jobs e do
+# webhook, resumo no encerramento e, se pedidos, dumps do cProfile e de pilhas.
+import os, sys, time, atexit, cProfile, threading
+from collections import Counter
+from functools import wraps
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional
+import config  # carrega o .env antes de ler o ambiente
+
+config.carregar_env()
+
+LIGADO      = os.getenv("PERFIL", "0") == "1"
+DUMP        = os.getenv("PERFIL_DUMP", "")        # .prof do cProfile no plano (snakeviz, flameprof, gprof2dot)
+AMOSTRAS    = os.getenv("PERFIL_AMOSTRAS", "")    # pilhas "folded" de todas as threads (flamegraph.pl, speedscope)
+AMOSTRA_MS  = float(os.getenv("PERFIL_AMOSTRA_MS", "5"))
+
+_lock = threading.Lock()
+_etapas: Dict[str, List[float]] = {}   # nome -> [vezes, total s, máximo s]
+_NADA = nullcontext()
+_profiler: Optional[cProfile.Profile] = None
+_amostrador: Optional["Amostrador"] = None
+_encerrado = False
+
+def registrar(nome: str, segundos: float) -> None:
+    with _lock:
+        e = _etapas.get(nome)
+        if e is None:
+            _etapas[nome] = [1, segundos, segundos]
+        else:
+            e[0] += 1
+            e[1] += segundos
+            if segundos > e[2]:
+                e[2] = segundos
+
+class _Etapa:
+    __slots__ = ("nome", "t0")
+
+    def __init__(self, nome: str):
+        self.nome = nome
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+
+    def __exit__(self, *exc):
+        registrar(self.nome, time.perf_counter() - self.t0)
+
+def etapa(nome: str):
+    """`with perfil.etapa("plano.agendar"):` — desligado, não mede nada."""
+    return _Etapa(nome) if LIGADO else _NADA
+
+def medido(nome: str) -> Callable:
+    """decorador: cada chamada da função conta como uma etapa `nome`."""
+    def decorar(func):
+        @wraps(func)
+        def medir(*args, **kwargs):
+            if not LIGADO:
+                return func(*args, **kwargs)
+            t0 = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                registrar(nome, time.perf_counter() - t0)
+        return medir
+    return decorar
+
+def iterar(nome: str, itens: Iterable) -> Iterable:
+    """mede o tempo de produzir cada item (leitura em streaming do storage)."""
+    if not LIGADO:
+        return itens
+    def gerar():
+        it = iter(itens)
+        while True:
+            t0 = time.perf_counter()
+            try:
+                item = next(it)
+            except StopIteration:
+                registrar(nome, time.perf_counter() - t0)
+                return
+            registrar(nome, time.perf_counter() - t0)
+            yield item
+    return gerar()
+
+@contextmanager
+def perfilar():
+    """cProfile na thread atual durante o bloco (com PERFIL_DUMP); acumula entre blocos."""
+    if _profiler is None:
+        yield
+        return
+    _profiler.enable()
+    try:
+        yield
+    finally:
+        _profiler.disable()
+
+# -------------------- amostras de pilha --------------------
+class Amostrador(threading.Thread):
+    """
+    a cada `intervalo` s guarda a pilha de todas as threads (tempo de parede, pega
+    também I/O e espera de lock). Sai no formato folded: "thread;f1;f2 contagem".
+    """
+
+    def __init__(self, intervalo: float):
+        super().__init__(name="perfil-amostras", daemon=True)
+        self.intervalo = intervalo
+        self.pilhas: Counter = Counter()
+        self._parar = threading.Event()
+
+    def run(self) -> None:
+        eu = threading.get_ident()
+        while not self._parar.wait(self.intervalo):
+            nomes = {t.ident: t.name for t in threading.enumerate()}
+            for tid, frame in sys._current_frames().items():
+                if tid == eu:
+                    continue
+                pilha = []
+                while frame is not None:
+                    c = frame.f_code
+                    pilha.append(f"{c.co_name} ({Path(c.co_filename).name}:{c.co_firstlineno})")
+                    frame = frame.f_back
+                pilha.append(nomes.get(tid, str(tid)).replace(";", ":"))
+                self.pilhas[";".join(reversed(pilha))] += 1
+
+    def parar(self) -> None:
+        self._parar.set()
+        self.join(5)
+
+    def salvar(self, path: Path) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            for pilha, n in self.pilhas.most_common():
+                f.write(f"{pilha} {n}\n")
+
+# -------------------- liga / resumo / encerra --------------------
+def ligar(dump: str = DUMP, amostras: str = AMOSTRAS) -> None:
+    """liga o perfil no processo (PERFIL=1 já liga na importação)."""
+    global LIGADO, DUMP, AMOSTRAS, _profiler, _amostrador
+    LIGADO, DUMP, AMOSTRAS = True, dump, amostras
+    if dump and _profiler is None:
+        _profiler = cProfile.Profile()
+    if amostras and _amostrador is None:
+        _amostrador = Amostrador(AMOSTRA_MS / 1000)
+        _amostrador.start()
+    atexit.unregister(_ao_sair)
+    atexit.register(_ao_sair)
+
+def dados() -> Dict[str, Dict[str, Any]]:
+    """{etapa: {vezes, total_s, media_ms, max_ms}} (GET /stats dos webhooks)."""
+    with _lock:
+        itens = [(nome, list(e)) for nome, e in _etapas.items()]
+    return {nome: {"vezes": int(n), "total_s": round(total, 4), "media_ms": round(total / n * 1000, 3),
+                   "max_ms": round(maximo * 1000, 3)} for nome, (n, total, maximo) in sorted(itens)}
+
+def resumo(prefixo: str = "") -> str:
+    """tabela das etapas que começam com `prefixo`, da que mais tomou tempo para a que menos."""
+    linhas = [(nome, d) for nome, d in dados().items() if nome.startswith(prefixo)]
+    if not linhas:
+        return ""
+    linhas.sort(key=lambda x: -x[1]["total_s"])
+    texto = [f"{'etapa':<28} {'vezes':>9} {'total s':>9} {'média ms':>10} {'máx ms':>9}"]
+    texto += [f"{nome:<28} {d['vezes']:>9} {d['total_s']:>9.3f} {d['media_ms']:>10.3f} {d['max_ms']:>9.2f}"
+              for nome, d in linhas]
+    return "\n".join(texto)
+
+def encerrar() -> List[str]:
+    """para o amostrador e grava os dumps pedidos; devolve os arquivos gravados."""
+    global _encerrado
+    if _encerrado:
+        return []
+    _encerrado = True
+    gravados = []
+    if _profiler is not None and DUMP:
+        _profiler.dump_stats(DUMP)
+        gravados.append(DUMP)
+    if _amostrador is not None and AMOSTRAS:
+        _amostrador.parar()
+        _amostrador.salvar(Path(AMOSTRAS))
+        gravados.append(AMOSTRAS)
+    return gravados
+
+def _ao_sair() -> None:
+    """processos sem encerramento próprio (webhooks): resumo no stderr ao sair."""
+    if _encerrado:
+        return
+    tabela = resumo()
+    gravados = encerrar()
+    if tabela:
+        print(f"\n⏱️ Perfil por etapa:\n{tabela}", file=sys.stderr)
+    for arquivo in gravados:
+        print(f"⏱️ Perfil gravado em {arquivo}", file=sys.stderr)
+
+if LIGADO:
+    ligar()
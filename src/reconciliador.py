@@ -0,0 +1,178 @@
+# src/reconciliador.py
+import logging, threading
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+
+# filho do logger do scheduler: herda arquivo e terminal dele
+logger = logging.getLogger("scheduler.reconciliador")
+
+Lembrete = Dict[str, Any]
+
+class Reconciliador:
+    """
+    Mantém os jobs em dia com a base de pacientes sem refazer o agendamento inteiro.
+    - acompanha storage.versao() por polling (mtime do JSON / registro de alterações do SQLite)
+    - com `fonte` (SQLite), sincroniza o banco quando o mtime do arquivo de pacientes muda
+    - com storage.mudancas(), replaneja só os telefones alterados; sem ela, a base inteira
+    - compara as consultas pela chave {telefone}_{consulta_iso}
+    - só mexe nos jobs das consultas novas, removidas ou alteradas
+    - com `filtro` (modo cluster), só as consultas dos shards deste nó
+    """
+
+    def __init__(self, storage, planejar: Callable[[Dict[str, Any]], List[Lembrete]],
+                 agenda, intervalo: float = 30.0, filtro: Optional[Callable[[Dict[str, Any]], bool]] = None,
+                 fonte: Optional[Path] = None):
+        """
+        agenda: AgendaPorJob/AgendaPorBucket do scheduler (agendar, remover, atualizar).
+        fonte: arquivo de pacientes a acompanhar; storage.sincronizar(fonte) quando ele muda.
+        """
+        self.storage = storage
+        self.planejar = planejar
+        self.agenda = agenda
+        self.intervalo = intervalo
+        self.filtro = filtro
+        self.fonte = Path(fonte) if fonte else None
+        self._marca_fonte = self._marca()  # o que já está no banco no início não é resincronizado
+        self._planos: Dict[str, List[Lembrete]] = {}
+        self._por_telefone: Dict[str, Set[str]] = {}
+        self._versao: Any = None
+        self._lock = threading.Lock()  # polling e troca de shards reconciliam de threads diferentes
+        self._parar = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def iniciar(self, planos: Dict[str, List[Lembrete]], versao: Any) -> None:
+        """estado inicial: o plano que o run() acabou de montar."""
+        with self._lock:
+            self._planos = {}
+            self._por_telefone = {}
+            self._guardar(planos)
+            self._versao = versao
+
+    def verificar(self) -> Optional[Dict[str, int]]:
+        """reconcilia se a base (ou o arquivo de pacientes) mudou desde a última olhada."""
+        with self._lock:
+            self._sincronizar_fonte()
+            versao = self.storage.versao()
+            if versao == self._versao:
+                return None
+            mudancas = self.storage.mudancas(self._versao) if self._versao is not None else None
+            if mudancas is None:
+                self._versao = versao
+                return self._reconciliar(self.storage.iterar_consultas(), 0.0)
+            self._versao, telefones = mudancas
+            consultas = (c for t in telefones for c in self.storage.consultas_do_telefone(t))
+            return self._reconciliar(consultas, 0.0, telefones)
+
+    def forcar(self, retomada: float = 0.0) -> Dict[str, int]:
+        """reconcilia já, mesmo sem mudança na base (os shards deste nó mudaram)."""
+        with self._lock:
+            self._versao = self.storage.versao()
+            return self._reconciliar(self.storage.iterar_consultas(), retomada)
+
+    def esquecer(self, descartar: Callable[[str], bool]) -> int:
+        """tira do plano e da agenda as consultas cujo telefone `descartar` aceita (shards perdidos)."""
+        with self._lock:
+            chaves = [chave for t, cs in self._por_telefone.items() if descartar(t) for chave in cs]
+            self.agenda.remover([l["id"] for chave in chaves for l in self._planos[chave]])
+            self._descartar(chaves)
+            return len(chaves)
+
+    def reconciliar(self, consultas: Iterable[Dict[str, Any]], retomada: float = 0.0) -> Dict[str, int]:
+        """`retomada`: agenda também os lembretes novos que venceram nos últimos `retomada` s."""
+        with self._lock:
+            return self._reconciliar(consultas, retomada)
+
+    def _reconciliar(self, consultas: Iterable[Dict[str, Any]], retomada: float,
+                     telefones: Optional[Set[str]] = None) -> Dict[str, int]:
+        """`telefones`: as consultas são só as desses telefones; o resto do plano fica como está."""
+        novos: Dict[str, List[Lembrete]] = {}
+        for p in consultas:
+            if self.filtro and not self.filtro(p):
+                continue
+            try:
+                lembretes = self.planejar(p)
+            except (KeyError, ValueError) as e:
+                logger.error("Consulta inválida ignorada (%s): %s", p.get("telefone"), e)
+                continue
+            novos[lembretes[0]["chave"]] = lembretes
+
+        now = datetime.now()
+        resumo = {"novas": 0, "removidas": 0, "alteradas": 0}
+
+        if telefones is None:
+            removidas = self._planos.keys() - novos.keys()
+        else:
+            removidas = {c for t in telefones for c in self._por_telefone.get(t, ())} - novos.keys()
+        self.agenda.remover([l["id"] for chave in removidas for l in self._planos[chave]])
+        resumo["removidas"] = len(removidas)
+
+        adicionar: List[Lembrete] = []
+        alterar: List[Lembrete] = []
+        for chave, lembretes in novos.items():
+            antigos = self._planos.get(chave)
+            if antigos is None:
+                adicionar += lembretes
+                resumo["novas"] += 1
+            elif [l["args"] for l in antigos] != [l["args"] for l in lembretes]:
+                alterar += lembretes
+                resumo["alteradas"] += 1
+        self.agenda.agendar(adicionar, now - timedelta(seconds=retomada))
+        self.agenda.atualizar(alterar)  # só o que ainda não disparou
+
+        if telefones is None:
+            self._planos, self._por_telefone = {}, {}
+        else:
+            self._descartar(removidas)
+        self._guardar(novos)
+        if any(resumo.values()):
+            logger.info("Reconciliação: %s", resumo)
+        return resumo
+
+    def _marca(self) -> Any:
+        if self.fonte is None:
+            return None
+        try:
+            st = self.fonte.stat()
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def _sincronizar_fonte(self) -> None:
+        """arquivo mudou: grava só a diferença no banco; as mudanças chegam por storage.mudancas()."""
+        marca = self._marca()
+        if marca is None or marca == self._marca_fonte:
+            return
+        n = self.storage.sincronizar(self.fonte)  # erro (arquivo pela metade): tenta de novo na próxima
+        self._marca_fonte = marca
+        logger.info("%s mudou: %d registros sincronizados", self.fonte, n)
+
+    def _guardar(self, planos: Dict[str, List[Lembrete]]) -> None:
+        self._planos.update(planos)
+        for chave in planos:
+            self._por_telefone.setdefault(chave.split("_", 1)[0], set()).add(chave)
+
+    def _descartar(self, chaves: Iterable[str]) -> None:
+        for chave in chaves:
+            del self._planos[chave]
+            telefone = chave.split("_", 1)[0]
+            self._por_telefone[telefone].discard(chave)
+            if not self._por_telefone[telefone]:
+                del self._por_telefone[telefone]
+
+    # -------------------- thread de polling --------------------
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._loop, name="reconciliador", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._parar.set()
+        if self._thread:
+            self._thread.join(5)
+
+    def _loop(self) -> None:
+        while not self._parar.wait(self.intervalo):
+            try:
+                self.verificar()
+            except Exception as e:
+                logger.exception("Erro na reconciliação: %s", e)
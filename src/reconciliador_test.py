@@ -0,0 +1,123 @@
+# src/reconciliador_test.py
+# Reconciliador sobre o SQLite: mudança vista de qualquer thread e replanejamento só do que mudou.
+#   python -m pytest src/reconciliador_test.py
+import json, os, threading
+
+import pytest
+
+from reconciliador import Reconciliador
+from storage import SQLiteStorage
+
+def _paciente(i, hora="09:00", nome=None):
+    return {"nome": nome or f"P{i}", "telefone": f"55119000{i:05d}", "responsavel": None,
+            "data": "10/01/2030", "hora": hora, "link": None}
+
+class Agenda:
+    def __init__(self):
+        self.agendados, self.removidos, self.atualizados = [], [], []
+
+    def agendar(self, lembretes, desde):
+        self.agendados += [l["id"] for l in lembretes]
+
+    def remover(self, ids):
+        self.removidos += list(ids)
+
+    def atualizar(self, lembretes):
+        self.atualizados += [l["id"] for l in lembretes]
+
+def _reconciliador(storage, fonte=None):
+    """reconciliador já iniciado com o plano da base; devolve (rec, agenda, telefones replanejados)."""
+    planejados = []
+
+    def planejar(p):
+        planejados.append(p["telefone"])
+        chave = f"{p['telefone']}_{p['data']}T{p['hora']}"
+        return [{"id": f"{chave}_24h", "chave": chave, "args": [p["nome"], p["telefone"]]}]
+    agenda = Agenda()
+    rec = Reconciliador(storage, planejar, agenda, fonte=fonte)
+    rec.iniciar({l[0]["chave"]: l for l in map(planejar, storage.iterar_consultas())}, storage.versao())
+    planejados.clear()
+    return rec, agenda, planejados
+
+@pytest.fixture
+def cenario(tmp_path):
+    storage = SQLiteStorage(tmp_path / "teste.db")
+    storage.importar(_paciente(i) for i in range(50))
+    return (storage, *_reconciliador(storage))
+
+def _em_thread(fn):
+    t = threading.Thread(target=fn)
+    t.start()
+    t.join()
+
+def test_mudanca_de_outra_thread_e_vista(cenario):
+    storage, rec, agenda, _ = cenario
+    assert rec.verificar() is None
+
+    _em_thread(lambda: storage.importar([_paciente(99)]))  # como o webhook ou um import externo
+    resumos = []
+    _em_thread(lambda: resumos.append(rec.verificar()))  # como a thread do reconciliador
+    assert resumos == [{"novas": 1, "removidas": 0, "alteradas": 0}]
+    assert agenda.agendados == ["5511900000099_10/01/2030T09:00_24h"]
+    assert rec.verificar() is None
+
+def test_so_replaneja_os_telefones_alterados(cenario):
+    storage, rec, agenda, planejados = cenario
+    storage.importar([_paciente(7, nome="Sete")])  # nome muda
+    storage.importar([_paciente(3)])               # nada muda: não conta como alteração
+    with storage._conn() as conn:
+        conn.execute("DELETE FROM consultas WHERE telefone = ?", ("5511900000012",))
+
+    assert rec.verificar() == {"novas": 0, "removidas": 1, "alteradas": 1}
+    assert planejados == ["5511900000007"]  # o 12 ficou sem consultas: nada a planejar
+    assert agenda.atualizados == ["5511900000007_10/01/2030T09:00_24h"]
+    assert agenda.removidos == ["5511900000012_10/01/2030T09:00_24h"]
+
+    storage.set_responsavel_ativo("x", False)  # pausa não muda o plano
+    assert rec.verificar() is None
+
+def test_historico_podado_reconcilia_tudo(cenario):
+    storage, rec, agenda, planejados = cenario
+    storage.importar([_paciente(60)])
+    with storage._conn() as conn:
+        conn.execute("DELETE FROM alteracoes")
+    assert storage.mudancas(0) is None
+
+    assert rec.verificar() == {"novas": 1, "removidas": 0, "alteradas": 0}
+    assert len(planejados) == 51
+
+def test_sincronizar_grava_so_o_que_mudou(tmp_path):
+    storage = SQLiteStorage(tmp_path / "teste.db")
+    pacientes = [_paciente(i) for i in range(100)]
+    storage.importar(pacientes)
+    versao = storage.versao()
+
+    pacientes[5] = _paciente(5, hora="10:00")
+    storage.importar(pacientes, sincronizar=True)
+    assert storage.mudancas(versao)[1] == {"5511900000005"}
+
+    versao = storage.versao()
+    storage.importar(pacientes, substituir=True)  # mesmo conteúdo: nada muda
+    assert storage.versao() == versao
+    assert len(storage.listar_consultas()) == 100
+
+def test_arquivo_de_pacientes_alterado_e_sincronizado(tmp_path):
+    storage = SQLiteStorage(tmp_path / "teste.db")
+    fonte = tmp_path / "pacientes.json"
+    pacientes = [_paciente(i) for i in range(50)]
+    fonte.write_text(json.dumps(pacientes), encoding="utf-8")
+    storage.sincronizar(fonte)
+    rec, agenda, planejados = _reconciliador(storage, fonte)
+    assert rec.verificar() is None  # arquivo igual ao do início: não sincroniza
+
+    pacientes[3] = _paciente(3, hora="11:00")  # consulta remarcada
+    del pacientes[10]
+    pacientes.append(_paciente(70))
+    fonte.write_text(json.dumps(pacientes), encoding="utf-8")
+    os.utime(fonte, ns=(1, 1))  # mtime diferente mesmo em sistema de arquivos de baixa resolução
+
+    assert rec.verificar() == {"novas": 2, "removidas": 2, "alteradas": 0}
+    assert sorted(planejados) == ["5511900000003", "5511900000070"]
+    assert sorted(agenda.agendados) == ["5511900000003_10/01/2030T11:00_24h", "5511900000070_10/01/2030T09:00_24h"]
+    assert sorted(agenda.removidos) == ["5511900000003_10/01/2030T09:00_24h", "5511900000010_10/01/2030T09:00_24h"]
+    assert rec.verificar() is None
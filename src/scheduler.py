@@ -1,136 +1,643 @@
-import time, json, locale, logging
+import os, time, argparse
 from pathlib import Path
 from datetime import datetime, timedelta
-from apscheduler.schedulers.background import BackgroundScheduler
-from whatsapp import enviar_template
+import config  # primeiro: carrega o .env antes das constantes dos outros módulos
+from whatsapp import enviar_template, enviar_templates_lote
+from storage import SQLiteStorage, get_storage
+from pacientes_store import PACIENTES_PATH
+import formatacao
+import templates
+from fila import FilaEnvios, WorkerFila
+from reconciliador import Reconciliador
+from cluster import NO, SHARDS, Cluster
+from carga import Relatorio
+from suavizacao import MPS as SUAVIZAR_MPS, Suavizador
+import perfil
+from status_envios import get_status_envios, wamid_da_resposta
+from logconfig import setup_logger
+from metricas import BUCKETS_ATRASO, contador, histograma, medidor, servir
 
-# -------------------- logging --------------------
-def setup_logger(name: str, file_name: str) -> logging.Logger:
-    logs_dir = Path("logs")
-    logs_dir.mkdir(exist_ok=True)
-    logger = logging.getLogger(name)
-    logger.setLevel(logging.INFO)
-    if not logger.handlers:
-        fh = logging.FileHandler(logs_dir / file_name, encoding="utf-8")
-        sh = logging.StreamHandler()
-        fmt = logging.Formatter("%(asctime)s [%(levelname)s] %(message)s")
-        fh.setFormatter(fmt); sh.setFormatter(fmt)
-        logger.addHandler(fh); logger.addHandler(sh)
-    return logger
+config.carregar_env()
 
+# -------------------- logging --------------------
 logger = setup_logger("scheduler", "scheduler.log")
 
-# -------------------- helpers --------------------
-def fmt_data_hora_ptbr(dt: datetime):
-    """retorna (data_br, dia_semana, hora_br)"""
-    try:
-        locale.setlocale(locale.LC_TIME, "pt_BR.UTF-8")
-    except Exception:
-        for cand in ("pt_BR", "Portuguese_Brazil.1252"):
-            try:
-                locale.setlocale(locale.LC_TIME, cand)
-                break
-            except Exception:
-                pass
+BASE_DIR = Path(__file__).resolve().parent
 
-    dias = ["segunda-feira","terça-feira","quarta-feira","quinta-feira","sexta-feira","sábado","domingo"]
+# job store persistente: reinício não replaneja o que já está salvo
+# (em cluster, um arquivo por nó: jobs_{SCHEDULER_NO ou hostname}.db, o mesmo a cada reinício)
+JOBSTORE = os.getenv("SCHEDULER_JOBSTORE", "sqlite").strip().lower()   # sqlite | memoria
+JOBS_DB  = Path(os.getenv("SCHEDULER_JOBS_DB", BASE_DIR / (f"jobs_{NO}.db" if SHARDS else "jobs.db")))
 
-    try:
-        dia_semana = dt.strftime("%A").lower()
-    except Exception:
-        dia_semana = dias[dt.weekday()]
+# lembretes perdidos com o processo parado: ultimo | todos | nenhum
+CATCHUP = os.getenv("SCHEDULER_CATCHUP", "ultimo").strip().lower()
 
-    if dia_semana not in dias:
-        dia_semana = dias[dt.weekday()]
+# por_job: um job por lembrete | bucket: um job por minuto com os ids dos lembretes
+MODO = os.getenv("SCHEDULER_MODO", "por_job").strip().lower()
 
-    data_br = dt.strftime("%d/%m/%Y")
-    hora_br = dt.strftime("%H:%M")
-    return data_br, dia_semana, hora_br
+# de quantos em quantos segundos olhar se a base de pacientes mudou (0 = não olha)
+RECONCILIAR_S = float(os.getenv("SCHEDULER_RECONCILIAR_S", "30"))
 
-def enviar_para_paciente_e_responsavel(template, telefone, params, responsavel=None, link=None):
-    """envia ao paciente e, se ativo, ao responsável."""
+# com SQLite, arquivo de pacientes cujo mtime o reconciliador acompanha e sincroniza no banco ("" = nenhum)
+FONTE = os.getenv("SCHEDULER_FONTE", str(PACIENTES_PATH)).strip()
+
+# fila de saída persistente: jobs só enfileiram, workers enviam
+FILA_ATIVA   = os.getenv("FILA_ENVIOS", "1") != "0"
+FILA_WORKERS = int(os.getenv("FILA_WORKERS", "4"))
+_fila = None
+
+# modo cluster (SCHEDULER_SHARDS > 0): este nó só agenda e dispara os shards que tem
+_cluster = None
+
+# SCHEDULER_SUAVIZAR_MPS > 0: lembretes espalhados dentro da tolerância de cada template
+_suavizador = None
+
+# reenvio dos lembretes que o webhook marcou como failed (0 = desligado)
+REENVIO_MIN = float(os.getenv("SCHEDULER_REENVIO_MIN", "0"))
+REENVIO_MAX = int(os.getenv("SCHEDULER_REENVIO_MAX", "2"))   # envios por lembrete, contando o original
+
+# lembretes agendados por vez ao montar o plano (as consultas são lidas em streaming)
+LOTE_PLANO = int(os.getenv("SCHEDULER_LOTE_PLANO", "1000"))
+
+# GET /metrics (formato Prometheus) nesta porta (0 = desligado)
+METRICAS_PORTA = int(os.getenv("SCHEDULER_METRICAS_PORTA", "0"))
+
+# -------------------- métricas --------------------
+ATRASO_JOB = histograma("scheduler_job_atraso_segundos", "quanto depois do run_date o APScheduler disparou o job",
+                        ("tipo",), BUCKETS_ATRASO)
+JOBS = contador("scheduler_jobs_total", "jobs por resultado (executado, erro, perdido)", ("tipo", "resultado"))
+JOBS_PENDENTES = medidor("scheduler_jobs_pendentes", "jobs agendados que ainda não dispararam")
+FILA_ENVIOS = medidor("fila_envios", "envios na fila de saída por estado", ("estado",))
+
+def _tipo_do_job(job_id):
+    """rótulo de cardinalidade baixa: template (por_job), 'bucket' ou o id dos jobs fixos."""
+    if job_id.startswith("bucket_"):
+        return "bucket"
+    partes = job_id.split("_", 1)
+    if len(partes) == 2 and "_" in partes[1]:
+        return partes[1].rsplit("_", 1)[0]  # {telefone}_{template}_{consulta_iso}
+    return job_id
+
+def instrumentar(scheduler, fila=None):
+    """liga o listener de jobs e os medidores; sobe a porta de métricas se configurada."""
+    from apscheduler.events import EVENT_JOB_SUBMITTED, EVENT_JOB_EXECUTED, EVENT_JOB_ERROR, EVENT_JOB_MISSED
+    resultado_do_evento = {EVENT_JOB_EXECUTED: "executado", EVENT_JOB_ERROR: "erro", EVENT_JOB_MISSED: "perdido"}
+
+    def medir_job(evento):
+        """listener do APScheduler: atraso no disparo e resultado de cada job."""
+        tipo = _tipo_do_job(evento.job_id)
+        if evento.code == EVENT_JOB_SUBMITTED:
+            quando = max(evento.scheduled_run_times)  # com coalesce, o último horário é o que vale
+            ATRASO_JOB.observar(max(0.0, (datetime.now(quando.tzinfo) - quando).total_seconds()), tipo=tipo)
+        else:
+            JOBS.inc(tipo=tipo, resultado=resultado_do_evento[evento.code])
+
+    scheduler.add_listener(medir_job, EVENT_JOB_SUBMITTED | EVENT_JOB_EXECUTED | EVENT_JOB_ERROR | EVENT_JOB_MISSED)
+    JOBS_PENDENTES.funcao = lambda: len(scheduler.get_jobs())
+    if fila is not None:
+        FILA_ENVIOS.funcao = fila.contagem
+    if METRICAS_PORTA:
+        servir(METRICAS_PORTA)
+        logger.info("Métricas em http://0.0.0.0:%d/metrics", METRICAS_PORTA)
+
+# -------------------- helpers --------------------
+def _registrar_status(envios):
+    """envios = [(resposta, template, telefone, paciente, consulta_iso), ...]"""
     try:
-        with open("src/pacientes.json", "r", encoding="utf-8") as f:
-            pacientes = json.load(f)
-    except FileNotFoundError:
-        logger.error("pacientes.json não encontrado.")
+        get_status_envios().registrar_envios([(wamid_da_resposta(r), *resto) for r, *resto in envios])
+    except Exception as e:
+        logger.error("Falha ao registrar status de %d envios: %s", len(envios), e)
+
+@perfil.medido("job.enviar")
+def enviar_para_paciente_e_responsavel(template, telefone, params, responsavel=None, link=None, consulta_iso=None):
+    """envia ao paciente e, se ativo, ao responsável."""
+    if _lembrete_obsoleto(template, consulta_iso) or not _pode_disparar(template, telefone, consulta_iso):
         return
 
     try:
-        enviar_template(template, telefone, params, link)
-        print(f"✅ Enviado {template} para paciente {telefone}")
-        logger.info(f"Enviado {template} para paciente {telefone} | params={params} | link={link}")
+        resposta = enviar_template(template, telefone, params, link)
+        _registrar_status([(resposta, template, telefone, telefone, consulta_iso)])
+        logger.info("Enviado %s para paciente %s", template, telefone,
+                    extra={"template": template, "telefone": telefone})
     except Exception as e:
-        logger.error(f"Falha ao enviar {template} para paciente {telefone}: {e}")
+        logger.error("Falha ao enviar %s para paciente %s: %s", template, telefone, e)
         return
 
-    if responsavel:
-        pac = next((p for p in pacientes if p.get("telefone") == telefone), None)
-        ativo = pac.get("responsavel_ativo", True) if pac else True
+    if responsavel and responsavel != telefone:  # mesmo número do paciente: já recebeu
+        try:
+            ativo = get_storage().responsavel_ativo(telefone)
+        except FileNotFoundError:
+            logger.error("pacientes.json não encontrado.")
+            return
         if ativo:
             try:
-                enviar_template(template, responsavel, params, link)
-                print(f"✅ Enviado {template} para responsável {responsavel}")
-                logger.info(f"Enviado {template} para responsável {responsavel} | params={params} | link={link}")
+                resposta = enviar_template(template, responsavel, params, link)
+                _registrar_status([(resposta, template, responsavel, telefone, consulta_iso)])
+                logger.info("Enviado %s para responsável %s", template, responsavel,
+                            extra={"template": template, "telefone": responsavel, "paciente": telefone})
             except Exception as e:
-                logger.error(f"Falha ao enviar {template} para responsável {responsavel}: {e}")
+                logger.error("Falha ao enviar %s para responsável %s: %s", template, responsavel, e)
         else:
-            print(f"⏸️ Responsável {responsavel} desativado — lembrete não enviado.")
-            logger.warning(f"Responsável {responsavel} desativado — lembrete não enviado.")
+            logger.warning("Responsável %s desativado — lembrete não enviado.", responsavel)
 
-# -------------------- agendador real --------------------
-def run():
-    with open("src/pacientes.json", "r", encoding="utf-8") as f:
-        pacientes = json.load(f)
-
-    scheduler = BackgroundScheduler()
-
-    now = datetime.now()
-    for p in pacientes:
-        nome        = p["nome"]
-        telefone    = p["telefone"]
-        responsavel = p.get("responsavel")
-        data_str    = p["data"]  # "15/09/2025" ou "15/09/2025, segunda-feira"
-        hora_str    = p["hora"]
-        link        = p.get("link")
-
-        # parse seguro
-        data_somente = data_str.split(",")[0].strip()
-        consulta_dt  = datetime.strptime(f"{data_somente} {hora_str}", "%d/%m/%Y %H:%M")
-        data_br, dia_semana, hora_br = fmt_data_hora_ptbr(consulta_dt)
-        data_amigavel = f"{data_br}, {dia_semana}"
-
-        print(f"🗓️ {nome} ({telefone}) | {data_amigavel} às {hora_br}")
-        logger.info(f"Agendando {nome} | tel={telefone} | data={data_amigavel} | hora={hora_br}")
-
-        def agendar(delta, template, params, with_link=False):
-            run_at = consulta_dt - delta
+@perfil.medido("job.lote")
+def enviar_lote_pacientes_e_responsaveis(itens):
+    """
+    versão em lote de enviar_para_paciente_e_responsavel para jobs com o mesmo horário.
+    itens = [[template, telefone, params, responsavel, link, consulta_iso?], ...]
+    1ª rodada: pacientes; 2ª rodada: responsáveis ativos dos pacientes que receberam.
+    """
+    resultados = enviar_templates_lote([(t, tel, params, link) for t, tel, params, _, link, *_ in itens])
+
+    responsaveis, enviados = [], []
+    for (template, telefone, params, responsavel, link, *extra), r in zip(itens, resultados):
+        if not r["ok"]:
+            logger.error("Falha ao enviar %s para paciente %s: %s", template, telefone, r["erro"])
+            continue
+        consulta_iso = extra[0] if extra else None
+        enviados.append((r["resposta"], template, telefone, telefone, consulta_iso))
+        logger.info("Enviado %s para paciente %s", template, telefone,
+                    extra={"template": template, "telefone": telefone})
+        if not responsavel or responsavel == telefone:
+            continue
+        try:
+            ativo = get_storage().responsavel_ativo(telefone)
+        except FileNotFoundError:
+            logger.error("pacientes.json não encontrado.")
+            continue
+        if ativo:
+            responsaveis.append(((template, responsavel, params, link), (telefone, consulta_iso)))
+        else:
+            logger.warning("Responsável %s desativado — lembrete não enviado.", responsavel)
+
+    lote = [envio for envio, _ in responsaveis]
+    for ((template, responsavel, params, link), (telefone, consulta_iso)), r in zip(responsaveis, enviar_templates_lote(lote)):
+        if r["ok"]:
+            enviados.append((r["resposta"], template, responsavel, telefone, consulta_iso))
+            logger.info("Enviado %s para responsável %s", template, responsavel,
+                        extra={"template": template, "telefone": responsavel, "paciente": telefone})
+        else:
+            logger.error("Falha ao enviar %s para responsável %s: %s", template, responsavel, r["erro"])
+    if enviados:
+        _registrar_status(enviados)
+
+    logger.info("Lote de %d lembretes processado (%d responsáveis)", len(itens), len(responsaveis))
+
+@perfil.medido("job.enfileirar")
+def enfileirar_envio(template, telefone, params, responsavel=None, link=None, consulta_iso=None):
+    """job do modo fila: grava o envio na fila de saída e retorna na hora."""
+    if _lembrete_obsoleto(template, consulta_iso) or not _pode_disparar(template, telefone, consulta_iso):
+        return
+    _fila.enfileirar(template, telefone, params, link, responsavel, consulta=consulta_iso)
+    logger.info("%s para %s enfileirado", template, telefone)
+
+@perfil.medido("job.bucket")
+def disparar_bucket(ids):
+    """job do modo bucket: resolve os lembretes do minuto e despacha tudo junto."""
+    storage = get_storage()
+    if _cluster:
+        ids = _cluster.disparar(ids)
+    itens = []
+    for lembrete_id in ids:
+        args = _resolver_lembrete(storage, lembrete_id)
+        if args is None:
+            logger.warning("Lembrete %s não existe mais na base - ignorado.", lembrete_id)
+            continue
+        if _lembrete_obsoleto(args[0], args[5]):
+            continue
+        itens.append(args[:6])
+    if not itens:
+        return
+    if FILA_ATIVA:
+        _fila.enfileirar_varios(itens)
+        logger.info("%d lembretes enfileirados (bucket)", len(itens))
+    else:
+        enviar_lote_pacientes_e_responsaveis(itens)
+
+@perfil.medido("job.reenviar_falhas")
+def reenviar_falhas():
+    """
+    job periódico: reenvia os lembretes cujos envios falharam todos (status 'failed'
+    vindo do webhook), enquanto a consulta não passou e até REENVIO_MAX envios.
+    """
+    status = get_status_envios()
+    storage = get_storage()
+    reenviados = []
+    for f in status.falhas_para_reenvio(REENVIO_MAX):
+        if _cluster and not _cluster.meu(f["paciente"]):
+            continue  # outro nó cuida
+        args = _resolver_lembrete(storage, f"{f['paciente']}_{f['template']}_{f['consulta']}")
+        if args is None or _lembrete_obsoleto(f["template"], f["consulta"]):
+            status.marcar_reenviados(f["wamids"])
+            continue
+        template, _, params, _, link, consulta_iso = args
+        # só para quem falhou (paciente ou responsável), sem repetir a cascata
+        if FILA_ATIVA:
+            _fila.enfileirar(template, f["telefone"], params, link, paciente=f["paciente"], consulta=consulta_iso)
+        else:
+            try:
+                resposta = enviar_template(template, f["telefone"], params, link)
+                _registrar_status([(resposta, template, f["telefone"], f["paciente"], consulta_iso)])
+            except Exception as e:
+                logger.error("Falha ao reenviar %s para %s: %s", template, f["telefone"], e)
+        status.marcar_reenviados(f["wamids"])
+        reenviados.append(f["telefone"])
+    if reenviados:
+        logger.warning("Reenviados %d lembretes que falharam: %s", len(reenviados), reenviados)
+
+def _pode_disparar(template, telefone, consulta_iso):
+    """em cluster: o shard é deste nó e nenhum nó disparou este lembrete ainda."""
+    return _cluster is None or bool(_cluster.disparar([f"{telefone}_{template}_{consulta_iso}"]))
+
+def _resolver_lembrete(storage, lembrete_id):
+    """id {telefone}_{template}_{consulta_iso} -> args do envio, relendo a consulta na base."""
+    telefone = lembrete_id.split("_", 1)[0]
+    for p in storage.consultas_do_telefone(telefone):
+        try:
+            lembretes = planejar_consulta(p)
+        except (KeyError, ValueError):
+            continue
+        for lembrete in lembretes:
+            if lembrete["id"] == lembrete_id:
+                return lembrete["args"]
+    return None
+
+# -------------------- planejamento --------------------
+# lembretes de cada consulta, na ordem em que saem
+ANTECEDENCIAS = [
+    ("lembrete_48h",       timedelta(hours=48)),
+    ("lembrete_24h",       timedelta(hours=24)),
+    ("lembrete__1h",       timedelta(hours=1)),
+    ("consulta_comecando", timedelta(minutes=10)),
+]
+
+# até quando, em relação ao horário da consulta, um lembrete atrasado ainda vale
+TOLERANCIA_POS_CONSULTA = {"consulta_comecando": timedelta(minutes=15)}
+
+def _misfire_grace(template, run_at, consulta_dt):
+    """janela de recuperação: até o lembrete perder o sentido (ou 300s no modo 'nenhum')."""
+    if CATCHUP == "nenhum":
+        return 300
+    prazo = consulta_dt + TOLERANCIA_POS_CONSULTA.get(template, timedelta(0))
+    return max(300, int((prazo - run_at).total_seconds()))
+
+def _lembrete_obsoleto(template, consulta_iso, now=None):
+    """no modo 'ultimo', um lembrete atrasado é pulado se o próximo da sequência já venceu."""
+    if CATCHUP != "ultimo" or not consulta_iso:
+        return False
+    templates = [t for t, _ in ANTECEDENCIAS]
+    if template not in templates:
+        return False
+    consulta_dt = datetime.fromisoformat(consulta_iso)
+    now = now or datetime.now()
+    proximos = ANTECEDENCIAS[templates.index(template) + 1:]
+    if any(consulta_dt - delta <= now for _, delta in proximos):
+        logger.warning("Pulando %s atrasado (%s) - lembrete seguinte já venceu.", template, consulta_iso)
+        return True
+    return False
+
+def planejar_consulta(p):
+    """
+    lembretes de uma consulta: [{"id", "chave", "template", "run_at", "consulta_dt", "args"}, ...]
+    o id é determinístico ({telefone}_{template}_{consulta_iso}) para o job store persistente.
+    Parâmetros que o template não aceitaria levantam templates.TemplateInvalido aqui, não no envio.
+    """
+    nome        = p["nome"]
+    telefone    = p["telefone"]
+    responsavel = p.get("responsavel")
+    data_str    = p["data"]  # "15/09/2025" ou "15/09/2025, segunda-feira"
+    hora_str    = p["hora"]
+    link        = p.get("link")
+
+    # parse seguro (cacheado por data/hora)
+    with perfil.etapa("planejar.datas"):
+        consulta_dt   = formatacao.parse_data_hora(data_str, hora_str)
+        data_amigavel = formatacao.data_amigavel(consulta_dt.date())
+        hora_br       = formatacao.hora_br(consulta_dt.hour, consulta_dt.minute)
+        consulta_iso = consulta_dt.isoformat(timespec="minutes")
+
+    params = {
+        "lembrete_48h":       [nome, data_amigavel, hora_br],
+        "lembrete_24h":       [nome, data_amigavel, hora_br],
+        "lembrete__1h":       [nome, hora_br],
+        "consulta_comecando": [nome, hora_br],
+    }
+    lembretes = []
+    for template, delta in ANTECEDENCIAS:
+        link_botao = link if templates.obter(template).botao_url else None
+        with perfil.etapa("planejar.templates"):
+            templates.validar(template, params[template], link_botao)
+        lembretes.append({
+            "id": f"{telefone}_{template}_{consulta_iso}",
+            "chave": f"{telefone}_{consulta_iso}",
+            "template": template,
+            "run_at": consulta_dt - delta,
+            "consulta_dt": consulta_dt,
+            "args": [template, telefone, params[template], responsavel, link_botao, consulta_iso],
+        })
+    return lembretes
+
+def criar_scheduler():
+    """BackgroundScheduler com job store em SQLite (ou em memória, se SCHEDULER_JOBSTORE=memoria)."""
+    from apscheduler.schedulers.background import BackgroundScheduler  # o APScheduler só é importado aqui
+    if JOBSTORE == "memoria":
+        return BackgroundScheduler()
+    from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+    return BackgroundScheduler(jobstores={"default": SQLAlchemyJobStore(url=f"sqlite:///{JOBS_DB}")})
+
+class AgendaPorJob:
+    """um job 'date' do APScheduler por lembrete (4 por consulta)."""
+
+    def __init__(self, scheduler, job_func):
+        self.scheduler = scheduler
+        self.job_func = job_func
+
+    def existentes(self):
+        """ids de lembrete já agendados -> horário do disparo."""
+        return {job.id: _horario_do_job(job) for job in self.scheduler.get_jobs()}
+
+    def agendar(self, lembretes, now):
+        n = 0
+        for lembrete in lembretes:
+            template, telefone = lembrete["template"], lembrete["args"][1]
+            run_at = lembrete["run_at"]
             if run_at <= now:
-                logger.warning(f"Ignorando {template} para {telefone} - horário passado ({run_at}).")
-                return
-            scheduler.add_job(
-                enviar_para_paciente_e_responsavel, "date", run_date=run_at,
-                args=[template, telefone, params, responsavel, link if with_link else None],
-                misfire_grace_time=300, coalesce=True
+                logger.warning("Ignorando %s para %s - horário passado (%s).", template, telefone, run_at)
+                continue
+            self.scheduler.add_job(
+                self.job_func, "date", run_date=run_at, args=lembrete["args"],
+                id=lembrete["id"], replace_existing=True, coalesce=True,
+                misfire_grace_time=_misfire_grace(template, run_at, lembrete["consulta_dt"]),
             )
-            logger.info(f"Job {template} agendado para {run_at.isoformat()} | tel={telefone}")
+            logger.info("Job %s agendado para %s | tel=%s", template, run_at, telefone)
+            n += 1
+        return n
 
-        # 48h, 24h, 1h e 10 min antes
-        agendar(timedelta(hours=48), "lembrete_48h", [nome, data_amigavel, hora_br])
-        agendar(timedelta(hours=24), "lembrete_24h", [nome, data_amigavel, hora_br])
-        agendar(timedelta(hours=1),  "lembrete__1h", [nome, hora_br])
-        agendar(timedelta(minutes=10), "consulta_comecando", [nome, hora_br], with_link=True)
+    def remover(self, ids):
+        from apscheduler.jobstores.base import JobLookupError
+        for job_id in ids:
+            try:
+                self.scheduler.remove_job(job_id)
+            except JobLookupError:
+                pass
+        if _suavizador:
+            _suavizador.liberar(ids)
+
+    def atualizar(self, lembretes):
+        """troca os args dos jobs que ainda não dispararam."""
+        from apscheduler.jobstores.base import JobLookupError
+        for lembrete in lembretes:
+            try:
+                self.scheduler.modify_job(lembrete["id"], args=lembrete["args"])
+            except JobLookupError:
+                pass
+
+class AgendaPorBucket:
+    """
+    um job por minuto (bucket_{AAAA-MM-DDTHH:MM}) com a lista compacta dos ids de
+    lembrete que vencem nele; nome/link são relidos da base na hora do disparo.
+    """
+
+    job_func = "scheduler:disparar_bucket"
+
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+
+    @staticmethod
+    def bucket_id(run_at):
+        return f"bucket_{run_at:%Y-%m-%dT%H:%M}"
+
+    @staticmethod
+    def bucket_do_lembrete(lembrete_id):
+        suavizado = _suavizador and _suavizador.horario(lembrete_id)
+        if suavizado:
+            return AgendaPorBucket.bucket_id(suavizado)
+        template_iso = lembrete_id.split("_", 1)[1]
+        template, consulta_iso = template_iso.rsplit("_", 1)
+        delta = dict(ANTECEDENCIAS)[template]
+        return AgendaPorBucket.bucket_id(datetime.fromisoformat(consulta_iso) - delta)
+
+    def existentes(self):
+        ids = {}
+        for job in self.scheduler.get_jobs():
+            if job.id.startswith("bucket_"):
+                horario = _horario_do_job(job)
+                ids.update((lembrete_id, horario) for lembrete_id in job.args[0])
+        return ids
+
+    def agendar(self, lembretes, now):
+        por_bucket = {}
+        for lembrete in lembretes:
+            run_at = lembrete["run_at"]
+            if run_at <= now:
+                logger.warning("Ignorando %s para %s - horário passado (%s).",
+                               lembrete["template"], lembrete["args"][1], run_at)
+                continue
+            por_bucket.setdefault(self.bucket_id(run_at), []).append(lembrete)
+
+        n = 0
+        for bucket_id, itens in por_bucket.items():
+            run_at = itens[0]["run_at"].replace(second=0, microsecond=0)
+            grace = max(_misfire_grace(l["template"], run_at, l["consulta_dt"]) for l in itens)
+            job = self.scheduler.get_job(bucket_id)
+            ids = list(job.args[0]) if job else []
+            ja = set(ids)
+            ids += [l["id"] for l in itens if l["id"] not in ja]
+            if job:
+                job.modify(args=[ids], misfire_grace_time=max(grace, job.misfire_grace_time))
+            else:
+                self.scheduler.add_job(
+                    self.job_func, "date", run_date=run_at, args=[ids],
+                    id=bucket_id, coalesce=True, misfire_grace_time=grace,
+                )
+            n += len(itens)
+            logger.info("Bucket %s: %d lembretes", bucket_id, len(ids))
+        return n
+
+    def remover(self, ids):
+        por_bucket = {}
+        for lembrete_id in ids:
+            por_bucket.setdefault(self.bucket_do_lembrete(lembrete_id), set()).add(lembrete_id)
+        for bucket_id, remover in por_bucket.items():
+            job = self.scheduler.get_job(bucket_id)
+            if not job:
+                continue
+            restantes = [i for i in job.args[0] if i not in remover]
+            if restantes:
+                job.modify(args=[restantes])
+            else:
+                job.remove()
+        if _suavizador:
+            _suavizador.liberar(ids)
+
+    def atualizar(self, lembretes):
+        """nada a fazer: o bucket guarda só ids, os dados são lidos no disparo."""
+
+def _horario_do_job(job):
+    """run_date (sem fuso, como os run_at do plano) dos jobs 'date'; None nos periódicos."""
+    run_date = getattr(job.trigger, "run_date", None)
+    return run_date.replace(tzinfo=None) if run_date else None
+
+def criar_agenda(scheduler, job_func):
+    return AgendaPorBucket(scheduler) if MODO == "bucket" else AgendaPorJob(scheduler, job_func)
+
+def planejar_agendado(p):
+    """planejar_consulta com os horários suavizados (plano e reconciliador)."""
+    lembretes = planejar_consulta(p)
+    if _suavizador:
+        _suavizador.ajustar(lembretes)
+    return lembretes
+
+def _consulta_deste_no(p):
+    return _cluster is None or _cluster.meu(p.get("telefone", ""))
+
+def _shards_mudaram(reconciliador, ganhos, perdidos, retomada):
+    """solta os jobs dos shards perdidos e agenda os ganhos, repondo o que venceu sem dono."""
+    removidas = reconciliador.esquecer(lambda telefone: _cluster.shard(telefone) in perdidos) if perdidos else 0
+    resumo = reconciliador.forcar(retomada)
+    logger.info("Shards mudaram (+%s -%s): %d consultas soltas, %d assumidas (retomada de %.0fs)",
+                sorted(ganhos), sorted(perdidos), removidas, resumo["novas"], retomada)
+
+# -------------------- agendador real --------------------
+def montar_plano(storage, agenda, guardar_planos=False):
+    """
+    lê as consultas do storage uma a uma e agenda em lotes de LOTE_PLANO; consulta
+    inválida é relatada e pulada. Jobs persistidos de consultas que saíram da base
+    são removidos. Devolve o resumo (e os planos, base do reconciliador).
+    """
+    with perfil.etapa("plano.existentes"):
+        existentes = agenda.existentes()
+    if _suavizador:
+        _suavizador.semear(existentes)  # o que já está no job store não muda de horário
+
+    planos = {}
+    planejados = set()
+    pendentes = []
+    consultas = novos = 0
+    invalidas = Relatorio()
+    for p in perfil.iterar("plano.leitura", storage.iterar_consultas()):
+        if not _consulta_deste_no(p):
+            continue
+        try:
+            with perfil.etapa("plano.planejar"):
+                lembretes = planejar_agendado(p)
+        except (KeyError, ValueError) as e:
+            invalidas.invalido(f"telefone {p.get('telefone')}", str(e))
+            continue
+        consultas += 1
+        if guardar_planos:
+            planos[lembretes[0]["chave"]] = lembretes  # base da comparação do reconciliador
+        planejados.update(l["id"] for l in lembretes)
+        pendentes += [l for l in lembretes if l["id"] not in existentes]
+        if len(pendentes) >= LOTE_PLANO:
+            with perfil.etapa("plano.agendar"):
+                novos += agenda.agendar(pendentes, datetime.now())
+            pendentes = []
+    with perfil.etapa("plano.agendar"):
+        novos += agenda.agendar(pendentes, datetime.now())
+
+    # jobs salvos de consultas que saíram da base
+    with perfil.etapa("plano.remover"):
+        agenda.remover(existentes.keys() - planejados)
+    return {"consultas": consultas, "novos": novos, "existentes": len(existentes),
+            "invalidas": invalidas, "planos": planos}
+
+def run():
+    global _fila, _cluster, _suavizador
+    t0 = time.perf_counter()
+    with perfil.etapa("plano.storage"):
+        storage = get_storage()
+        versao = storage.versao()
+    if FILA_ATIVA:
+        _fila = FilaEnvios()
+    if SUAVIZAR_MPS > 0:
+        _suavizador = Suavizador()
+    if SHARDS:
+        _cluster = Cluster()
+        _cluster.renovar()
+        _cluster.start()  # renova durante o plano; trocas de shard são aplicadas depois dele
+        print(f"🧩 Nó {_cluster.no}: shards {sorted(_cluster.meus)} de {_cluster.shards}")
+
+    # referência textual: o job store persiste "módulo:função"
+    job_func = "scheduler:enfileirar_envio" if FILA_ATIVA else "scheduler:enviar_para_paciente_e_responsavel"
+
+    with perfil.etapa("plano.jobstore"):
+        scheduler = criar_scheduler()
+        instrumentar(scheduler, _fila)
+        scheduler.start(paused=True)  # pausado: jobs persistidos só disparam depois do plano
+    agenda = criar_agenda(scheduler, job_func)
+
+    with perfil.perfilar():
+        plano = montar_plano(storage, agenda, guardar_planos=RECONCILIAR_S > 0 or bool(_cluster))
+    consultas, novos, existentes, invalidas = plano["consultas"], plano["novos"], plano["existentes"], plano["invalidas"]
+
+    print(f"🗓️ {consultas} consultas | {novos} jobs novos | {existentes} recuperados do job store")
+    if invalidas.invalidos:
+        print(f"⚠️ Consultas inválidas ignoradas: {invalidas.resumo()}")
+    logger.info("Plano pronto: %d jobs novos, %d já persistidos", novos, existentes)
+    if _suavizador:
+        logger.info("Suavização (%g msg/s): mensagens por minuto no horário exato x suavizado\n%s",
+                    SUAVIZAR_MPS, _suavizador.relatorio())
+    if perfil.LIGADO:
+        perfil.registrar("plano.total", time.perf_counter() - t0)
+        print(f"⏱️ Custo do plano por etapa:\n{perfil.resumo('plan')}")
+
+    worker = None
+    if FILA_ATIVA:
+        worker = WorkerFila(_fila, workers=FILA_WORKERS)
+        worker.start()
+
+    reconciliador = None
+    if RECONCILIAR_S > 0 or _cluster:
+        reconciliador = Reconciliador(storage, planejar_agendado, agenda, intervalo=RECONCILIAR_S,
+                                      filtro=_consulta_deste_no if _cluster else None,
+                                      fonte=FONTE if isinstance(storage, SQLiteStorage) else None)
+        reconciliador.iniciar(plano["planos"], versao)
+        if RECONCILIAR_S > 0:
+            reconciliador.start()
+    if _cluster:
+        _cluster.ao_mudar = lambda ganhos, perdidos, retomada: _shards_mudaram(reconciliador, ganhos, perdidos, retomada)
+
+    if REENVIO_MIN > 0:
+        scheduler.add_job("scheduler:reenviar_falhas", "interval", minutes=REENVIO_MIN,
+                          id="reenviar_falhas", replace_existing=True, coalesce=True, max_instances=1)
+    elif scheduler.get_job("reenviar_falhas"):
+        scheduler.remove_job("reenviar_falhas")
 
     print("🚀 Scheduler iniciado. Aguardando envios...")
-    scheduler.start()
+    scheduler.resume()
     try:
         while True:
             time.sleep(60)
     except KeyboardInterrupt:
         print("🛑 Encerrando...")
     finally:
+        if _cluster:
+            _cluster.stop()
+        if reconciliador:
+            reconciliador.stop()
         scheduler.shutdown()
+        if _cluster:
+            _cluster.liberar()  # os outros nós assumem sem esperar a lease vencer
+        if worker:
+            worker.stop()
+        if perfil.LIGADO:
+            logger.info("Perfil por etapa:\n%s", perfil.resumo())
+            for arquivo in perfil.encerrar():
+                print(f"⏱️ Perfil gravado em {arquivo}")
         logger.info("Scheduler finalizado.")
 
 if __name__ == "__main__":
-    run()
+    parser = argparse.ArgumentParser(description="Agendador dos lembretes de teleconsulta.")
+    parser.add_argument("--perfil", action="store_true", help="tempo por etapa do plano, dos jobs e dos envios (PERFIL=1)")
+    parser.add_argument("--perfil-dump", metavar="ARQUIVO", default=perfil.DUMP,
+                        help="cProfile do plano em ARQUIVO.prof (PERFIL_DUMP)")
+    parser.add_argument("--perfil-amostras", metavar="ARQUIVO", default=perfil.AMOSTRAS,
+                        help="pilhas de todas as threads no formato folded, para flamegraph (PERFIL_AMOSTRAS)")
+    args = parser.parse_args()
+    if args.perfil or args.perfil_dump or args.perfil_amostras:
+        perfil.ligar(args.perfil_dump, args.perfil_amostras)
+
+    # os jobs persistidos apontam para "scheduler:...", então roda pelo módulo importado
+    import scheduler
+    scheduler.run()
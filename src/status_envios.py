@@ -0,0 +1,265 @@
+# src/status_envios.py
+import os, time, sqlite3, logging, threading, argparse
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+from storage import DB_PATH
+
+# filho do logger do webhook; no scheduler as mensagens sobem para o root
+logger = logging.getLogger("webhook.status")
+
+STATUS_DB = Path(os.getenv("STATUS_DB", DB_PATH))
+
+# ordem dos estados: um status atrasado (ex.: delivered depois do read) não volta o estado
+ORDEM = {"accepted": 0, "sent": 1, "delivered": 2, "read": 3, "failed": 4}
+COLUNA_DO_STATUS = {"sent": "enviado_em", "delivered": "entregue_em", "read": "lido_em", "failed": "falhou_em"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS envios_status (
+    wamid         TEXT PRIMARY KEY,
+    template      TEXT,
+    telefone      TEXT,              -- destinatário (paciente ou responsável)
+    paciente      TEXT,              -- telefone do paciente da consulta
+    consulta      TEXT,              -- AAAA-MM-DDTHH:MM
+    status        TEXT NOT NULL,
+    ordem         INTEGER NOT NULL,
+    aceito_em     REAL,
+    enviado_em    REAL,
+    entregue_em   REAL,
+    lido_em       REAL,
+    falhou_em     REAL,
+    erro          TEXT,
+    reenviado     INTEGER NOT NULL DEFAULT 0,
+    atualizado_em REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_status_template_aceito ON envios_status(template, aceito_em);
+CREATE INDEX IF NOT EXISTS idx_status_paciente ON envios_status(paciente);
+CREATE INDEX IF NOT EXISTS idx_status_status ON envios_status(status);
+"""
+
+def wamid_da_resposta(resposta: Optional[Dict[str, Any]]) -> Optional[str]:
+    """id da mensagem (wamid) na resposta de enviar_template."""
+    try:
+        return resposta["messages"][0]["id"]
+    except (TypeError, KeyError, IndexError):
+        return None
+
+def _epoch(valor) -> Optional[float]:
+    if valor is None or isinstance(valor, (int, float)):
+        return valor
+    if isinstance(valor, str):
+        valor = datetime.fromisoformat(valor)
+    return valor.timestamp()
+
+class StatusEnvios:
+    """
+    Último status de cada mensagem enviada, pelo wamid.
+    - o envio grava a linha (template, destinatário, paciente, consulta)
+    - o webhook atualiza em lote com os statuses sent/delivered/read/failed
+    - status fora de ordem não regride o estado; cada etapa guarda seu horário
+    """
+
+    def __init__(self, path: Path = STATUS_DB):
+        self.path = Path(path)
+        self._local = threading.local()
+        self._conn().executescript(SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _transacao(self, *comandos) -> None:
+        """comandos = (sql, linhas), ... executados numa transação só."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for sql, linhas in comandos:
+                conn.executemany(sql, linhas)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    # -------------------- escrita --------------------
+    def registrar_envio(self, wamid: str, template: str, telefone: str,
+                        paciente: Optional[str] = None, consulta: Optional[str] = None) -> None:
+        self.registrar_envios([(wamid, template, telefone, paciente, consulta)])
+
+    def registrar_envios(self, envios: Iterable[tuple]) -> None:
+        """envios = [(wamid, template, telefone, paciente, consulta), ...]"""
+        agora = time.time()
+        # o status do webhook pode chegar antes: aí só completa os dados do envio
+        self._transacao(("""
+            INSERT INTO envios_status (wamid, template, telefone, paciente, consulta, status, ordem, aceito_em, atualizado_em)
+            VALUES (?, ?, ?, ?, ?, 'accepted', 0, ?, ?)
+            ON CONFLICT(wamid) DO UPDATE SET
+                template = excluded.template, telefone = excluded.telefone,
+                paciente = excluded.paciente, consulta = excluded.consulta, aceito_em = excluded.aceito_em
+        """, [(w, t, tel, pac or tel, c, agora, agora) for w, t, tel, pac, c in envios if w]))
+
+    def atualizar(self, statuses: Iterable[Dict[str, Any]]) -> int:
+        """aplica os statuses do webhook (value.statuses) numa transação só."""
+        agora = time.time()
+        por_coluna: Dict[str, List[tuple]] = {}
+        for st in statuses:
+            status, wamid = st.get("status"), st.get("id")
+            if status not in COLUNA_DO_STATUS or not wamid:
+                continue
+            erros = st.get("errors") or []
+            erro = "; ".join(f"{e.get('code')} {e.get('title')}" for e in erros) or None
+            quando = float(st.get("timestamp") or agora)
+            por_coluna.setdefault(COLUNA_DO_STATUS[status], []).append(
+                (wamid, st.get("recipient_id"), status, ORDEM[status], quando, erro, agora))
+
+        self._transacao(*((f"""
+                INSERT INTO envios_status (wamid, telefone, status, ordem, {coluna}, erro, atualizado_em)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(wamid) DO UPDATE SET
+                    {coluna}      = COALESCE({coluna}, excluded.{coluna}),
+                    erro          = COALESCE(excluded.erro, erro),
+                    status        = CASE WHEN excluded.ordem > ordem THEN excluded.status ELSE status END,
+                    ordem         = MAX(ordem, excluded.ordem),
+                    atualizado_em = excluded.atualizado_em
+            """, linhas) for coluna, linhas in por_coluna.items()))
+        return sum(len(linhas) for linhas in por_coluna.values())
+
+    def marcar_reenviados(self, wamids: Iterable[str]) -> None:
+        self._transacao(("UPDATE envios_status SET reenviado = 1 WHERE wamid = ?", [(w,) for w in wamids]))
+
+    # -------------------- consultas --------------------
+    def consultar(self, template: Optional[str] = None, paciente: Optional[str] = None,
+                  desde=None, ate=None, status: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+        """
+        envios filtrados por template, paciente, status e período do envio
+        (desde/ate: datetime, ISO ou epoch; comparados com o aceite da Graph).
+        """
+        filtros, args = [], []
+        if template:
+            filtros.append("template = ?"); args.append(template)
+        if paciente:
+            filtros.append("paciente = ?"); args.append(paciente)
+        if desde is not None:
+            filtros.append("aceito_em >= ?"); args.append(_epoch(desde))
+        if ate is not None:
+            filtros.append("aceito_em < ?"); args.append(_epoch(ate))
+        if status:
+            status = list(status)
+            filtros.append(f"status IN ({','.join('?' * len(status))})"); args += status
+        where = f" WHERE {' AND '.join(filtros)}" if filtros else ""
+        rows = self._conn().execute(f"SELECT * FROM envios_status{where} ORDER BY aceito_em", args).fetchall()
+        return [dict(r) for r in rows]
+
+    def nao_entregues(self, template: Optional[str] = None, desde=None, ate=None) -> List[Dict[str, Any]]:
+        """aceitos/enviados que nunca chegaram ao aparelho, e os que falharam."""
+        return self.consultar(template=template, desde=desde, ate=ate, status=("accepted", "sent", "failed"))
+
+    def falhas_para_reenvio(self, max_envios: int = 2, agora: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """
+        um lembrete (template, destinatário, consulta) cujos envios falharam todos,
+        ainda não reenviado, com a consulta no futuro e menos de `max_envios` tentativas.
+        """
+        agora = (agora or datetime.now()).isoformat(timespec="minutes")
+        rows = self._conn().execute("""
+            SELECT template, telefone, paciente, consulta, GROUP_CONCAT(wamid) AS wamids
+              FROM envios_status
+             WHERE template IS NOT NULL AND consulta > ?
+             GROUP BY template, telefone, consulta
+            HAVING SUM(status != 'failed') = 0 AND SUM(reenviado) < COUNT(*) AND COUNT(*) < ?
+        """, (agora, max_envios)).fetchall()
+        return [{**dict(r), "wamids": r["wamids"].split(",")} for r in rows]
+
+    def contagem(self, template: Optional[str] = None) -> Dict[str, int]:
+        filtro, args = (" WHERE template = ?", (template,)) if template else ("", ())
+        return {r["status"]: r["n"] for r in self._conn().execute(
+            f"SELECT status, COUNT(*) AS n FROM envios_status{filtro} GROUP BY status", args)}
+
+# -------------------- atualização em lote (webhook) --------------------
+class LoteStatus:
+    """
+    Acumula os statuses recebidos e grava de `intervalo` em `intervalo` segundos
+    (ou ao juntar `maximo`), numa transação só; a requisição do webhook não espera o disco.
+    """
+
+    def __init__(self, store: Optional[StatusEnvios] = None, intervalo: float = 1.0, maximo: int = 500):
+        self.store = store
+        self.intervalo = intervalo
+        self.maximo = maximo
+        self._pendentes: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._cheio = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def adicionar(self, statuses: Iterable[Dict[str, Any]]) -> None:
+        with self._lock:
+            self._pendentes.extend(statuses)
+            if not self._pendentes:
+                return
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="status-lote", daemon=True)
+                self._thread.start()
+            if len(self._pendentes) >= self.maximo:
+                self._cheio.set()
+
+    def descarregar(self) -> int:
+        """grava o que estiver acumulado (também usado em testes/encerramento)."""
+        with self._lock:
+            lote, self._pendentes = self._pendentes, []
+        if not lote:
+            return 0
+        if self.store is None:
+            self.store = get_status_envios()
+        try:
+            return self.store.atualizar(lote)
+        except Exception as e:
+            logger.exception("Falha ao gravar %d statuses: %s", len(lote), e)
+            return 0
+
+    def _loop(self) -> None:
+        while True:
+            self._cheio.wait(self.intervalo)
+            self._cheio.clear()
+            self.descarregar()
+
+# -------------------- fábrica --------------------
+_status: Optional[StatusEnvios] = None
+_status_lock = threading.Lock()
+
+def get_status_envios() -> StatusEnvios:
+    global _status
+    with _status_lock:
+        if _status is None:
+            _status = StatusEnvios()
+        return _status
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Status de entrega das mensagens enviadas.")
+    parser.add_argument("--db", default=str(STATUS_DB))
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    res = sub.add_parser("resumo", help="quantidade de mensagens por status")
+    res.add_argument("--template")
+    ne = sub.add_parser("nao-entregues", help="mensagens que não chegaram ao aparelho")
+    ne.add_argument("--template")
+    ne.add_argument("--desde", help="AAAA-MM-DD[THH:MM]")
+    ne.add_argument("--ate", help="AAAA-MM-DD[THH:MM]")
+    pac = sub.add_parser("paciente", help="histórico de mensagens de um paciente")
+    pac.add_argument("telefone")
+    args = parser.parse_args()
+
+    store = StatusEnvios(Path(args.db))
+    if args.cmd == "resumo":
+        print(store.contagem(args.template))
+    else:
+        if args.cmd == "nao-entregues":
+            linhas = store.nao_entregues(args.template, args.desde, args.ate)
+        else:
+            linhas = store.consultar(paciente=args.telefone)
+        for r in linhas:
+            aceito = datetime.fromtimestamp(r["aceito_em"]).strftime("%d/%m %H:%M") if r["aceito_em"] else "-"
+            print(f"{aceito} {r['template']} -> {r['telefone']} (consulta {r['consulta']}) | {r['status']}"
+                  + (f" | {r['erro']}" if r["erro"] else ""))
@@ -0,0 +1,335 @@
+# src/storage.py
+import os, json, sqlite3, threading, argparse, time
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+import config  # carrega o .env antes de ler o ambiente
+from pacientes_store import PACIENTES_PATH, get_store
+from carga import Relatorio, ler_consultas
+
+config.carregar_env()
+
+BASE_DIR = Path(__file__).resolve().parent
+DB_PATH  = Path(os.getenv("STORAGE_DB", BASE_DIR / "hc_reminder.db"))
+BACKEND  = os.getenv("STORAGE_BACKEND", "sqlite").strip().lower()
+ALTERACOES_DIAS = float(os.getenv("STORAGE_ALTERACOES_DIAS", "7"))  # histórico de mudanças para o reconciliador
+
+class Storage:
+    """
+    Interface comum de armazenamento de pacientes/consultas.
+    Cada consulta é devolvida no mesmo formato do pacientes.json
+    (nome, telefone, responsavel, responsavel_ativo, data, hora, link).
+    """
+
+    def listar_consultas(self) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def iterar_consultas(self) -> Iterator[Dict[str, Any]]:
+        """mesmas consultas de listar_consultas, uma de cada vez."""
+        return iter(self.listar_consultas())
+
+    def consultas_do_telefone(self, telefone: str) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def responsavel_ativo(self, telefone: str) -> bool:
+        raise NotImplementedError
+
+    def set_responsavel_ativo(self, responsavel: str, ativo: bool) -> int:
+        """atualiza todos os pacientes do responsável; retorna quantos mudaram."""
+        raise NotImplementedError
+
+    def versao(self) -> Any:
+        """valor que muda quando os dados mudam (para quem acompanha por polling)."""
+        raise NotImplementedError
+
+    def mudancas(self, desde: Any) -> Optional[Tuple[Any, Set[str]]]:
+        """(versão atual, telefones cujas consultas mudaram depois de `desde`); None = releia tudo."""
+        return None
+
+# -------------------- JSON (legado) --------------------
+class JsonStorage(Storage):
+    """pacientes.json com índice em memória; escrita reescreve o arquivo inteiro."""
+
+    def __init__(self, path: Path = PACIENTES_PATH):
+        self.path = Path(path)
+        self.store = get_store(self.path)
+        self._lock = threading.Lock()
+
+    def listar_consultas(self) -> List[Dict[str, Any]]:
+        return self.store.todos()
+
+    def consultas_do_telefone(self, telefone: str) -> List[Dict[str, Any]]:
+        return self.store.consultas(telefone)
+
+    def responsavel_ativo(self, telefone: str) -> bool:
+        return self.store.responsavel_ativo(telefone)
+
+    def versao(self) -> Any:
+        st = self.path.stat()
+        return (st.st_mtime_ns, st.st_size)
+
+    def set_responsavel_ativo(self, responsavel: str, ativo: bool) -> int:
+        with self._lock:
+            pacientes = json.loads(self.path.read_text(encoding="utf-8")) if self.path.exists() else []
+            n = 0
+            for p in pacientes:
+                if p.get("responsavel") == responsavel:
+                    p["responsavel_ativo"] = ativo
+                    n += 1
+            self.path.write_text(json.dumps(pacientes, ensure_ascii=False, indent=2), encoding="utf-8")
+            self.store.invalidar()
+            return n
+
+# -------------------- SQLite --------------------
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pacientes (
+    telefone          TEXT PRIMARY KEY,
+    nome              TEXT NOT NULL,
+    responsavel       TEXT,
+    responsavel_ativo INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS idx_pacientes_responsavel ON pacientes(responsavel);
+
+CREATE TABLE IF NOT EXISTS consultas (
+    id       INTEGER PRIMARY KEY,
+    telefone TEXT NOT NULL REFERENCES pacientes(telefone),
+    data     TEXT NOT NULL,
+    hora     TEXT NOT NULL,
+    link     TEXT,
+    UNIQUE (telefone, data, hora)
+);
+
+-- registro de mudanças: os triggers gravam na mesma transação da escrita, seja de quem for.
+-- A versão é o último id (AUTOINCREMENT não reaproveita ids, mesmo depois de podar).
+CREATE TABLE IF NOT EXISTS alteracoes (
+    versao   INTEGER PRIMARY KEY AUTOINCREMENT,
+    telefone TEXT NOT NULL,
+    em       INTEGER NOT NULL DEFAULT (CAST(strftime('%s', 'now') AS INTEGER))
+);
+CREATE INDEX IF NOT EXISTS idx_alteracoes_em ON alteracoes(em);
+
+CREATE TRIGGER IF NOT EXISTS trg_consultas_inseridas AFTER INSERT ON consultas
+BEGIN
+    INSERT INTO alteracoes (telefone) VALUES (NEW.telefone);
+END;
+CREATE TRIGGER IF NOT EXISTS trg_consultas_removidas AFTER DELETE ON consultas
+BEGIN
+    INSERT INTO alteracoes (telefone) VALUES (OLD.telefone);
+END;
+CREATE TRIGGER IF NOT EXISTS trg_consultas_alteradas AFTER UPDATE ON consultas
+BEGIN
+    INSERT INTO alteracoes (telefone) VALUES (OLD.telefone);
+    INSERT INTO alteracoes (telefone) SELECT NEW.telefone WHERE NEW.telefone IS NOT OLD.telefone;
+END;
+-- responsavel_ativo fica de fora: é lido na hora do envio e não muda o plano
+CREATE TRIGGER IF NOT EXISTS trg_pacientes_alterados AFTER UPDATE OF nome, responsavel ON pacientes
+WHEN OLD.nome IS NOT NEW.nome OR OLD.responsavel IS NOT NEW.responsavel
+BEGIN
+    INSERT INTO alteracoes (telefone) VALUES (NEW.telefone);
+END;
+"""
+
+class SQLiteStorage(Storage):
+    """
+    SQLite em modo WAL, compartilhado entre webhook e scheduler.
+    - uma conexão por thread (sqlite3 não compartilha conexões entre threads)
+    - PAUSAR/RETORNAR vira um UPDATE indexado por responsavel
+    - mudanças em consultas ficam em `alteracoes` (versao/mudancas do reconciliador)
+    """
+
+    def __init__(self, path: Path = DB_PATH):
+        self.path = Path(path)
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.executescript(SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    def vazio(self) -> bool:
+        return self._conn().execute("SELECT 1 FROM pacientes LIMIT 1").fetchone() is None
+
+    _SELECT_CONSULTAS = """
+        SELECT p.nome, p.telefone, p.responsavel, p.responsavel_ativo, c.data, c.hora, c.link
+          FROM consultas c JOIN pacientes p ON p.telefone = c.telefone
+    """
+
+    def listar_consultas(self) -> List[Dict[str, Any]]:
+        return list(self.iterar_consultas())
+
+    def iterar_consultas(self) -> Iterator[Dict[str, Any]]:
+        # conexão própria: o cursor fica aberto enquanto o chamador consome
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            for r in conn.execute(self._SELECT_CONSULTAS + " ORDER BY c.id"):
+                yield {**dict(r), "responsavel_ativo": bool(r["responsavel_ativo"])}
+        finally:
+            conn.close()
+
+    def consultas_do_telefone(self, telefone: str) -> List[Dict[str, Any]]:
+        rows = self._conn().execute(self._SELECT_CONSULTAS + " WHERE c.telefone = ?", (telefone,)).fetchall()
+        return [
+            {**dict(r), "responsavel_ativo": bool(r["responsavel_ativo"])}
+            for r in rows
+        ]
+
+    def responsavel_ativo(self, telefone: str) -> bool:
+        row = self._conn().execute(
+            "SELECT responsavel_ativo FROM pacientes WHERE telefone = ?", (telefone,)
+        ).fetchone()
+        return bool(row["responsavel_ativo"]) if row else True
+
+    def set_responsavel_ativo(self, responsavel: str, ativo: bool) -> int:
+        with self._conn() as conn:
+            cur = conn.execute(
+                "UPDATE pacientes SET responsavel_ativo = ? WHERE responsavel = ?",
+                (int(ativo), responsavel),
+            )
+            return cur.rowcount
+
+    def versao(self) -> Any:
+        # gravada no próprio banco: igual para qualquer conexão, thread ou processo
+        row = self._conn().execute("SELECT seq FROM sqlite_sequence WHERE name = 'alteracoes'").fetchone()
+        return row[0] if row else 0
+
+    def mudancas(self, desde: Any) -> Optional[Tuple[Any, Set[str]]]:
+        conn = self._conn()
+        conn.execute("BEGIN")  # versão e telefones do mesmo instante
+        try:
+            versao = self.versao()
+            if versao == desde:
+                return versao, set()
+            primeira = conn.execute("SELECT MIN(versao) FROM alteracoes").fetchone()[0]
+            if versao < desde or primeira is None or primeira > desde + 1:
+                return None  # banco trocado ou histórico depois de `desde` já podado
+            rows = conn.execute("SELECT DISTINCT telefone FROM alteracoes WHERE versao > ?", (desde,))
+            return versao, {r[0] for r in rows}
+        finally:
+            conn.execute("COMMIT")
+
+    def importar(self, pacientes: Iterable[Dict[str, Any]], substituir: bool = False,
+                 sincronizar: bool = False) -> int:
+        """
+        importa registros no formato do pacientes.json.
+        - substituir=False mantém o responsavel_ativo já gravado no banco
+        - sincronizar=True deixa só as consultas do arquivo, mantendo o responsavel_ativo
+        - só as linhas que mudaram são gravadas: `alteracoes` fica só com esses telefones
+        - consultas repetidas (telefone, data, hora) são ignoradas
+        """
+        conflito = (
+            "ON CONFLICT(telefone) DO UPDATE SET nome = excluded.nome, responsavel = excluded.responsavel"
+            + (", responsavel_ativo = excluded.responsavel_ativo" if substituir else "")
+            + " WHERE nome IS NOT excluded.nome OR responsavel IS NOT excluded.responsavel"
+            + (" OR responsavel_ativo IS NOT excluded.responsavel_ativo" if substituir else "")
+        )
+        trocar = substituir or sincronizar
+        conn = self._conn()
+        if trocar:
+            # consultas do arquivo numa tabela temporária; depois só a diferença vai para `consultas`
+            conn.execute("""
+                CREATE TEMP TABLE IF NOT EXISTS entrada (
+                    telefone TEXT, data TEXT, hora TEXT, link TEXT, PRIMARY KEY (telefone, data, hora)
+                )
+            """)
+        destino = "temp.entrada" if trocar else "consultas"
+        n = 0
+        with conn:
+            conn.execute("DELETE FROM alteracoes WHERE em < ?", (int(time.time() - ALTERACOES_DIAS * 86400),))
+            if trocar:
+                conn.execute("DELETE FROM temp.entrada")
+            for p in pacientes:
+                conn.execute(
+                    f"INSERT INTO pacientes (telefone, nome, responsavel, responsavel_ativo) VALUES (?, ?, ?, ?) {conflito}",
+                    (p["telefone"], p["nome"], p.get("responsavel"), int(p.get("responsavel_ativo", True))),
+                )
+                conn.execute(
+                    f"INSERT OR IGNORE INTO {destino} (telefone, data, hora, link) VALUES (?, ?, ?, ?)",
+                    (p["telefone"], p["data"], p["hora"], p.get("link")),
+                )
+                n += 1
+            if trocar:
+                self._aplicar_entrada(conn)
+        return n
+
+    @staticmethod
+    def _aplicar_entrada(conn: sqlite3.Connection) -> None:
+        """remove, altera e insere em `consultas` só o que difere de temp.entrada."""
+        mesma = "e.telefone = consultas.telefone AND e.data = consultas.data AND e.hora = consultas.hora"
+        conn.execute(f"DELETE FROM consultas WHERE NOT EXISTS (SELECT 1 FROM temp.entrada e WHERE {mesma})")
+        conn.execute(f"""
+            UPDATE consultas SET link = (SELECT e.link FROM temp.entrada e WHERE {mesma})
+             WHERE EXISTS (SELECT 1 FROM temp.entrada e WHERE {mesma} AND e.link IS NOT consultas.link)
+        """)
+        conn.execute("INSERT OR IGNORE INTO consultas (telefone, data, hora, link)"
+                     " SELECT telefone, data, hora, link FROM temp.entrada")
+        conn.execute("DELETE FROM temp.entrada")
+
+    def sincronizar(self, path: Path, formato: Optional[str] = None,
+                    relatorio: Optional[Relatorio] = None) -> int:
+        """deixa as consultas iguais às do arquivo (o reconciliador chama quando o arquivo muda)."""
+        return importar_arquivo(self, path, sincronizar=True, formato=formato, relatorio=relatorio)
+
+def importar_arquivo(storage: SQLiteStorage, path: Path = PACIENTES_PATH, substituir: bool = False,
+                     sincronizar: bool = False, formato: Optional[str] = None,
+                     relatorio: Optional[Relatorio] = None) -> int:
+    """
+    importação em streaming de um JSON array, JSON lines ou CSV (ver carga.py):
+    o arquivo não é carregado inteiro e registros inválidos vão para o `relatorio`.
+    """
+    consultas = ler_consultas(Path(path), formato, relatorio)
+    return storage.importar(consultas, substituir=substituir, sincronizar=sincronizar)
+
+importar_json = importar_arquivo  # nome antigo
+
+# -------------------- fábrica --------------------
+_storage: Optional[Storage] = None
+_storage_lock = threading.Lock()
+
+def get_storage() -> Storage:
+    """
+    backend escolhido por STORAGE_BACKEND (sqlite | json).
+    No SQLite, se o banco estiver vazio, importa o pacientes.json uma vez.
+    """
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            if BACKEND == "json":
+                _storage = JsonStorage()
+            else:
+                storage = SQLiteStorage()
+                if storage.vazio() and PACIENTES_PATH.exists():
+                    importar_arquivo(storage)
+                _storage = storage
+        return _storage
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ferramentas do banco de pacientes.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    imp = sub.add_parser("importar", help="importa pacientes (JSON array, JSON lines ou CSV) para o SQLite")
+    imp.add_argument("arquivo", nargs="?", default=str(PACIENTES_PATH))
+    imp.add_argument("--formato", choices=("json", "jsonl", "csv"), help="padrão: pela extensão/conteúdo")
+    imp.add_argument("--db", default=str(DB_PATH))
+    imp.add_argument("--substituir", action="store_true",
+                     help="troca as consultas pelas do arquivo e sobrescreve responsavel_ativo com o dele")
+    imp.add_argument("--sincronizar", action="store_true",
+                     help="troca as consultas pelas do arquivo, mantendo quem pausou os lembretes")
+    args = parser.parse_args()
+
+    if args.cmd == "importar":
+        relatorio = Relatorio()
+        try:
+            n = importar_arquivo(SQLiteStorage(Path(args.db)), Path(args.arquivo), substituir=args.substituir,
+                                 sincronizar=args.sincronizar, formato=args.formato, relatorio=relatorio)
+        except ValueError as e:  # arquivo quebrado no meio: nada foi gravado
+            raise SystemExit(f"❌ {e}")
+        print(f"✅ {n} registros importados para {args.db}")
+        if relatorio.invalidos:
+            print(f"⚠️ {relatorio.resumo()}")
@@ -0,0 +1,219 @@
+# src/suavizacao.py
+# Suavização dos picos: consultas marcadas na hora cheia e na meia hora fazem milhares
+# de lembretes vencerem no mesmo segundo. Cada lembrete pode andar até a tolerância
+# do seu template; os minutos da janela são nivelados abaixo do ritmo alvo.
+import os
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
+MPS = float(os.getenv("SCHEDULER_SUAVIZAR_MPS", "0"))   # mensagens/s alvo (0 = desligado); em cluster, por nó
+
+def _tolerancias(texto: str) -> Dict[str, int]:
+    """"lembrete_48h=20,lembrete_24h=20" -> {template: minutos}"""
+    tolerancias = {}
+    for item in filter(None, (i.strip() for i in texto.split(","))):
+        template, minutos = item.split("=", 1)
+        tolerancias[template.strip()] = int(minutos)
+    return tolerancias
+
+# minutos para cada lado; consulta_comecando leva o link da sala e sai na hora
+TOLERANCIAS = _tolerancias(os.getenv(
+    "SCHEDULER_SUAVIZAR_TOLERANCIA", "lembrete_48h=20,lembrete_24h=20,lembrete__1h=5,consulta_comecando=0"))
+
+Lembrete = Dict[str, Any]
+
+def peso(lembrete: Lembrete) -> int:
+    """mensagens que o lembrete gera: paciente e responsável com outro número."""
+    args = lembrete["args"]  # template, telefone, params, responsavel, ...
+    return 2 if args[3] and args[3] != args[1] else 1
+
+def _minuto(quando: datetime) -> int:
+    """minutos desde o início do calendário: chave inteira e contígua dos minutos."""
+    return (quando.toordinal() * 24 + quando.hour) * 60 + quando.minute
+
+# (minutos, segundos) -> timedelta: o mesmo punhado de deslocamentos se repete no plano inteiro
+class _Deslocamentos(dict):
+    def __missing__(self, chave: Tuple[int, int]) -> timedelta:
+        self[chave] = delta = timedelta(minutes=chave[0], seconds=chave[1])
+        return delta
+
+_DESLOCAMENTOS = _Deslocamentos()
+
+def _hora(minuto: int) -> datetime:
+    dia, resto = divmod(minuto, 1440)
+    return datetime.fromordinal(dia) + timedelta(minutes=resto)
+
+class Suavizador:
+    """
+    Distribui os lembretes pelos minutos com até `mps`*60 mensagens cada:
+    - cada lembrete vai para o minuto mais próximo do original, dentro de ±tolerância
+      do template, entre os menos cheios da janela (até um lembrete acima do mínimo).
+      Nivelar a janela deixa folga para quem não pode andar (consulta_comecando)
+    - acima do ritmo só quando a janela inteira lotou; relatorio() conta esses casos
+    - dentro do minuto, os disparos se espalham pelos segundos na ordem de chegada
+    - o horário de cada id é guardado: replanejar a mesma consulta (reconciliador)
+      devolve o mesmo horário, e liberar() devolve a folga de quem saiu
+    """
+
+    EXPANSAO = 7 * 1440  # minutos a mais quando a faixa de minutos precisa crescer
+
+    def __init__(self, mps: float = MPS, tolerancias: Optional[Mapping[str, int]] = None):
+        self.capacidade = max(1, int(mps * 60))  # mensagens por minuto
+        self.tolerancias = dict(TOLERANCIAS if tolerancias is None else tolerancias)
+        self.antes: Counter = Counter()     # minuto -> mensagens no horário exato
+        self.sem_folga: Counter = Counter()  # template -> lembretes que passaram do ritmo
+        self._carga: List[int] = []         # mensagens depois da suavização, a partir de _inicio
+        self._inicio = 0
+        self._horarios: Dict[str, Tuple[datetime, datetime, int]] = {}  # id -> (run_at, original, peso)
+        self._fixos: Dict[str, datetime] = {}
+
+    @property
+    def carga(self) -> Dict[datetime, int]:
+        """minuto -> mensagens depois da suavização."""
+        return {_hora(self._inicio + i): n for i, n in enumerate(self._carga) if n}
+
+    def _indices(self, primeiro: int, ultimo: int) -> Tuple[int, int]:
+        """posições de `primeiro` e `ultimo` em _carga, crescendo a lista se preciso."""
+        if not self._carga:
+            self._inicio = primeiro - self.EXPANSAO
+            self._carga = [0] * (ultimo - primeiro + 2 * self.EXPANSAO)
+        elif primeiro < self._inicio:
+            falta = self._inicio - primeiro + self.EXPANSAO
+            self._carga[:0] = [0] * falta
+            self._inicio -= falta
+        if ultimo - self._inicio >= len(self._carga):
+            self._carga += [0] * (ultimo - self._inicio - len(self._carga) + 1 + self.EXPANSAO)
+        return primeiro - self._inicio, ultimo - self._inicio
+
+    def semear(self, horarios: Mapping[str, Optional[datetime]]) -> None:
+        """horários já persistidos no job store (id -> run_at): ficam onde estão."""
+        self._fixos = {i: h for i, h in horarios.items() if h is not None}
+
+    def ajustar(self, lembretes: Iterable[Lembrete], agora: Optional[datetime] = None) -> None:
+        """troca o run_at de cada lembrete futuro pelo horário suavizado."""
+        agora = agora or datetime.now()
+        depois = _minuto(agora) + 1  # primeiro minuto que começa depois de agora
+        horarios, antes = self._horarios, self.antes
+        for l in lembretes:
+            marcado = horarios.get(l["id"])
+            if marcado is not None:
+                l["run_at"] = marcado[0]
+                continue
+            original = l["run_at"]
+            if original <= agora:
+                continue  # o agendamento ignora, não ocupa minuto nenhum
+            n = peso(l)
+            base = _minuto(original)
+            fixo = self._fixos.pop(l["id"], None) if self._fixos else None
+            if fixo is not None:
+                run_at = fixo
+                self._somar(l["template"], _minuto(fixo), n)
+            else:
+                run_at = self._escolher(l["template"], original, base, n, depois)
+            antes[base] += n
+            horarios[l["id"]] = (run_at, original, n)
+            l["run_at"] = run_at
+
+    def _escolher(self, template: str, original: datetime, base: int, n: int, depois: int) -> datetime:
+        """posiciona o lembrete e devolve o horário dele; a carga do minuto já sai somada."""
+        tolerancia = self.tolerancias.get(template, 0)
+        primeiro, ultimo = max(base - tolerancia, depois), base + tolerancia
+        if tolerancia <= 0 or primeiro > ultimo:
+            self._somar(template, base, n)
+            return original
+
+        carga, inicio = self._carga, self._inicio
+        if inicio <= primeiro and ultimo - inicio < len(carga):
+            ini, fim = primeiro - inicio, ultimo - inicio
+        else:
+            ini, fim = self._indices(primeiro, ultimo)
+            carga, inicio = self._carga, self._inicio
+        menor = min(carga[ini:fim + 1])
+        limite = max(menor, min(menor + n, self.capacidade - n))
+        centro = base - inicio
+        escolhido = centro if ini <= centro and carga[centro] <= limite else None
+        d = 1
+        while escolhido is None:  # o mais próximo do original; depois no empate
+            if centro + d <= fim and carga[centro + d] <= limite:
+                escolhido = centro + d
+            elif centro - d >= ini and carga[centro - d] <= limite:
+                escolhido = centro - d
+            d += 1
+        ocupado = carga[escolhido]
+        if ocupado + n > self.capacidade:
+            self.sem_folga[template] += 1
+        carga[escolhido] = ocupado + n
+        segundos = min(59, ocupado * 60 // self.capacidade)
+        if original.second or original.microsecond:
+            original = original.replace(second=0, microsecond=0)
+        return original + _DESLOCAMENTOS[escolhido - centro, segundos]
+
+    def _somar(self, template: str, minuto: int, n: int) -> None:
+        i, _ = self._indices(minuto, minuto)
+        if self._carga[i] + n > self.capacidade:
+            self.sem_folga[template] += 1
+        self._carga[i] += n
+
+    def horario(self, lembrete_id: str) -> Optional[datetime]:
+        """horário suavizado (ou persistido) do lembrete; None se não passou por aqui."""
+        marcado = self._horarios.get(lembrete_id)
+        return marcado[0] if marcado else self._fixos.get(lembrete_id)
+
+    def liberar(self, ids: Iterable[str]) -> None:
+        """lembretes removidos da agenda: a vaga volta para o minuto."""
+        for lembrete_id in ids:
+            marcado = self._horarios.pop(lembrete_id, None)
+            if marcado is None:
+                continue
+            run_at, original, n = marcado
+            self._carga[_minuto(run_at) - self._inicio] -= n
+            self.antes[_minuto(original)] -= n
+
+    def acima(self) -> int:
+        """minutos acima do ritmo alvo depois da suavização."""
+        return sum(1 for n in self._carga if n > self.capacidade)
+
+    def relatorio(self) -> str:
+        texto = histograma(self.antes, dict(enumerate(self._carga)), self.capacidade)
+        if self.sem_folga:
+            por_template = ", ".join(f"{t}: {n}" for t, n in self.sem_folga.most_common())
+            texto += (f"\n{sum(self.sem_folga.values())} lembretes passaram do ritmo alvo porque a janela de "
+                      f"tolerância inteira estava cheia ou o template não pode andar ({por_template})")
+        return texto
+
+# -------------------- relatório --------------------
+FAIXAS = (1, 10, 50, 100, 250, 500, 1000, 2500, 5000)
+
+def _faixa(n: int) -> str:
+    anterior = 0
+    for limite in FAIXAS:
+        if n <= limite:
+            return f"{anterior + 1}-{limite}"
+        anterior = limite
+    return f">{FAIXAS[-1]}"
+
+def _percentil(valores: List[int], p: float) -> int:
+    return valores[min(len(valores) - 1, int(len(valores) * p))] if valores else 0
+
+def histograma(antes: Mapping[Any, int], depois: Mapping[Any, int], capacidade: int = 0) -> str:
+    """minutos por faixa de mensagens/min, no horário exato x suavizado, e os picos de cada um."""
+    a = sorted(n for n in antes.values() if n > 0)
+    d = sorted(n for n in depois.values() if n > 0)
+    contagem_a = Counter(_faixa(n) for n in a)
+    contagem_d = Counter(_faixa(n) for n in d)
+    linhas = [f"{'msgs/min':>12} {'minutos antes':>14} {'minutos depois':>15}"]
+    anterior = 0
+    for limite in FAIXAS + (None,):
+        faixa = f"{anterior + 1}-{limite}" if limite else f">{FAIXAS[-1]}"
+        if contagem_a[faixa] or contagem_d[faixa]:
+            linhas.append(f"{faixa:>12} {contagem_a[faixa]:>14} {contagem_d[faixa]:>15}")
+        anterior = limite or anterior
+    linhas.append(f"{'pico':>12} {a[-1] if a else 0:>14} {d[-1] if d else 0:>15}")
+    linhas.append(f"{'p99':>12} {_percentil(a, 0.99):>14} {_percentil(d, 0.99):>15}")
+    linhas.append(f"{'minutos':>12} {len(a):>14} {len(d):>15}")
+    if capacidade:
+        acima_a = sum(1 for n in a if n > capacidade)
+        acima_d = sum(1 for n in d if n > capacidade)
+        linhas.append(f"{f'>{capacidade}':>12} {acima_a:>14} {acima_d:>15}   (acima do ritmo alvo)")
+    return "\n".join(linhas)
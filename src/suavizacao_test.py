@@ -0,0 +1,68 @@
+# src/suavizacao_test.py
+# Suavização dos picos: ritmo alvo por minuto, tolerância de cada template e o que não coube.
+#   python -m pytest src/suavizacao_test.py
+from datetime import datetime, timedelta
+
+from suavizacao import Suavizador
+
+AGORA = datetime(2030, 1, 1, 8, 0)
+PICO  = datetime(2030, 1, 1, 10, 0)
+
+def _lembrete(i, template, run_at, responsavel=None):
+    telefone = f"55119{i:08d}"
+    return {"id": f"{telefone}_{template}", "template": template, "run_at": run_at,
+            "args": [template, telefone, ["P"], responsavel, None, run_at.isoformat()]}
+
+def _pico(flexiveis=30, fixos=8):
+    """lembretes flexíveis chegando antes dos que não podem andar, todos no mesmo minuto."""
+    lembretes = [_lembrete(i, "lembrete_24h", PICO) for i in range(flexiveis)]
+    for k in range(fixos):
+        lembretes.insert(4 * k + 4, _lembrete(1000 + k, "consulta_comecando", PICO))
+    return lembretes
+
+def _suavizador(capacidade=10):
+    return Suavizador(capacidade / 60, {"lembrete_24h": 5, "consulta_comecando": 0})
+
+def test_nivela_a_janela_e_abre_espaco_para_quem_nao_anda():
+    s = _suavizador()
+    lembretes = _pico()
+    s.ajustar(lembretes, AGORA)
+
+    acima_antes = sum(1 for n in s.antes.values() if n > s.capacidade)
+    assert acima_antes == 1 and s.acima() == 0
+    assert max(s.carga.values()) <= s.capacidade
+    assert sum(s.carga.values()) == 38
+    for l in lembretes:
+        if l["template"] == "consulta_comecando":
+            assert l["run_at"] == PICO
+        else:
+            assert abs(l["run_at"] - PICO) < timedelta(minutes=6)
+    assert "passaram do ritmo" not in s.relatorio()
+
+def test_minuto_com_folga_nao_muda():
+    s = _suavizador()
+    l = _lembrete(1, "lembrete_24h", PICO, responsavel="5513900000001")
+    s.ajustar([l], AGORA)
+    assert l["run_at"] == PICO and s.carga == {PICO: 2}
+
+def test_janela_lotada_e_relatada():
+    s = _suavizador()
+    lembretes = [_lembrete(i, "consulta_comecando", PICO) for i in range(15)]
+    s.ajustar(lembretes, AGORA)
+
+    assert s.acima() == 1
+    assert s.sem_folga == {"consulta_comecando": 5}
+    assert "5 lembretes passaram do ritmo alvo" in s.relatorio()
+
+def test_replanejar_devolve_o_mesmo_horario_e_liberar_solta_a_vaga():
+    s = _suavizador()
+    lembretes = _pico()
+    s.ajustar(lembretes, AGORA)
+    horarios = {l["id"]: l["run_at"] for l in lembretes}
+
+    de_novo = _pico()
+    s.ajustar(de_novo, AGORA)
+    assert {l["id"]: l["run_at"] for l in de_novo} == horarios
+
+    s.liberar(horarios)
+    assert s.carga == {} and s.acima() == 0
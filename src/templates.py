@@ -0,0 +1,122 @@
+# src/templates.py
+# Registro dos templates aprovados na Meta: quantos parâmetros, se têm botão de URL
+# e o payload já serializado, com buracos só para `to`, parâmetros e link.
+import json
+from json.encoder import encode_basestring_ascii as _json_str
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+class TemplateInvalido(ValueError):
+    """parâmetros que não batem com o template registrado."""
+
+def montar_payload(
+        template_name: str,
+        to_e164: str,
+        body_params: Iterable[str],
+        button_url_param: Optional[str],
+        lang_code: str,
+) -> Dict[str, Any]:
+    """payload completo do POST /messages (templates fora do registro e montagem dos esqueletos)."""
+    components: List[Dict[str, Any]] = [{
+        "type": "body",
+        "parameters": [{"type": "text", "text": str(v)} for v in body_params],
+    }]
+
+    if button_url_param:
+        components.append({
+            "type": "button",
+            "sub_type": "url",
+            "index": "0",
+            "parameters": [{"type": "text", "text": str(button_url_param)}],
+        })
+
+    return {
+        "messaging_product": "whatsapp",
+        "to": to_e164,
+        "type": "template",
+        "template": {
+            "name": template_name,
+            "language": {"code": lang_code},
+            "components": components,
+        },
+    }
+
+class Template:
+    """
+    um template aprovado: `n_params` parâmetros de corpo e, com `botao_url`, o
+    sufixo do botão de URL dinâmico (índice 0). O JSON de cada idioma é gerado
+    uma vez; corpo() só escapa e encaixa os valores variáveis.
+    """
+
+    def __init__(self, nome: str, n_params: int, botao_url: bool = False):
+        self.nome = nome
+        self.n_params = n_params
+        self.botao_url = botao_url
+        self._esqueletos: Dict[str, List[str]] = {}
+
+    def validar(self, params: Sequence[Any], link: Optional[str] = None) -> None:
+        if len(params) != self.n_params:
+            raise TemplateInvalido(f"{self.nome}: esperados {self.n_params} parâmetros, vieram {len(params)}")
+        vazios = [i for i, v in enumerate(params, 1) if v is None or not str(v).strip()]
+        if vazios:
+            raise TemplateInvalido(f"{self.nome}: parâmetros vazios nas posições {vazios}")
+        if self.botao_url and not link:
+            raise TemplateInvalido(f"{self.nome}: o botão de URL precisa do link")
+        if link and not self.botao_url:
+            raise TemplateInvalido(f"{self.nome}: template sem botão de URL, mas veio link")
+
+    def _esqueleto(self, idioma: str) -> List[str]:
+        """pedaços fixos do JSON entre os valores variáveis (to, parâmetros, link)."""
+        marcas = [f"\x00{i}\x00" for i in range(1 + self.n_params + self.botao_url)]
+        link = marcas[-1] if self.botao_url else None
+        texto = json.dumps(montar_payload(self.nome, marcas[0], marcas[1:1 + self.n_params], link, idioma))
+        partes = []
+        for marca in marcas:
+            antes, texto = texto.split(_json_str(marca), 1)
+            partes.append(antes)
+        partes.append(texto)
+        self._esqueletos[idioma] = partes
+        return partes
+
+    def corpo(self, to_e164: str, params: Sequence[Any], link: Optional[str], idioma: str) -> str:
+        """
+        JSON do POST, igual a json.dumps(montar_payload(...)). Os parâmetros já foram
+        validados no agendamento; aqui só a quantidade é conferida.
+        """
+        partes = self._esqueletos.get(idioma) or self._esqueleto(idioma)
+        valores = [_json_str(to_e164)]
+        valores += [_json_str(str(v)) for v in params]
+        if self.botao_url:
+            valores.append(_json_str(str(link)))
+        if len(valores) != len(partes) - 1:
+            raise TemplateInvalido(f"{self.nome}: esperados {self.n_params} parâmetros, vieram {len(params)}")
+        return partes[0] + "".join([v + p for v, p in zip(valores, partes[1:])])
+
+# -------------------- registro --------------------
+REGISTRO: Dict[str, Template] = {}
+
+def registrar(nome: str, n_params: int, botao_url: bool = False) -> Template:
+    REGISTRO[nome] = Template(nome, n_params, botao_url)
+    return REGISTRO[nome]
+
+registrar("lembrete_48h",       3)                  # nome, data amigável, hora
+registrar("lembrete_24h",       3)
+registrar("lembrete__1h",       2)                  # nome, hora
+registrar("consulta_comecando", 2, botao_url=True)  # + link da teleconsulta no botão
+registrar("lembrete_agrupado",  2)                  # quando, "Ana – 14:30; João – 15:00" (agrupamento.py)
+
+def obter(nome: str) -> Template:
+    try:
+        return REGISTRO[nome]
+    except KeyError:
+        raise TemplateInvalido(f"template não registrado: {nome}") from None
+
+def validar(nome: str, params: Sequence[Any], link: Optional[str] = None) -> None:
+    """confere os parâmetros no agendamento; TemplateInvalido se a Meta recusaria o envio."""
+    obter(nome).validar(params, link)
+
+def corpo(nome: str, to_e164: str, params: Iterable[Any], link: Optional[str], idioma: str) -> str:
+    """JSON do POST: esqueleto do registro ou, para templates fora dele, montagem completa."""
+    template = REGISTRO.get(nome)
+    if template is None:
+        return json.dumps(montar_payload(nome, to_e164, params, link, idioma))
+    return template.corpo(to_e164, params if isinstance(params, (list, tuple)) else list(params), link, idioma)
@@ -0,0 +1,37 @@
+# src/templates_test.py
+# O JSON pré-montado de cada template tem que ser byte a byte o do json.dumps(montar_payload(...)).
+#   python -m pytest src/templates_test.py
+import json
+
+import pytest
+
+import templates
+from templates import REGISTRO, TemplateInvalido, corpo, montar_payload
+
+# valores que o escape do JSON precisa tratar: aspas, barra, acento, emoji, controle
+VALORES = ["Ana", 'João "Jota" d\'Ávila', "C:\\pasta\\arquivo", "São Paulo – 14:30 😊", "linha1\nlinha2\t\x01", "42"]
+LINK = "https://hcclinicas.org/teleconsulta/abc?x=1&y=\"2\""
+
+@pytest.mark.parametrize("nome", sorted(REGISTRO))
+@pytest.mark.parametrize("idioma", ["pt_BR", "en_US"])
+def test_corpo_igual_ao_json_dumps(nome, idioma):
+    t = REGISTRO[nome]
+    link = LINK if t.botao_url else None
+    for inicio in range(len(VALORES)):
+        params = (VALORES * 2)[inicio:inicio + t.n_params]
+        esperado = json.dumps(montar_payload(nome, "5511900000001", params, link, idioma))
+        assert corpo(nome, "5511900000001", params, link, idioma) == esperado
+        assert json.loads(corpo(nome, "5511900000001", params, link, idioma)) == json.loads(esperado)
+
+def test_template_fora_do_registro_monta_inteiro():
+    params = iter(["Ana", "amanhã"])  # qualquer iterável
+    assert corpo("campanha_x", "5511900000001", params, None, "pt_BR") == \
+        json.dumps(montar_payload("campanha_x", "5511900000001", ["Ana", "amanhã"], None, "pt_BR"))
+
+def test_quantidade_errada_de_parametros():
+    with pytest.raises(TemplateInvalido, match="esperados 3"):
+        corpo("lembrete_24h", "5511900000001", ["Ana", "10/01"], None, "pt_BR")
+    with pytest.raises(TemplateInvalido, match="precisa do link"):
+        templates.validar("consulta_comecando", ["Ana", "09:00"])
+    with pytest.raises(TemplateInvalido, match="não registrado"):
+        templates.validar("nao_existe", [])
@@ -1,83 +1,189 @@
 # src/webhook.py
-from flask import Flask, request, jsonify
-import os, json, requests, logging
-from pathlib import Path
+import os, time, queue, threading
+from config import get_config  # primeiro: carrega o .env antes das constantes dos outros módulos
+from flask import Flask, Response, request, jsonify
+from logconfig import Json, setup_logger
+from metricas import CONTENT_TYPE, exportar
+import perfil
+from storage import get_storage
+from whatsapp import get_client
+from status_envios import LoteStatus
+from eventos import (VistosTTL, acoes_da_mensagem, conferir_resposta, mensagens, statuses,
+                     payload_texto, payload_botoes, ACAO_ESPERA, ACAO_TENTATIVAS,
+                     FILA, MENSAGENS, STATUSES, TEMPO_EVENTO, TEMPO_REQUISICAO)
 
 # -------------------- logging --------------------
-def setup_logger(name: str, file_name: str) -> logging.Logger:
-    logs_dir = Path("logs")
-    logs_dir.mkdir(exist_ok=True)
-    logger = logging.getLogger(name)
-    logger.setLevel(logging.INFO)
-    if not logger.handlers:
-        fh = logging.FileHandler(logs_dir / file_name, encoding="utf-8")
-        sh = logging.StreamHandler()
-        fmt = logging.Formatter("%(asctime)s [%(levelname)s] %(message)s")
-        fh.setFormatter(fmt); sh.setFormatter(fmt)
-        logger.addHandler(fh); logger.addHandler(sh)
-    return logger
-
 logger = setup_logger("webhook", "webhook.log")
 
 # -------------------- env/config --------------------
-VERIFY_TOKEN    = os.getenv("WEBHOOK_VERIFY_TOKEN", "token123")
-WHATSAPP_TOKEN  = os.getenv("WHATSAPP_TOKEN")
-PHONE_NUMBER_ID = os.getenv("PHONE_NUMBER_ID")
-API_VERSION     = os.getenv("WHATSAPP_API_VERSION", "v23.0")
+# verify token, Graph e credenciais: config.get_config()
 
-BASE_DIR        = Path(__file__).resolve().parent
-PACIENTES_PATH  = BASE_DIR / "pacientes.json"
+# pool que processa os eventos fora da requisição
+WEBHOOK_WORKERS  = int(os.getenv("WEBHOOK_WORKERS", "4"))
+WEBHOOK_FILA_MAX = int(os.getenv("WEBHOOK_FILA_MAX", "1000"))
 
-PAUSAR_CMD   = "PAUSAR"
-RETORNAR_CMD = "RETORNAR"
+# dedup de reentregas: ids de mensagem vistos nas últimas 24h
+WEBHOOK_DEDUP_MAX = int(os.getenv("WEBHOOK_DEDUP_MAX", "100000"))
+WEBHOOK_DEDUP_TTL = float(os.getenv("WEBHOOK_DEDUP_TTL", str(24 * 3600)))
 
 app = Flask(__name__)
 
-def load_pacientes():
-    if PACIENTES_PATH.exists():
-        return json.loads(PACIENTES_PATH.read_text(encoding="utf-8"))
-    return []
-
-def save_pacientes(data):
-    PACIENTES_PATH.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
-
-def _graph_url(path: str) -> str:
-    return f"https://graph.facebook.com/{API_VERSION}/{path}"
-
 def send_text_message(to_number: str, text: str):
-    if not WHATSAPP_TOKEN or not PHONE_NUMBER_ID:
+    config = get_config()
+    if not config.credenciais:
         logger.error("WHATSAPP_TOKEN/PHONE_NUMBER_ID ausentes; não enviei mensagem.")
         return
-    url = _graph_url(f"{PHONE_NUMBER_ID}/messages")
-    headers = {"Authorization": f"Bearer {WHATSAPP_TOKEN}", "Content-Type": "application/json"}
-    payload = {"messaging_product": "whatsapp", "to": to_number, "type": "text", "text": {"body": text}}
-    r = requests.post(url, headers=headers, json=payload, timeout=15)
-    logger.info(f"Resposta envio texto ({to_number}): {r.status_code} {r.text[:200]}")
+    r = get_client().post(config.messages_url, payload_texto(to_number, text), timeout=15)
+    conferir_resposta(r, "texto", to_number)
 
 def send_button_message(to_number: str, text: str, buttons: list):
-    if not WHATSAPP_TOKEN or not PHONE_NUMBER_ID:
+    config = get_config()
+    if not config.credenciais:
         logger.error("WHATSAPP_TOKEN/PHONE_NUMBER_ID ausentes; não enviei botão.")
         return
-    url = _graph_url(f"{PHONE_NUMBER_ID}/messages")
-    headers = {"Authorization": f"Bearer {WHATSAPP_TOKEN}", "Content-Type": "application/json"}
-    payload = {
-        "messaging_product": "whatsapp",
-        "to": to_number,
-        "type": "interactive",
-        "interactive": {
-            "type": "button",
-            "body": {"text": text},
-            "action": {"buttons": [{"type": "reply", "reply": {"id": b["id"], "title": b["title"]}} for b in buttons]}
+    r = get_client().post(config.messages_url, payload_botoes(to_number, text, buttons), timeout=15)
+    conferir_resposta(r, "botão", to_number)
+
+# -------------------- processamento --------------------
+vistos = VistosTTL(capacidade=WEBHOOK_DEDUP_MAX, ttl=WEBHOOK_DEDUP_TTL)
+status_lote = LoteStatus()  # statuses de entrega gravados em lote no status_envios
+
+def processar_mensagem(msg: dict):
+    """uma mensagem recebida: clique em botão ou comando de texto."""
+    for acao in acoes_da_mensagem(msg):
+        for tentativa in range(1, ACAO_TENTATIVAS + 1):
+            try:
+                executar_acao(acao)
+                break
+            except Exception as ex:
+                if tentativa == ACAO_TENTATIVAS:
+                    raise
+                espera = ACAO_ESPERA * 2 ** (tentativa - 1)
+                logger.warning("Ação %s falhou (%s); tentativa %d de %d em %.1fs",
+                               acao[0], ex, tentativa + 1, ACAO_TENTATIVAS, espera)
+                time.sleep(espera)
+
+def executar_acao(acao):
+    if acao[0] == "ativo":
+        _, responsavel, ativo = acao
+        get_storage().set_responsavel_ativo(responsavel, ativo)
+        logger.info("%s -> responsavel_ativo=%s", responsavel, ativo)
+    elif acao[0] == "texto":
+        send_text_message(*acao[1:])
+    elif acao[0] == "botao":
+        send_button_message(*acao[1:])
+
+def processar_evento(data: dict):
+    """trata um POST do webhook inteiro: todas as entries, changes e mensagens."""
+    # dump completo só de uma amostra (LOG_AMOSTRA_EVENTOS); o JSON é montado no listener
+    logger.info("Evento recebido: %s", Json(data), extra={"amostra": "eventos"})
+
+    for msg in mensagens(data):
+        msg_id = msg.get("id")
+        if msg_id and not vistos.marcar(msg_id):
+            MENSAGENS.inc(resultado="repetida")
+            logger.info("Mensagem %s repetida - ignorada", msg_id)
+            continue
+        try:
+            processar_mensagem(msg)
+            MENSAGENS.inc(resultado="processada")
+        except Exception as ex:
+            # id continua marcado: a Meta já recebeu 200 e não vai reentregar
+            MENSAGENS.inc(resultado="erro")
+            logger.exception("Mensagem %s perdida após %d tentativas: %s", msg_id, ACAO_TENTATIVAS, ex)
+
+    # statuses (enviado/entregue/lido/falhou) – vão para o status_envios
+    lista = list(statuses(data))
+    if lista:
+        for st in lista:
+            STATUSES.inc(status=st.get("status"))
+        status_lote.adicionar(lista)
+        logger.info("%d status recebidos", len(lista))
+
+class ProcessadorEventos:
+    """
+    Fila limitada + pool de threads para os eventos do webhook.
+    - a rota só valida e enfileira; a Meta recebe 200 em milissegundos
+    - fila cheia: enfileirar() devolve False e a rota responde 503 (a Meta reenvia depois)
+    """
+
+    def __init__(self, processar, workers: int = 4, capacidade: int = 1000):
+        self.processar = processar
+        self.workers = workers
+        self.fila: "queue.Queue[dict]" = queue.Queue(maxsize=capacidade)
+        self._lock = threading.Lock()
+        self._threads = []
+        self.processados = 0
+        self.erros = 0
+        self.rejeitados = 0
+
+    def _iniciar(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                t = threading.Thread(target=self._loop, name=f"webhook-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def enfileirar(self, data: dict) -> bool:
+        self._iniciar()
+        try:
+            self.fila.put_nowait(data)
+            return True
+        except queue.Full:
+            with self._lock:
+                self.rejeitados += 1
+            return False
+
+    def _loop(self):
+        while True:
+            data = self.fila.get()
+            t0 = time.perf_counter()
+            try:
+                with perfil.etapa("webhook.evento"):
+                    self.processar(data)
+                with self._lock:
+                    self.processados += 1
+            except Exception as e:
+                with self._lock:
+                    self.erros += 1
+                logger.exception("Erro no worker do webhook: %s", e)
+            finally:
+                TEMPO_EVENTO.observar(time.perf_counter() - t0)
+                self.fila.task_done()
+
+    def aguardar(self):
+        """bloqueia até a fila esvaziar (testes/encerramento)."""
+        self.fila.join()
+
+    def stats(self) -> dict:
+        return {
+            "fila": self.fila.qsize(),
+            "capacidade": self.fila.maxsize,
+            "workers": self.workers,
+            "processados": self.processados,
+            "erros": self.erros,
+            "rejeitados": self.rejeitados,
+            **({"perfil": perfil.dados()} if perfil.LIGADO else {}),
         }
-    }
-    r = requests.post(url, headers=headers, json=payload, timeout=15)
-    logger.info(f"Resposta envio botão ({to_number}): {r.status_code} {r.text[:200]}")
+
+processador = ProcessadorEventos(processar_evento, workers=WEBHOOK_WORKERS, capacidade=WEBHOOK_FILA_MAX)
+FILA.funcao = lambda: processador.fila.qsize()
 
 # -------------------- routes --------------------
 @app.get("/")
 def health():
     return "OK - webhook ativo", 200
 
+@app.get("/stats")
+def stats():
+    return jsonify({**processador.stats(), "ids_vistos": len(vistos)}), 200
+
+@app.get("/metrics")
+def metrics():
+    return Response(exportar(), content_type=CONTENT_TYPE)
+
 @app.route("/webhook", methods=["GET", "POST"])
 def webhook():
     # verificação (GET)
@@ -85,84 +191,29 @@ def webhook():
         token     = request.args.get("hub.verify_token")
         challenge = request.args.get("hub.challenge")
         mode      = request.args.get("hub.mode")
-        if mode == "subscribe" and token == VERIFY_TOKEN:
+        if mode == "subscribe" and token == get_config().verify_token:
             logger.info("Verificação de webhook OK")
             return challenge, 200
         logger.warning("Verificação de webhook FALHOU")
         return "Erro: token inválido", 403
 
     # eventos (POST)
-    data = request.get_json(silent=True, force=True) or {}
-    logger.info(f"Evento recebido: {json.dumps(data, ensure_ascii=False)}")
-
-    try:
-        entries = data.get("entry", [])
-        for e in entries:
-            for ch in e.get("changes", []):
-                value = ch.get("value", {})
-
-                # 1) botões (interactive.button_reply)
-                messages = value.get("messages", [])
-                if messages:
-                    msg = messages[0]
-                    from_number = msg.get("from")
-
-                    interactive_obj = msg.get("interactive")
-                    if interactive_obj and interactive_obj.get("type") == "button_reply":
-                        button_reply = interactive_obj.get("button_reply", {})
-                        payload = button_reply.get("id")  # "confirmar" | "ativar"
-                        logger.info(f"Botão clicado por {from_number}: {payload}")
-
-                        pacientes = load_pacientes()
-                        if payload == "confirmar":
-                            for p in pacientes:
-                                if p.get("responsavel") == from_number:
-                                    p["responsavel_ativo"] = False
-                            save_pacientes(pacientes)
-                            send_text_message(from_number, "✅ Você parou de receber os lembretes.")
-                            logger.info(f"{from_number} -> responsavel_ativo=False")
-
-                        elif payload == "ativar":
-                            for p in pacientes:
-                                if p.get("responsavel") == from_number:
-                                    p["responsavel_ativo"] = True
-                            save_pacientes(pacientes)
-                            send_text_message(from_number, "✅ Você voltou a receber os lembretes.")
-                            logger.info(f"{from_number} -> responsavel_ativo=True")
-                        return jsonify({"status": "ok"}), 200
-
-                    # 2) textos simples (PAUSAR / RETORNAR)
-                    text_obj = msg.get("text")
-                    if text_obj:
-                        body = (text_obj.get("body") or "").strip().upper()
-                        logger.info(f"Texto de {from_number}: {body}")
-
-                        if body == PAUSAR_CMD:
-                            send_button_message(
-                                from_number,
-                                "Você pediu para parar de receber os lembretes. Confirme abaixo:",
-                                [{"id": "confirmar", "title": "CONFIRMAR"}]
-                            )
-                        elif body == RETORNAR_CMD:
-                            send_button_message(
-                                from_number,
-                                "Deseja voltar a receber os lembretes? Clique abaixo:",
-                                [{"id": "ativar", "title": "ATIVAR"}]
-                            )
-                        else:
-                            send_text_message(
-                                from_number,
-                                "Comandos: PAUSAR (parar de receber) • RETORNAR (voltar a receber)"
-                            )
-                        return jsonify({"status": "ok"}), 200
-
-                # 3) statuses (entregue/lido) – útil para auditoria
-                statuses = value.get("statuses", [])
-                for st in statuses:
-                    logger.info(f"Status recebido: {json.dumps(st, ensure_ascii=False)}")
-
-    except Exception as e:
-        logger.exception(f"Erro ao processar webhook: {e}")
+    t0 = time.perf_counter()
+    with perfil.etapa("webhook.requisicao"):
+        resposta = receber_evento()
+    TEMPO_REQUISICAO.observar(time.perf_counter() - t0, status=resposta[1])
+    return resposta
+
+def receber_evento():
+    """POST do webhook: valida, enfileira e responde."""
+    data = request.get_json(silent=True, force=True)
+    if not isinstance(data, dict):
+        logger.warning("POST sem JSON válido no webhook")
+        return jsonify({"status": "invalid"}), 400
+
+    if not processador.enfileirar(data):
+        logger.warning("Fila do webhook cheia (%d); pedindo reenvio", processador.fila.maxsize)
+        return jsonify({"status": "busy"}), 503, {"Retry-After": "5"}
 
     return jsonify({"status": "received"}), 200
 
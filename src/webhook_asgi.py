@@ -0,0 +1,266 @@
+# src/webhook_asgi.py
+# Webhook em ASGI puro: mesmas rotas do webhook.py, handlers assíncronos e cliente httpx não bloqueante.
+#   uvicorn webhook_asgi:app --app-dir src --port 5000 --workers 4
+import os, json, time, asyncio
+from urllib.parse import parse_qs
+from config import get_config  # primeiro: carrega o .env antes das constantes dos outros módulos
+from storage import get_storage
+from whatsapp import RETRIES
+from status_envios import LoteStatus
+from logconfig import Json, setup_logger
+from metricas import CONTENT_TYPE, exportar
+import perfil
+from eventos import (VistosSQLite, acoes_da_mensagem, conferir_resposta, mensagens, statuses,
+                     payload_texto, payload_botoes, ACAO_ESPERA, ACAO_TENTATIVAS,
+                     FILA, MENSAGENS, STATUSES, TEMPO_EVENTO, TEMPO_REQUISICAO)
+
+# -------------------- logging --------------------
+logger = setup_logger("webhook", "webhook.log")
+
+# -------------------- env/config --------------------
+# verify token, Graph e credenciais: config.get_config()
+
+# tarefas asyncio que processam os eventos (cada uma espera a Graph sem prender thread)
+WEBHOOK_TAREFAS   = int(os.getenv("WEBHOOK_TAREFAS", "32"))
+WEBHOOK_FILA_MAX  = int(os.getenv("WEBHOOK_FILA_MAX", "1000"))
+WEBHOOK_DEDUP_TTL = float(os.getenv("WEBHOOK_DEDUP_TTL", str(24 * 3600)))
+CORPO_MAX         = 1024 * 1024  # bytes; os POSTs da Meta têm poucos KB
+
+class WebhookASGI:
+    """
+    App ASGI com as rotas /, /stats e /webhook.
+    - POST valida, põe numa asyncio.Queue limitada e responde (503 com a fila cheia)
+    - tarefas consomem a fila e respondem ao usuário via httpx.AsyncClient
+    - SQLite (storage e dedup) roda em asyncio.to_thread para não travar o loop
+    - dedup em SQLite: com --workers N, a reentrega pode cair em outro processo
+    """
+
+    def __init__(self, tarefas: int = WEBHOOK_TAREFAS, capacidade: int = WEBHOOK_FILA_MAX, vistos=None):
+        """vistos: dedup a usar (padrão VistosSQLite no banco do storage)."""
+        self.tarefas = tarefas
+        self.capacidade = capacidade
+        self.vistos = vistos
+        self.status_lote = LoteStatus()
+        self.fila = None
+        self.client = None
+        self._tarefas = []
+        self._iniciando = asyncio.Lock()
+        self.processados = 0
+        self.erros = 0
+        self.rejeitados = 0
+
+    # -------------------- ciclo de vida --------------------
+    async def iniciar(self):
+        if self.fila is not None:
+            return
+        async with self._iniciando:
+            if self.fila is not None:
+                return
+            import httpx  # só este modo precisa do cliente assíncrono
+            limits = httpx.Limits(max_connections=self.tarefas, max_keepalive_connections=self.tarefas)
+            self.client = httpx.AsyncClient(headers=get_config().headers, timeout=15,
+                                            transport=httpx.AsyncHTTPTransport(retries=RETRIES, limits=limits))
+            if self.vistos is None:
+                self.vistos = await asyncio.to_thread(VistosSQLite, ttl=WEBHOOK_DEDUP_TTL)
+            self._tarefas = [asyncio.create_task(self._loop()) for _ in range(self.tarefas)]
+            self.fila = asyncio.Queue(maxsize=self.capacidade)
+            FILA.funcao = lambda: self.fila.qsize() if self.fila else 0
+
+    async def encerrar(self):
+        if self.fila is not None:
+            try:
+                await asyncio.wait_for(self.fila.join(), 10)
+            except asyncio.TimeoutError:
+                logger.warning("Encerrando com %d eventos na fila", self.fila.qsize())
+        await asyncio.to_thread(self.status_lote.descarregar)
+        for t in self._tarefas:
+            t.cancel()
+        self._tarefas = []
+        self.fila = None
+        if self.client is not None:
+            await self.client.aclose()
+
+    async def aguardar(self):
+        """espera a fila esvaziar (testes/encerramento)."""
+        await self.fila.join()
+
+    # -------------------- processamento --------------------
+    async def _loop(self):
+        while True:
+            data = await self.fila.get()
+            t0 = time.perf_counter()
+            try:
+                with perfil.etapa("webhook.evento"):
+                    await self.processar_evento(data)
+                self.processados += 1
+            except Exception as e:
+                self.erros += 1
+                logger.exception("Erro no worker do webhook: %s", e)
+            finally:
+                TEMPO_EVENTO.observar(time.perf_counter() - t0)
+                self.fila.task_done()
+
+    async def processar_evento(self, data: dict):
+        logger.info("Evento recebido: %s", Json(data), extra={"amostra": "eventos"})
+
+        for msg in mensagens(data):
+            msg_id = msg.get("id")
+            if msg_id and not await asyncio.to_thread(self.vistos.marcar, msg_id):
+                MENSAGENS.inc(resultado="repetida")
+                logger.info("Mensagem %s repetida - ignorada", msg_id)
+                continue
+            try:
+                await self.processar_mensagem(msg)
+                MENSAGENS.inc(resultado="processada")
+            except Exception as ex:
+                # id continua marcado: a Meta já recebeu 200 e não vai reentregar
+                MENSAGENS.inc(resultado="erro")
+                logger.exception("Mensagem %s perdida após %d tentativas: %s", msg_id, ACAO_TENTATIVAS, ex)
+
+        lista = list(statuses(data))
+        if lista:
+            for st in lista:
+                STATUSES.inc(status=st.get("status"))
+            self.status_lote.adicionar(lista)  # só acumula; a thread do lote grava
+            logger.info("%d status recebidos", len(lista))
+
+    async def processar_mensagem(self, msg: dict):
+        for acao in acoes_da_mensagem(msg):
+            for tentativa in range(1, ACAO_TENTATIVAS + 1):
+                try:
+                    await self.executar_acao(acao)
+                    break
+                except Exception as ex:
+                    if tentativa == ACAO_TENTATIVAS:
+                        raise
+                    espera = ACAO_ESPERA * 2 ** (tentativa - 1)
+                    logger.warning("Ação %s falhou (%s); tentativa %d de %d em %.1fs",
+                                   acao[0], ex, tentativa + 1, ACAO_TENTATIVAS, espera)
+                    await asyncio.sleep(espera)
+
+    async def executar_acao(self, acao):
+        if acao[0] == "ativo":
+            _, responsavel, ativo = acao
+            storage = await asyncio.to_thread(get_storage)
+            await asyncio.to_thread(storage.set_responsavel_ativo, responsavel, ativo)
+            logger.info("%s -> responsavel_ativo=%s", responsavel, ativo)
+        elif acao[0] == "texto":
+            await self._enviar(acao[1], payload_texto(*acao[1:]), "texto")
+        elif acao[0] == "botao":
+            await self._enviar(acao[1], payload_botoes(*acao[1:]), "botão")
+
+    async def _enviar(self, to_number: str, payload: dict, tipo: str):
+        config = get_config()
+        if not config.credenciais:
+            logger.error("WHATSAPP_TOKEN/PHONE_NUMBER_ID ausentes; não enviei %s.", tipo)
+            return
+        r = await self.client.post(config.messages_url, content=json.dumps(payload, ensure_ascii=False))
+        conferir_resposta(r, tipo, to_number)
+
+    def stats(self) -> dict:
+        return {
+            "fila": self.fila.qsize() if self.fila else 0,
+            "capacidade": self.capacidade,
+            "workers": self.tarefas,
+            "processados": self.processados,
+            "erros": self.erros,
+            "rejeitados": self.rejeitados,
+            **({"perfil": perfil.dados()} if perfil.LIGADO else {}),
+        }
+
+    # -------------------- ASGI --------------------
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self._lifespan(receive, send)
+        if scope["type"] != "http":
+            return
+        await self.iniciar()  # servidores sem lifespan
+
+        path, method = scope["path"], scope["method"]
+        if path == "/" and method == "GET":
+            return await _responder(send, 200, "OK - webhook ativo")
+        if path == "/stats" and method == "GET":
+            return await _responder_json(send, 200, {**self.stats(), "ids_vistos": await asyncio.to_thread(len, self.vistos)})
+        if path == "/metrics" and method == "GET":
+            return await _responder(send, 200, exportar(), tipo=CONTENT_TYPE.encode())
+        if path != "/webhook":
+            return await _responder(send, 404, "Not Found")
+
+        # verificação (GET)
+        if method == "GET":
+            args = {k: v[0] for k, v in parse_qs(scope.get("query_string", b"").decode()).items()}
+            if args.get("hub.mode") == "subscribe" and args.get("hub.verify_token") == get_config().verify_token:
+                logger.info("Verificação de webhook OK")
+                return await _responder(send, 200, args.get("hub.challenge") or "")
+            logger.warning("Verificação de webhook FALHOU")
+            return await _responder(send, 403, "Erro: token inválido")
+        if method != "POST":
+            return await _responder(send, 405, "Method Not Allowed")
+
+        # eventos (POST)
+        t0 = time.perf_counter()
+        with perfil.etapa("webhook.requisicao"):
+            status = await self.receber_evento(receive, send)
+        TEMPO_REQUISICAO.observar(time.perf_counter() - t0, status=status)
+
+    async def receber_evento(self, receive, send) -> int:
+        """POST do webhook: valida, enfileira e responde; devolve o status HTTP."""
+        corpo = await _ler_corpo(receive)
+        if corpo is None:
+            return await _responder_json(send, 413, {"status": "too_large"})
+        try:
+            data = json.loads(corpo)
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            logger.warning("POST sem JSON válido no webhook")
+            return await _responder_json(send, 400, {"status": "invalid"})
+
+        try:
+            self.fila.put_nowait(data)
+        except asyncio.QueueFull:
+            self.rejeitados += 1
+            logger.warning("Fila do webhook cheia (%d); pedindo reenvio", self.capacidade)
+            return await _responder_json(send, 503, {"status": "busy"}, [(b"retry-after", b"5")])
+        return await _responder_json(send, 200, {"status": "received"})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            evento = await receive()
+            if evento["type"] == "lifespan.startup":
+                await self.iniciar()
+                await send({"type": "lifespan.startup.complete"})
+            elif evento["type"] == "lifespan.shutdown":
+                await self.encerrar()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+async def _ler_corpo(receive):
+    """corpo inteiro da requisição; None se passar de CORPO_MAX."""
+    partes, tamanho = [], 0
+    while True:
+        evento = await receive()
+        parte = evento.get("body", b"")
+        tamanho += len(parte)
+        if tamanho > CORPO_MAX:
+            return None
+        partes.append(parte)
+        if not evento.get("more_body"):
+            return b"".join(partes)
+
+async def _responder(send, status: int, texto: str, headers=(), tipo: bytes = b"text/plain; charset=utf-8"):
+    corpo = texto.encode("utf-8")
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", tipo), (b"content-length", str(len(corpo)).encode()), *headers]})
+    await send({"type": "http.response.body", "body": corpo})
+    return status
+
+async def _responder_json(send, status: int, data: dict, headers=()):
+    return await _responder(send, status, json.dumps(data), headers, b"application/json")
+
+app = WebhookASGI()
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run("webhook_asgi:app", host="0.0.0.0", port=int(os.getenv("PORT", "5000")),
+                workers=int(os.getenv("WEBHOOK_PROCESSOS", "1")))
@@ -0,0 +1,257 @@
+# src/webhook_test.py
+# Replay de payloads gravados do webhook (src/payloads/*.json).
+# Roda sem Meta e sem WhatsApp:  python -m pytest src/webhook_test.py
+import json
+from pathlib import Path
+
+import pytest
+
+import webhook
+from config import Config
+from storage import SQLiteStorage
+from status_envios import LoteStatus, StatusEnvios
+from whatsapp import WhatsAppClient
+from whatsapp_test import GraphRoteiro
+
+PAYLOADS = Path(__file__).resolve().parent / "payloads"
+ENVIAR_TEXTO = webhook.send_text_message  # o fixture troca pelo capturador
+
+def carregar(nome: str) -> dict:
+    return json.loads((PAYLOADS / nome).read_text(encoding="utf-8"))
+
+@pytest.fixture
+def ambiente(tmp_path, monkeypatch):
+    """storage temporário, envios capturados e dedup zerado."""
+    storage = SQLiteStorage(tmp_path / "teste.db")
+    storage.importar([
+        {"nome": "Ana", "telefone": "5511900000001", "responsavel": "5513998085263",
+         "data": "2030-01-10", "hora": "09:00", "link": None},
+        {"nome": "Bia", "telefone": "5511900000002", "responsavel": "5511977776666",
+         "data": "2030-01-11", "hora": "10:00", "link": None},
+    ])
+    enviados = []
+    monkeypatch.setattr(webhook, "get_storage", lambda: storage)
+    monkeypatch.setattr(webhook, "send_text_message", lambda to, text: enviados.append(("texto", to, text)))
+    monkeypatch.setattr(webhook, "send_button_message",
+                        lambda to, text, buttons: enviados.append(("botao", to, buttons[0]["id"])))
+    monkeypatch.setattr(webhook, "vistos", webhook.VistosTTL(capacidade=100, ttl=60))
+    monkeypatch.setattr(webhook, "status_lote", LoteStatus(StatusEnvios(tmp_path / "status.db")))
+    return storage, enviados
+
+def test_lote_processa_todas_as_mensagens(ambiente):
+    storage, enviados = ambiente
+    webhook.processar_evento(carregar("lote_mensagens.json"))
+
+    assert enviados == [
+        ("botao", "5513998085263", "confirmar"),
+        ("botao", "5511988887777", "ativar"),
+        ("texto", "5511977776666", "✅ Você parou de receber os lembretes."),
+    ]
+    assert storage.responsavel_ativo("5511900000002") is False
+    assert storage.responsavel_ativo("5511900000001") is True
+
+def test_reentrega_nao_repete_efeito(ambiente):
+    storage, enviados = ambiente
+    evento = carregar("botao_confirmar.json")
+    webhook.processar_evento(evento)
+    webhook.processar_evento(evento)
+
+    assert enviados == [("texto", "5513998085263", "✅ Você parou de receber os lembretes.")]
+    assert storage.responsavel_ativo("5511900000001") is False
+
+def test_erro_temporario_repete_localmente(ambiente, monkeypatch):
+    _, enviados = ambiente
+    evento = carregar("botao_confirmar.json")
+    falhas = []
+
+    def instavel(to, text):
+        if len(falhas) < webhook.ACAO_TENTATIVAS - 1:
+            falhas.append(to)
+            raise RuntimeError("Graph fora do ar")
+        enviados.append(("texto", to, text))
+    monkeypatch.setattr(webhook, "ACAO_ESPERA", 0)
+    monkeypatch.setattr(webhook, "send_text_message", instavel)
+    webhook.processar_evento(evento)
+    webhook.processar_evento(evento)  # reentrega continua ignorada
+
+    assert len(falhas) == webhook.ACAO_TENTATIVAS - 1
+    assert enviados == [("texto", "5513998085263", "✅ Você parou de receber os lembretes.")]
+
+def test_erro_persistente_desiste_sem_travar_o_lote(ambiente, monkeypatch):
+    storage, enviados = ambiente
+    tentativas = []
+
+    def falha(to, text):
+        tentativas.append(to)
+        raise RuntimeError("Graph fora do ar")
+    monkeypatch.setattr(webhook, "ACAO_ESPERA", 0)
+    monkeypatch.setattr(webhook, "send_text_message", falha)
+    webhook.processar_evento(carregar("lote_mensagens.json"))
+
+    assert len(tentativas) == webhook.ACAO_TENTATIVAS
+    assert enviados == [("botao", "5513998085263", "confirmar"), ("botao", "5511988887777", "ativar")]
+    assert storage.responsavel_ativo("5511900000002") is False  # a pausa foi gravada antes do texto
+
+@pytest.fixture
+def graph(monkeypatch):
+    """Graph simulada com roteiro; devolve (stub, config) já apontados pelo webhook."""
+    servidores = []
+
+    def subir(roteiro=()):
+        stub = GraphRoteiro(roteiro).start()
+        servidores.append(stub)
+        config = Config({"WHATSAPP_GRAPH_URL": stub.url, "WHATSAPP_TOKEN": "t", "PHONE_NUMBER_ID": "123"})
+        cliente = WhatsAppClient(retries=0, headers=config.headers)
+        monkeypatch.setattr(webhook, "get_config", lambda: config)
+        monkeypatch.setattr(webhook, "get_client", lambda: cliente)
+        monkeypatch.setattr(webhook, "send_text_message", ENVIAR_TEXTO)
+        monkeypatch.setattr(webhook, "ACAO_ESPERA", 0)
+        return stub, config
+    yield subir
+    for stub in servidores:
+        stub.shutdown()
+        stub.server_close()
+
+def test_graph_500_e_429_repetem_localmente(ambiente, graph):
+    storage, _ = ambiente
+    stub, _ = graph(["erro", "limite"])
+    webhook.processar_evento(carregar("botao_confirmar.json"))
+
+    assert stub.stats() == {"recebidas": 3, "aceitas": 1, "erros": 1, "limitadas": 1}
+    assert [to for _, to, _ in stub.entregas] == ["5513998085263"]
+    assert storage.responsavel_ativo("5511900000001") is False
+
+def test_graph_500_persistente_desiste(ambiente, graph):
+    stub, _ = graph(["erro"] * webhook.ACAO_TENTATIVAS)
+    webhook.processar_evento(carregar("botao_confirmar.json"))
+    assert stub.stats() == {"recebidas": webhook.ACAO_TENTATIVAS, "aceitas": 0,
+                            "erros": webhook.ACAO_TENTATIVAS, "limitadas": 0}
+
+def test_graph_4xx_nao_repete(ambiente, graph, monkeypatch):
+    graph()
+    chamadas = []
+
+    class Recusa:
+        status_code = 400
+
+        def json(self):
+            return {"error": {"message": "(#131009) Parameter value is not valid", "code": 131009}}
+
+    def post(url, payload, timeout=None):
+        chamadas.append(payload["to"])
+        return Recusa()
+    monkeypatch.setattr(webhook, "get_client", lambda: type("Cliente", (), {"post": staticmethod(post)})())
+    webhook.processar_evento(carregar("botao_confirmar.json"))
+    assert chamadas == ["5513998085263"]
+
+def test_statuses_atualizam_status_envios(ambiente):
+    _, enviados = ambiente
+    store = webhook.status_lote.store
+    entregue = "wamid.HBgNNTUxMTkxOTk0MTIwOBUCABEYEjlGQjQ3RDEwNEE1QjI2RjE1MAA="
+    falhou = "wamid.HBgNNTUxMzk5ODA4NTI2MxUCABEYEkE0QjE1NjZGMjQ5RDlGQkE2MgA="
+    store.registrar_envio(entregue, "lembrete_24h", "5511919941208", consulta="2099-01-10T09:00")
+    store.registrar_envio(falhou, "lembrete_24h", "5513998085263", "5511900000001", "2099-01-10T09:00")
+
+    webhook.processar_evento(carregar("statuses.json"))
+    webhook.processar_evento(carregar("statuses.json"))  # reentrega não muda nada
+    assert webhook.status_lote.descarregar() == 6
+    assert enviados == []
+
+    por_wamid = {r["wamid"]: r for r in store.consultar(template="lembrete_24h")}
+    assert por_wamid[entregue]["status"] == "delivered"
+    assert por_wamid[entregue]["enviado_em"] == 1758650200
+    assert por_wamid[falhou]["status"] == "failed"
+    assert por_wamid[falhou]["erro"] == "131026 Message undeliverable"
+    assert [r["wamid"] for r in store.nao_entregues("lembrete_24h")] == [falhou]
+    assert [r["wamid"] for r in store.consultar(paciente="5511900000001")] == [falhou]
+
+    falhas = store.falhas_para_reenvio()
+    assert [(f["telefone"], f["wamids"]) for f in falhas] == [("5513998085263", [falhou])]
+    store.marcar_reenviados(falhas[0]["wamids"])
+    assert store.falhas_para_reenvio() == []
+
+def test_rota_enfileira_e_workers_processam(ambiente):
+    _, enviados = ambiente
+    cliente = webhook.app.test_client()
+    for nome in ("lote_mensagens.json", "botao_confirmar.json", "botao_confirmar.json", "statuses.json"):
+        r = cliente.post("/webhook", json=carregar(nome))
+        assert r.status_code == 200
+    webhook.processador.aguardar()
+
+    assert len(enviados) == 4
+    assert cliente.post("/webhook", data="nada").status_code == 400
+
+    metricas = cliente.get("/metrics").get_data(as_text=True)
+    assert 'webhook_requisicao_segundos_count{status="400"}' in metricas
+    assert 'webhook_mensagens_total{resultado="repetida"}' in metricas
+    assert "webhook_fila 0" in metricas
+
+# -------------------- ASGI (webhook_asgi.py) --------------------
+async def chamar(app, metodo, caminho, corpo=b"", query=b""):
+    """uma requisição direto no app ASGI; devolve (status, corpo)."""
+    resposta = {}
+
+    async def receive():
+        return {"type": "http.request", "body": corpo, "more_body": False}
+
+    async def send(msg):
+        if msg["type"] == "http.response.start":
+            resposta["status"] = msg["status"]
+        else:
+            resposta["corpo"] = msg.get("body", b"")
+
+    await app({"type": "http", "method": metodo, "path": caminho, "query_string": query}, receive, send)
+    return resposta["status"], resposta["corpo"]
+
+def test_asgi_mesmas_rotas_e_dedup(ambiente, tmp_path, monkeypatch):
+    import asyncio
+    import webhook_asgi
+    from eventos import VistosSQLite
+    storage, enviados = ambiente
+
+    async def enviar(self, to, payload, tipo):
+        enviados.append((payload["type"], to))
+    monkeypatch.setattr(webhook_asgi, "get_storage", lambda: storage)
+    monkeypatch.setattr(webhook_asgi.WebhookASGI, "_enviar", enviar)
+    app = webhook_asgi.WebhookASGI(tarefas=2, vistos=VistosSQLite(tmp_path / "vistos.db"))
+    app.status_lote = webhook.status_lote
+
+    async def cenario():
+        assert await chamar(app, "GET", "/") == (200, "OK - webhook ativo".encode())
+        ok = b"hub.mode=subscribe&hub.verify_token=" + webhook_asgi.get_config().verify_token.encode() + b"&hub.challenge=42"
+        assert await chamar(app, "GET", "/webhook", query=ok) == (200, b"42")
+        assert (await chamar(app, "GET", "/webhook", query=b"hub.mode=subscribe&hub.verify_token=x"))[0] == 403
+        assert (await chamar(app, "POST", "/webhook", b"nada"))[0] == 400
+
+        for nome in ("lote_mensagens.json", "botao_confirmar.json", "botao_confirmar.json", "statuses.json"):
+            assert (await chamar(app, "POST", "/webhook", json.dumps(carregar(nome)).encode()))[0] == 200
+        await app.aguardar()
+        status, metricas = await chamar(app, "GET", "/metrics")
+        assert status == 200 and b'webhook_statuses_total{status="failed"}' in metricas
+        await app.encerrar()
+    asyncio.run(cenario())
+
+    assert len(enviados) == 4
+    assert storage.responsavel_ativo("5511900000001") is False
+    assert storage.responsavel_ativo("5511900000002") is False
+    assert app.status_lote.store.contagem() == {"delivered": 1, "failed": 1}
+
+def test_asgi_graph_500_repete_localmente(ambiente, graph, tmp_path, monkeypatch):
+    import asyncio
+    import webhook_asgi
+    from eventos import VistosSQLite
+    storage, _ = ambiente
+    stub, config = graph(["erro", "erro"])
+    monkeypatch.setattr(webhook_asgi, "get_config", lambda: config)
+    monkeypatch.setattr(webhook_asgi, "get_storage", lambda: storage)
+    monkeypatch.setattr(webhook_asgi, "ACAO_ESPERA", 0)
+    app = webhook_asgi.WebhookASGI(tarefas=1, vistos=VistosSQLite(tmp_path / "vistos.db"))
+
+    async def cenario():
+        await app.iniciar()
+        await app.processar_evento(carregar("botao_confirmar.json"))
+        await app.encerrar()
+    asyncio.run(cenario())
+
+    assert stub.stats() == {"recebidas": 3, "aceitas": 1, "erros": 2, "limitadas": 0}
+    assert storage.responsavel_ativo("5511900000001") is False
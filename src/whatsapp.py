@@ -1,78 +1,355 @@
 from __future__ import annotations
-import os, json
-from typing import Iterable, Optional, List, Dict, Any
-import requests
-from dotenv import load_dotenv
+import os, json, time, threading
+from typing import TYPE_CHECKING, Iterable, Optional, List, Dict, Any, Sequence, Tuple, Union
+from config import get_config
+from metricas import BUCKETS_LATENCIA, contador, histograma
+import templates
 
-load_dotenv()
+if TYPE_CHECKING:
+    import requests
 
-API_VERSION = os.getenv("WHATSAPP_API_VERSION", "v22.0")
-PHONE_NUMBER_ID = os.getenv("PHONE_NUMBER_ID", "").strip()
-TOKEN = os.getenv("WHATSAPP_TOKEN", "").strip()
-DEFAULT_LANG = os.getenv("DEFAULT_LANG", "pt_BR").strip()
+# requests/urllib3 só entram no primeiro WhatsAppClient; asyncio e httpx, no primeiro lote.
+# Endereço, credenciais e idioma vêm do config.get_config(), lido uma vez.
+POOL_SIZE = int(os.getenv("WHATSAPP_POOL_SIZE", "20"))
+RETRIES = int(os.getenv("WHATSAPP_RETRIES", "2"))
+TIMEOUT = float(os.getenv("WHATSAPP_TIMEOUT", "30"))
+LOTE_CONCORRENCIA = int(os.getenv("WHATSAPP_LOTE_CONCORRENCIA", "20"))
 
-BASE_URL = f"https://graph.facebook.com/{API_VERSION}/{PHONE_NUMBER_ID}/messages"
-HEADERS = {
-    "Authorization": f"Bearer {TOKEN}",
-    "Content-Type": "application/json",
-}
+MPS = float(os.getenv("WHATSAPP_MPS", "80"))                     # 0 = sem limite
+PAR_INTERVALO = float(os.getenv("WHATSAPP_PAR_INTERVALO", "6"))  # s entre msgs ao mesmo número
+LIMITE_RETENTATIVAS = int(os.getenv("WHATSAPP_LIMITE_RETENTATIVAS", "3"))
+ERRO_ESPERA = float(os.getenv("WHATSAPP_ERRO_ESPERA", "0.5"))   # s antes de repetir um 5xx no lote; dobra
+
+# códigos de limite de taxa da Cloud API
+CODIGOS_LIMITE_GLOBAL = {4, 80007, 130429, 131048}
+CODIGOS_LIMITE_PAR = {131056}
 
 class WhatsAppError(Exception):
     """Erro específico para respostas da API do WhatsApp Cloud."""
 
-def _make_body_parameters(values: Iterable[str]) -> List[Dict[str, Any]]:
-    return [{"type": "text", "text": str(v)} for v in values]
+    def __init__(self, msg: str, status: Optional[int] = None,
+                 code: Optional[int] = None, subcode: Optional[int] = None):
+        super().__init__(msg)
+        self.status = status
+        self.code = code
+        self.subcode = subcode
+
+    @property
+    def limite_de_taxa(self) -> bool:
+        return self.code in CODIGOS_LIMITE_GLOBAL or self.code in CODIGOS_LIMITE_PAR
+
+# -------------------- métricas --------------------
+ENVIOS = contador("whatsapp_envios_total", "templates enviados pela Graph API por resultado (ok, erro, limite)",
+                  ("template", "resultado"))
+LATENCIA_GRAPH = histograma("whatsapp_graph_latencia_segundos", "tempo de cada POST de template na Graph API",
+                            ("template",), BUCKETS_LATENCIA)
+
+# -------------------- limite de taxa --------------------
+class RateLimiter:
+    """
+    Token bucket global (mensagens/s) + intervalo mínimo por destinatário (pair rate).
+    - reservar(to) já ocupa o próximo slot e devolve quantos segundos esperar
+    - penalizar(err, to) reage a 130429/131056: corta o ritmo pela metade e pausa
+      com backoff exponencial; o ritmo volta linearmente ao máximo em `recuperacao` s
+    """
+
+    def __init__(self, mps: float = MPS, par_intervalo: float = PAR_INTERVALO,
+                 burst: Optional[float] = None, recuperacao: float = 60.0):
+        self.mps_max = mps
+        self.mps = mps
+        self.burst = burst if burst is not None else max(mps, 1.0)
+        self.par_intervalo = par_intervalo
+        self.recuperacao = recuperacao
+
+        self._lock = threading.Lock()
+        self._tokens = self.burst
+        self._ultimo = time.monotonic()
+        self._pausa_ate = 0.0
+        self._falhas_seguidas = 0
+        self._proximo_par: Dict[str, float] = {}
+
+    def _repor(self, agora: float) -> None:
+        decorrido = agora - self._ultimo
+        self._ultimo = agora
+        if self.mps < self.mps_max:
+            self.mps = min(self.mps_max, self.mps + decorrido * self.mps_max / self.recuperacao)
+        self._tokens = min(self.burst, self._tokens + decorrido * self.mps)
+
+    def reservar(self, to_e164: str) -> float:
+        with self._lock:
+            agora = time.monotonic()
+            inicio = max(agora, self._pausa_ate)
+
+            if self.mps_max > 0:
+                self._repor(agora)
+                self._tokens -= 1
+                if self._tokens < 0:
+                    inicio = max(inicio, agora - self._tokens / self.mps)
+
+            if self.par_intervalo > 0:
+                inicio = max(inicio, self._proximo_par.get(to_e164, 0.0))
+                self._proximo_par[to_e164] = inicio + self.par_intervalo
+                if len(self._proximo_par) > 10000:
+                    self._proximo_par = {k: v for k, v in self._proximo_par.items() if v > agora}
+
+            return inicio - agora
+
+    def aguardar(self, to_e164: str) -> None:
+        espera = self.reservar(to_e164)
+        if espera > 0:
+            time.sleep(espera)
+
+    def sucesso(self) -> None:
+        self._falhas_seguidas = 0
+
+    def devolver(self, to_e164: str) -> None:
+        """a mensagem não foi aceita (ex.: 5xx): a retentativa não espera o intervalo do par."""
+        with self._lock:
+            self._proximo_par.pop(to_e164, None)
+
+    def penalizar(self, err: WhatsAppError, to_e164: str) -> None:
+        with self._lock:
+            agora = time.monotonic()
+            if err.code in CODIGOS_LIMITE_PAR:
+                atual = max(self._proximo_par.get(to_e164, 0.0), agora)
+                self._proximo_par[to_e164] = atual + self.par_intervalo * 2
+                return
+            # a mensagem não foi aceita: libera o slot do par para a retentativa
+            self._proximo_par.pop(to_e164, None)
+            # 429 de requisições que já estavam em voo é o mesmo episódio: não dobra a pausa de novo
+            if agora < self._pausa_ate:
+                return
+            self._falhas_seguidas += 1
+            backoff = min(60.0, 2.0 ** (self._falhas_seguidas - 1))
+            self._pausa_ate = max(self._pausa_ate, agora + backoff)
+            if self.mps_max > 0:
+                self.mps = max(1.0, self.mps / 2)
+                self._tokens = min(self._tokens, 0.0)
+
+_limiter: Optional[RateLimiter] = None
+_limiter_lock = threading.Lock()
+
+def get_limiter() -> RateLimiter:
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = RateLimiter()
+        return _limiter
+
+def _retry_conexao(retries: int):
+    """Retry do urllib3 que conta reset de conexão (keep-alive derrubado pelo servidor) como falha de conexão."""
+    from urllib3.exceptions import ProtocolError
+    from urllib3.util.retry import Retry
+
+    class _RetryConexao(Retry):
+        def _is_connection_error(self, err: Exception) -> bool:
+            if isinstance(err, ProtocolError) and err.args and isinstance(err.args[-1], ConnectionResetError):
+                return True
+            return super()._is_connection_error(err)
+
+    return _RetryConexao(
+        total=retries, connect=retries, read=0, status=0, other=0,
+        allowed_methods=None, backoff_factor=0.2, raise_on_status=False,
+    )
+
+class WhatsAppClient:
+    """
+    Cliente HTTP compartilhado para a Graph API.
+    - requests.Session com pool de conexões keep-alive (evita TCP+TLS por mensagem)
+    - retentativa só em falha de conexão (reset/recusa/timeout de conexão),
+      nunca em timeout de leitura ou resposta HTTP (evita mensagem duplicada)
+    - timeout por requisição
+    - stats() mostra quantas requisições reaproveitaram conexão
+    """
+
+    def __init__(self, pool_size: int = POOL_SIZE, retries: int = RETRIES,
+                 timeout: float = TIMEOUT, headers: Optional[Dict[str, str]] = None):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update(headers or get_config().headers)
+
+        self._adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size,
+                                    max_retries=_retry_conexao(retries), pool_block=True)
+        self.session.mount("https://", self._adapter)
+        self.session.mount("http://", self._adapter)
+
+        self._lock = threading.Lock()
+        self._requisicoes = 0
+
+    def post(self, url: str, payload: Union[Dict[str, Any], str], timeout: Optional[float] = None) -> "requests.Response":
+        """`payload` em dict ou já serializado (templates.corpo)."""
+        with self._lock:
+            self._requisicoes += 1
+        data = payload if isinstance(payload, str) else json.dumps(payload)
+        return self.session.post(url, data=data, timeout=timeout or self.timeout)
+
+    def stats(self) -> Dict[str, int]:
+        """requisições feitas x conexões abertas pelo pool."""
+        pools = self._adapter.poolmanager.pools
+        conexoes = sum(pools[k].num_connections for k in pools.keys())
+        return {
+            "requisicoes": self._requisicoes,
+            "conexoes_abertas": conexoes,
+            "conexoes_reutilizadas": max(self._requisicoes - conexoes, 0),
+        }
+
+    def close(self) -> None:
+        self.session.close()
+
+_client: Optional[WhatsAppClient] = None
+_client_lock = threading.Lock()
+
+def get_client() -> WhatsAppClient:
+    """cliente único por processo, criado na primeira chamada."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = WhatsAppClient()
+        return _client
+
+def _checar_resposta(status_code: int, data: Dict[str, Any], template_name: str) -> Dict[str, Any]:
+    if status_code >= 400:
+        e = data.get("error", {})
+        msg = f"HTTP {status_code} ao enviar '{template_name}'. (code={e.get('code')}, subcode={e.get('error_subcode')}) {e.get('message')}"
+        raise WhatsAppError(msg, status=status_code, code=e.get("code"), subcode=e.get("error_subcode"))
+    return data
 
 def enviar_template(
         template_name: str,
         to_e164: str,
         body_params: Iterable[str],
         button_url_param: Optional[str] = None,
-        lang_code: str = DEFAULT_LANG,
+        lang_code: Optional[str] = None,
 ) -> Dict[str, Any]:
     """
     Envia um template aprovado via WhatsApp Cloud API.
-    - template_name: 'lembrete_consulta_v2' ou 'consulta_comecando'
+    - template_name: um dos templates.REGISTRO (ex: 'consulta_comecando') ou outro aprovado
     - to_e164: número no formato E.164 sem '+', ex: '5511919941208'
     - body_params: parâmetros do corpo, na ordem do template
     - button_url_param: URL para o botão (se o template tiver botão dinâmico)
+    Os parâmetros são validados no agendamento (templates.validar), não aqui.
     """
-    if not PHONE_NUMBER_ID or not TOKEN:
+    config = get_config()
+    if not config.credenciais:
         raise RuntimeError("Configure PHONE_NUMBER_ID e WHATSAPP_TOKEN no .env.")
-    
-    components: List[Dict[str, Any]] = [{
-        "type": "body",
-        "parameters": _make_body_parameters(body_params),
-    }]
-
-    if button_url_param:
-        components.append({
-            "type": "button",
-            "sub_type": "url",
-            "index": "0",
-            "parameters": [{"type": "text", "text": str(button_url_param)}],
-        })
-
-    payload = {
-        "messaging_product": "whatsapp",
-        "to": to_e164,
-        "type": "template",
-        "template": {
-            "name": template_name,
-            "language": {"code": lang_code},
-            "components": components,
-        },
-    }
-
-    resp = requests.post(BASE_URL, headers=HEADERS, data=json.dumps(payload), timeout=30)
-    try:
-        data= resp.json()
-    except Exception:
-        data = {"raw_text": resp.text}
-
-    if resp.status_code >= 400:
-        e = data.get("error", {})
-        msg = f"HTTP {resp.status_code} ao enviar '{template_name}'. (code={e.get('code')}, subcode={e.get('error_subcode')}) {e.get('message')}"
-        raise WhatsAppError(msg)
-    
-    return data
\ No newline at end of file
+
+    payload = templates.corpo(template_name, to_e164, body_params, button_url_param,
+                              lang_code or config.default_lang)
+
+    limiter = get_limiter()
+    for tentativa in range(LIMITE_RETENTATIVAS + 1):
+        limiter.aguardar(to_e164)
+        try:
+            with LATENCIA_GRAPH.cronometrar(template=template_name):
+                resp = get_client().post(config.messages_url, payload)
+        except Exception:
+            ENVIOS.inc(template=template_name, resultado="erro")
+            raise
+        try:
+            data= resp.json()
+        except Exception:
+            data = {"raw_text": resp.text}
+
+        try:
+            data = _checar_resposta(resp.status_code, data, template_name)
+        except WhatsAppError as e:
+            # limite de taxa: desacelera e tenta de novo em vez de perder o lembrete
+            if e.limite_de_taxa and tentativa < LIMITE_RETENTATIVAS:
+                ENVIOS.inc(template=template_name, resultado="limite")
+                limiter.penalizar(e, to_e164)
+                continue
+            ENVIOS.inc(template=template_name, resultado="erro")
+            raise
+        ENVIOS.inc(template=template_name, resultado="ok")
+        limiter.sucesso()
+        return data
+
+# -------------------- envio em lote (asyncio) --------------------
+# envio = (template_name, to_e164, body_params, button_url_param)
+Envio = Tuple[str, str, Iterable[str], Optional[str]]
+
+async def enviar_templates_lote_async(
+        envios: Sequence[Envio],
+        concorrencia: int = LOTE_CONCORRENCIA,
+        lang_code: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Envia vários templates em paralelo, com no máximo `concorrencia` requisições em voo.
+    Limite de taxa e 5xx são repetidos até LIMITE_RETENTATIVAS vezes. Retorna um resultado por envio, na mesma ordem:
+    {"template", "to", "ok", "resposta", "erro", "excecao"}
+    """
+    import asyncio
+    import httpx  # só quem usa lote precisa do cliente assíncrono
+
+    config = get_config()
+    if not config.credenciais:
+        raise RuntimeError("Configure PHONE_NUMBER_ID e WHATSAPP_TOKEN no .env.")
+    lang_code = lang_code or config.default_lang
+
+    sem = asyncio.Semaphore(concorrencia)
+    limiter = get_limiter()
+    limits = httpx.Limits(max_connections=concorrencia, max_keepalive_connections=concorrencia)
+    transport = httpx.AsyncHTTPTransport(retries=RETRIES, limits=limits)
+
+    async with httpx.AsyncClient(headers=config.headers, timeout=TIMEOUT, transport=transport) as client:
+        async def enviar_um(envio: Envio) -> Dict[str, Any]:
+            template_name, to_e164, body_params, button_url_param = envio
+            resultado: Dict[str, Any] = {"template": template_name, "to": to_e164,
+                                         "ok": False, "resposta": None, "erro": None, "excecao": None}
+            try:
+                payload = templates.corpo(template_name, to_e164, body_params, button_url_param, lang_code)
+            except templates.TemplateInvalido as e:
+                ENVIOS.inc(template=template_name, resultado="erro")
+                resultado["erro"], resultado["excecao"] = str(e), e
+                return resultado
+            for tentativa in range(LIMITE_RETENTATIVAS + 1):
+                espera = limiter.reservar(to_e164)
+                if espera > 0:
+                    await asyncio.sleep(espera)
+                async with sem:
+                    t0 = time.perf_counter()
+                    try:
+                        resp = await client.post(config.messages_url, content=payload)
+                        LATENCIA_GRAPH.observar(time.perf_counter() - t0, template=template_name)
+                        try:
+                            data = resp.json()
+                        except Exception:
+                            data = {"raw_text": resp.text}
+                        resultado["resposta"] = _checar_resposta(resp.status_code, data, template_name)
+                        resultado["ok"] = True
+                        resultado["erro"] = resultado["excecao"] = None
+                    except WhatsAppError as e:
+                        resultado["erro"], resultado["excecao"] = str(e), e
+                        if e.limite_de_taxa and tentativa < LIMITE_RETENTATIVAS:
+                            ENVIOS.inc(template=template_name, resultado="limite")
+                            limiter.penalizar(e, to_e164)
+                            continue
+                    except Exception as e:
+                        resultado["erro"], resultado["excecao"] = str(e) or type(e).__name__, e
+                # 5xx é erro temporário da Graph e o lote não tem fila por trás: repete aqui
+                excecao = resultado["excecao"]
+                if isinstance(excecao, WhatsAppError) and (excecao.status or 0) >= 500 \
+                        and tentativa < LIMITE_RETENTATIVAS:
+                    ENVIOS.inc(template=template_name, resultado="erro")
+                    limiter.devolver(to_e164)
+                    await asyncio.sleep(ERRO_ESPERA * 2 ** tentativa)
+                    continue
+                ENVIOS.inc(template=template_name, resultado="ok" if resultado["ok"] else "erro")
+                if resultado["ok"]:
+                    limiter.sucesso()
+                return resultado
+            return resultado
+
+        return list(await asyncio.gather(*(enviar_um(e) for e in envios)))
+
+def enviar_templates_lote(
+        envios: Sequence[Envio],
+        concorrencia: int = LOTE_CONCORRENCIA,
+        lang_code: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """versão síncrona de enviar_templates_lote_async (para jobs do APScheduler)."""
+    import asyncio
+    return asyncio.run(enviar_templates_lote_async(envios, concorrencia, lang_code))
\ No newline at end of file
@@ -0,0 +1,134 @@
+# src/whatsapp_test.py
+# Envio em lote contra a Graph simulada (benchmarks/graph_stub.py), sem rede externa.
+#   python -m pytest src/whatsapp_test.py
+import sys
+from pathlib import Path
+
+import pytest
+
+import whatsapp
+from config import Config
+from whatsapp import RateLimiter
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "benchmarks"))
+from graph_stub import GraphStub
+
+class GraphRoteiro(GraphStub):
+    """GraphStub que responde primeiro o `roteiro` (ok | erro | limite), depois 200."""
+
+    def __init__(self, roteiro):
+        super().__init__()
+        self.roteiro = list(roteiro)
+
+    def decidir(self):
+        with self._lock:
+            if self.roteiro:
+                self.recebidas += 1
+                resultado = self.roteiro.pop(0)
+                self.erros += resultado == "erro"
+                self.limitadas += resultado == "limite"
+                return resultado, 0.0
+        return super().decidir()
+
+@pytest.fixture
+def graph(monkeypatch):
+    """sobe a Graph simulada com o roteiro pedido e aponta o whatsapp para ela."""
+    servidores = []
+
+    def subir(roteiro=()):
+        stub = GraphRoteiro(roteiro).start()
+        servidores.append(stub)
+        config = Config({"WHATSAPP_GRAPH_URL": stub.url, "WHATSAPP_TOKEN": "t", "PHONE_NUMBER_ID": "123"})
+        monkeypatch.setattr(whatsapp, "get_config", lambda: config)
+        return stub
+    monkeypatch.setattr(whatsapp, "_limiter", RateLimiter(mps=0, par_intervalo=0))
+    monkeypatch.setattr(whatsapp, "ERRO_ESPERA", 0)
+    yield subir
+    for stub in servidores:
+        stub.shutdown()
+        stub.server_close()
+
+ENVIOS = [("lembrete_24h", f"55119000000{i:02d}", ["Ana", "10/01/2030, quinta-feira", "09:00"], None)
+          for i in range(3)]
+
+def test_lote_recebe_200(graph):
+    stub = graph()
+    resultados = whatsapp.enviar_templates_lote(ENVIOS)
+
+    assert [r["ok"] for r in resultados] == [True, True, True]
+    assert [r["to"] for r in resultados] == [e[1] for e in ENVIOS]
+    assert all(r["resposta"]["messages"][0]["id"].startswith("wamid.stub.") for r in resultados)
+    assert stub.stats() == {"recebidas": 3, "aceitas": 3, "erros": 0, "limitadas": 0}
+    assert sorted(to for _, to, _ in stub.entregas) == [e[1] for e in ENVIOS]
+
+def test_lote_repete_429_e_500(graph):
+    stub = graph(["limite", "erro", "erro"])
+    resultados = whatsapp.enviar_templates_lote(ENVIOS[:2], concorrencia=1)
+
+    assert [r["ok"] for r in resultados] == [True, True]
+    assert stub.stats() == {"recebidas": 5, "aceitas": 2, "erros": 2, "limitadas": 1}
+
+def test_lote_desiste_depois_das_retentativas(graph):
+    stub = graph(["erro"] * (whatsapp.LIMITE_RETENTATIVAS + 1))
+    resultado, = whatsapp.enviar_templates_lote(ENVIOS[:1])
+
+    assert not resultado["ok"] and resultado["excecao"].status == 500
+    assert stub.stats()["recebidas"] == whatsapp.LIMITE_RETENTATIVAS + 1 and stub.aceitas == 0
+
+# -------------------- limite de taxa (RateLimiter) --------------------
+class Relogio:
+    """time.monotonic/sleep de mentira: o teste avança o tempo."""
+
+    def __init__(self):
+        self.agora = 1000.0
+
+    def monotonic(self):
+        return self.agora
+
+    def sleep(self, s):
+        self.agora += s
+
+@pytest.fixture
+def relogio(monkeypatch):
+    r = Relogio()
+    monkeypatch.setattr(whatsapp, "time", r)
+    return r
+
+LIMITE = whatsapp.WhatsAppError("HTTP 429", status=429, code=130429)
+
+def test_penalizar_corta_o_ritmo_e_dobra_a_pausa(relogio):
+    rl = RateLimiter(mps=10, par_intervalo=0)
+    rl.penalizar(LIMITE, "5511900000001")
+    assert rl.mps == 5 and rl.reservar("5511900000001") == pytest.approx(1.0)
+
+    relogio.sleep(1.5)
+    rl.penalizar(LIMITE, "5511900000001")  # ainda falhando depois da pausa: novo episódio
+    assert rl.reservar("5511900000001") == pytest.approx(2.0)
+
+    relogio.sleep(5)
+    rl.sucesso()
+    rl.penalizar(LIMITE, "5511900000001")  # depois de um sucesso o backoff recomeça
+    assert rl.reservar("5511900000001") == pytest.approx(1.0)
+
+def test_429_das_requisicoes_em_voo_e_o_mesmo_episodio(relogio):
+    rl = RateLimiter(mps=10, par_intervalo=0)
+    for _ in range(5):
+        rl.penalizar(LIMITE, "5511900000001")
+    assert rl.mps == 5
+    assert rl.reservar("5511900000002") == pytest.approx(1.0)
+
+def test_ritmo_volta_ao_maximo_em_recuperacao(relogio):
+    rl = RateLimiter(mps=10, par_intervalo=0, recuperacao=60)
+    rl.penalizar(LIMITE, "5511900000001")
+    relogio.sleep(30)
+    rl.reservar("5511900000001")
+    assert rl.mps == pytest.approx(10)
+
+def test_limite_do_par_so_atrasa_o_numero(relogio):
+    rl = RateLimiter(mps=10, par_intervalo=6)
+    assert rl.reservar("5511900000001") == 0
+    rl.penalizar(whatsapp.WhatsAppError("HTTP 400", status=400, code=131056), "5511900000001")
+
+    assert rl.mps == 10
+    assert rl.reservar("5511900000002") == 0
+    assert rl.reservar("5511900000001") == pytest.approx(18.0)  # 6 do slot reservado + 2 x 6